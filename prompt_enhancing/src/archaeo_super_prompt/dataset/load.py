@@ -1,13 +1,17 @@
 """Module gathering the loaders for a training/evaluation dataset.
 
-The data are slightly-transformed records of the Magoh database.
+The data are slightly-transformed records of the Magoh database. They are
+exported once into a Parquet snapshot (see the snapshot module), then loaded
+from it.
 """
 
-from collections.abc import Callable
+import hashlib
+import re
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
 from typing import NamedTuple
 import pandas as pd
 from pandera.typing.pandas import DataFrame, Series
-from tqdm import tqdm
 
 from ..types.intervention_id import InterventionId
 from ..types.pdfpaths import PDFPathSchema
@@ -18,16 +22,20 @@ from ..types.structured_data import (
     outputStructuredDataSchema_itertuples,
 )
 
-from .postgresql_engine import get_entries, get_entries_with_ids
-from .minio_engine import download_files
-from ..utils.cache import get_memory_for
+from .postgresql_engine import open_entries, open_entries_with_ids
+from .minio_engine import download_interventions
+from .snapshot import Snapshot, get_snapshot
 from ..utils.norm import variabilize_column_name
 
+_INTERVENTION_COLUMNS_PATTERN = re.compile(
+    "^(scheda_intervento.id|intervention_start_date_*|duration_(value|precision)|(university|building|check).*)"
+)
+
 
 def _parse_intervention_data(intervention_data__df: pd.DataFrame):
     filtered_df = (
         intervention_data__df.filter(
-            regex="^(scheda_intervento.id|intervention_start_date_*|duration_(value|precision)|(university|building|check).*)"
+            regex=_INTERVENTION_COLUMNS_PATTERN.pattern
         )
         .astype(
             {
@@ -45,39 +53,71 @@ def _parse_intervention_data(intervention_data__df: pd.DataFrame):
 
 def _parse_and_get_files(intervention_data: pd.DataFrame):
     intervention_data = _parse_intervention_data(intervention_data)
+    files_per_intervention = download_interventions(
+        intervention_data["scheda_intervento.id"]
+    )
     files = PDFPathSchema.validate(
-        pd.concat(
+        pd.DataFrame(
             [
-                pd.DataFrame(
-                    [
-                        {"id": id_, "filepath": str(path.resolve())}
-                        for path in download_files(id_)
-                    ]
-                )
-                for id_ in tqdm(
-                    intervention_data["scheda_intervento.id"],
-                    desc="Downloaded files",
-                    unit="interventions",
-                )
+                {"id": id_, "filepath": str(path.resolve())}
+                for id_, paths in files_per_intervention.items()
+                for path in paths
             ],
-            ignore_index=True,
+            columns=["id", "filepath"],
         )
     )
     return intervention_data, files
 
 
-@get_memory_for("external").cache
-def _init_with_cache(size: int, seed: float, only_recent_entries=False):
-    intervention_data, findings = get_entries(size, seed, only_recent_entries)
-    intervention_data, files = _parse_and_get_files(intervention_data)
-    return intervention_data, findings, files
+def _init_from_snapshot(snapshot: Snapshot):
+    intervention_data = snapshot.read(
+        "interventions",
+        columns=[
+            column
+            for column in snapshot.columns("interventions")
+            if _INTERVENTION_COLUMNS_PATTERN.search(column)
+        ],
+    )
+    return _parse_and_get_files(intervention_data)
+
+
+@contextmanager
+def _as_tables(
+    entries: AbstractContextManager[
+        tuple[Iterator[pd.DataFrame], Iterator[pd.DataFrame]]
+    ],
+):
+    with entries as (intervention_chunks, findings_chunks):
+        yield {
+            "interventions": intervention_chunks,
+            "findings": findings_chunks,
+        }
+
+
+def _get_sample_snapshot(
+    size: int, seed: float, only_recent_entries=False
+) -> Snapshot:
+    return get_snapshot(
+        f"sample-{size}-{seed}{'-recent' if only_recent_entries else ''}",
+        lambda: _as_tables(open_entries(size, seed, only_recent_entries)),
+        {
+            "size": size,
+            "seed": seed,
+            "only_recent_entries": only_recent_entries,
+        },
+    )
 
 
-@get_memory_for("external").cache
-def _init_with_cache_for_ids(ids: set[int]):
-    intervention_data, findings = get_entries_with_ids(ids)
-    intervention_data, files = _parse_and_get_files(intervention_data)
-    return intervention_data, findings, files
+def _get_snapshot_for_ids(ids: set[int]) -> Snapshot:
+    sorted_ids = sorted(ids)
+    digest = hashlib.sha256(
+        ",".join(map(str, sorted_ids)).encode()
+    ).hexdigest()
+    return get_snapshot(
+        f"ids-{digest[:16]}",
+        lambda: _as_tables(open_entries_with_ids(ids)),
+        {"ids": sorted_ids},
+    )
 
 
 class SamplingParams(NamedTuple):
@@ -95,8 +135,8 @@ type IdSet = set[int]
 class MagohDataset:
     """Class to interact with the general training/evaluation dataset.
 
-    At the initialisation, fetch the data from the cache or from the remote
-    dataset if needed.
+    At the initialisation, fetch the data from their snapshot or from the
+    remote dataset if needed.
     """
 
     def __init__(self, params: IdSet | SamplingParams):
@@ -108,16 +148,38 @@ of sampling params to randomly fetch intervention records
         """
         if isinstance(params, SamplingParams):
             size, seed, only_recent_entries = params
-            intervention_data, self._findings, self._files = _init_with_cache(
+            self._snapshot = _get_sample_snapshot(
                 size, seed, only_recent_entries
             )
         else:
-            intervention_data, self._findings, self._files = (
-                _init_with_cache_for_ids(params)
-            )
+            self._snapshot = _get_snapshot_for_ids(params)
+        self._findings: pd.DataFrame | None = None
+        intervention_data, self._files = _init_from_snapshot(self._snapshot)
         self._intervention_data = self._normalize_metadata_df(
             intervention_data
         )
+        self._index_records()
+
+    def _index_records(self):
+        """Build the lookup tables of the records and files by their id."""
+        self._row_positions = {
+            InterventionId(id_): position
+            for position, id_ in enumerate(
+                self._intervention_data["id"].tolist()
+            )
+        }
+        self._file_positions = {
+            InterventionId(int(id_)): positions.tolist()
+            for id_, positions in self._files.groupby("id").indices.items()
+        }
+
+    def _positions_of(self, ids: set[InterventionId]) -> list[int]:
+        """Return the sorted row positions of the known ids."""
+        return sorted(
+            self._row_positions[id_]
+            for id_ in ids
+            if id_ in self._row_positions
+        )
 
     @property
     def intervention_data(self):
@@ -153,11 +215,10 @@ of sampling params to randomly fetch intervention records
 
     def get_answer(self, id_: InterventionId) -> ExtractedStructuredDataSeries:
         """Return the metadata of a magoh record with the given id."""
-        records = self._intervention_data
-        record = records[records["id"] == id_]
-        if len(record) == 0:
+        position = self._row_positions.get(id_)
+        if position is None:
             raise Exception(f"Unable to get record with id {id_}")
-        return record.iloc[0].to_dict()
+        return self._intervention_data.iloc[position].to_dict()
 
     def filter_good_records_for_training(
         self,
@@ -173,9 +234,7 @@ of sampling params to randomly fetch intervention records
             condition: a function taking the training metadata dataframe and \
 returning a series of boolean to filter the records with unusable values 
         """
-        only_ids = self._intervention_data[
-            self._intervention_data["id"].isin(ids)
-        ]
+        only_ids = self._intervention_data.iloc[self._positions_of(ids)]
         return set(
             InterventionId(id_)
             for id_ in only_ids[condition(only_ids)]["id"].to_list()
@@ -183,22 +242,31 @@ returning a series of boolean to filter the records with unusable values
 
     def get_answers(self, ids: set[InterventionId]):
         """Return the answers for each of the asked interventions."""
-        records = self._intervention_data
-        filtered = records[records["id"].isin(ids)]
-        if len(filtered) != len(ids):
+        positions = self._positions_of(ids)
+        if len(positions) != len(ids):
             raise Exception(
                 "All the asked interventions does not have their answers stored in the dataset"
             )
-        return outputStructuredDataSchema_itertuples(filtered)
+        return outputStructuredDataSchema_itertuples(
+            self._intervention_data.iloc[positions]
+        )
 
     @property
     def findings(self):
         """Return a dataframe with the fetched findings data."""
+        if self._findings is None:
+            self._findings = self._snapshot.read("findings")
         return self._findings
 
     def get_files_for_batch(self, ids: set[InterventionId]):
         """Return the files only realted to the given intervention ids."""
-        return self._files[self._files["id"].isin(ids)]
+        return self._files.iloc[
+            sorted(
+                position
+                for id_ in ids
+                for position in self._file_positions.get(id_, ())
+            )
+        ]
 
     @property
     def files(self):
@@ -1,26 +1,90 @@
-from typing import cast
-from minio import Minio
-from pathlib import Path
+"""Download of the PDF files of the interventions from the MinIO bucket.
+
+The files of an intervention are stored in the bucket under the
+<intervention id>/ prefix. To get them for many interventions, the bucket is
+listed once, then the objects are downloaded by a pool of threads.
+
+Each object is written into a temporary file, renamed to its final name only
+once its size and its ETag have been checked, so an interrupted download never
+leaves a truncated PDF behind. The temporary file is named after the ETag of
+the object, so the download is resumed from its end by the next run as long as
+the object has not changed in the bucket.
+
+A manifest stored next to the files records the objects expected for each
+intervention, as listed in the bucket, and the objects whose the local copy
+has been verified. An intervention whose the expected objects are all
+verified is served without any request to the bucket, so an interrupted run
+only lists and downloads again what it has not completed. A refresh lists
+the bucket again and syncs only the differences: the new and the replaced
+objects are downloaded, the local copies of the deleted ones are removed.
+"""
+
+import hashlib
+import json
+import os
 import re
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+import certifi
+import urllib3
+from minio import Minio
+from tqdm import tqdm
 
+from ..config.debug_log import print_log, print_warning
+from ..config.env import getenv, getenv_or_throw
 from ..utils.cache import get_cache_dir_for
-from ..config.env import getenv_or_throw
 
 _host = getenv_or_throw("MINIO_HOST")
 _user = getenv_or_throw("MINIO_ROOT_USER")
 _password = getenv_or_throw("MINIO_ROOT_PASSWORD")
 
 __client = None
+__client_lock = threading.Lock()
 
 BUCKET_NAME = "training-reports"
+MANIFEST_FILENAME = "manifest.json"
+
+_DEFAULT_NUM_THREADS = 16
+_MAX_ATTEMPTS = 3
+_CHUNK_SIZE = 1024 * 1024
+_MANIFEST_SAVE_INTERVAL = 5.0
+_PART_SUFFIX = ".part"
+_MD5_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def get_num_download_threads() -> int:
+    """Return the number of concurrent downloads from the bucket."""
+    num_threads = getenv("MINIO_DOWNLOAD_THREADS")
+    return int(num_threads) if num_threads else _DEFAULT_NUM_THREADS
 
 
 def _init_client():
+    timeout = timedelta(minutes=5).seconds
     c = Minio(
         _host,
         access_key=_user,
         secret_key=_password,
         secure=not _host.startswith("localhost"),
+        # as the default client of minio, but with a connection for each
+        # download thread
+        http_client=urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            maxsize=max(10, get_num_download_threads()),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(
+                total=5,
+                backoff_factor=0.2,
+                status_forcelist=[500, 502, 503, 504],
+            ),
+        ),
     )
 
     if not c.bucket_exists(BUCKET_NAME):
@@ -28,6 +92,14 @@ def _init_client():
     return c
 
 
+def _get_client() -> Minio:
+    global __client
+    with __client_lock:
+        if __client is None:
+            __client = _init_client()
+        return __client
+
+
 # Allow only letters, digits, underscores, hyphens, and dots
 SAFE_FILENAME_PATTERN = re.compile(r"[^a-zA-Z0-9_.-]+")  # MATCHES UNSAFE chars
 
@@ -38,41 +110,375 @@ def sanitize_filename(filename):
     )  # Replace unsafe chars with underscore
 
 
-def download_files(intervention_id: int) -> list[Path]:
-    global __client
+class RemoteObject(NamedTuple):
+    """A PDF file stored in the bucket.
 
-    pdf_store_dir = get_cache_dir_for("external", "pdfs")
-    if not pdf_store_dir.exists():
-        pdf_store_dir.mkdir(parents=True, exist_ok=True)
+    Arguments:
+        name: the object name, as <intervention id>/<filename>
+        size: the size of the object in bytes
+        etag: the entity tag of the object, which is the md5 digest of its \
+content if it has not been uploaded in several parts
+    """
 
-    dirpath = Path("./" + str(intervention_id))
+    name: str
+    size: int
+    etag: str
 
-    output_pathdir = pdf_store_dir / dirpath
-    if output_pathdir.exists():
-        files = [f for f in output_pathdir.iterdir()]
-        if files:
-            return files
 
-    if __client is None:
-        __client = _init_client()
-    files = __client.list_objects(
-        BUCKET_NAME, prefix=str(dirpath), recursive=True
-    )
+class DownloadStats(NamedTuple):
+    """Counters of a bulk download.
+
+    Arguments:
+        downloaded: the number of objects downloaded from their start
+        resumed: the number of objects downloaded from a previous partial \
+transfer
+        skipped: the number of objects already verified on the disk
+        transferred_bytes: the number of bytes received from the bucket
+    """
+
+    downloaded: int
+    resumed: int
+    skipped: int
+    transferred_bytes: int
+
+
+def _pdf_store_dir() -> Path:
+    return get_cache_dir_for("external", "pdfs")
+
+
+def _intervention_id_of(object_name: str) -> int | None:
+    subdir, separator, filename = object_name.partition("/")
+    if not separator or not filename or not subdir.isdigit():
+        return None
+    return int(subdir)
+
+
+def _local_path(store_dir: Path, object_name: str) -> Path:
+    subdir, _, filename = object_name.partition("/")
+    return store_dir / subdir / sanitize_filename(filename)
 
-    def download_and_return():
-        for file in files:
-            object_name = file.object_name
-            if object_name is None:
-                continue
-            it_id_subdir, filename = object_name.split("/")
-            output_path = (pdf_store_dir / it_id_subdir) / sanitize_filename(
-                filename
+
+def _part_path(path: Path, obj: RemoteObject) -> Path:
+    # the partial transfer of another version of the object is not resumed
+    return path.with_name(f"{path.name}.{obj.etag}{_PART_SUFFIX}")
+
+
+def list_bucket_objects(
+    client: Minio, prefix: str | None = None
+) -> dict[int, list[RemoteObject]]:
+    """List the PDF files of the bucket, grouped by intervention.
+
+    Arguments:
+        client: the MinIO client
+        prefix: list only the objects whose the name starts with this \
+prefix, all the bucket by default
+    """
+    objects: dict[int, list[RemoteObject]] = defaultdict(list)
+    for obj in client.list_objects(BUCKET_NAME, prefix=prefix, recursive=True):
+        if obj.object_name is None:
+            continue
+        intervention_id = _intervention_id_of(obj.object_name)
+        if intervention_id is None:
+            continue
+        objects[intervention_id].append(
+            RemoteObject(
+                obj.object_name, obj.size or 0, (obj.etag or "").strip('"')
             )
-            _ = (
-                cast(Minio, __client).fget_object(
-                    BUCKET_NAME, object_name, str(output_path)
-                ),
+        )
+    return dict(objects)
+
+
+def _to_entry(obj: RemoteObject):
+    return {"size": obj.size, "etag": obj.etag}
+
+
+class _SyncManifest:
+    """Expected objects of the interventions and verified local copies."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._verified: dict[str, dict[str, int | str]] = {}
+        self._expected: dict[str, list[RemoteObject]] = {}
+        if path.exists():
+            try:
+                content = json.loads(path.read_text())
+            except ValueError:
+                print_warning(f"Ignoring the corrupted manifest {path}")
+                return
+            # the first manifests only recorded the verified objects
+            self._verified = content.get("verified", content)
+            self._expected = {
+                intervention_id: [RemoteObject(*obj) for obj in objects]
+                for intervention_id, objects in content.get(
+                    "interventions", {}
+                ).items()
+            }
+
+    def expected_objects(self, intervention_id: int):
+        """Return the objects listed for the intervention, None if unknown."""
+        with self._lock:
+            return self._expected.get(str(intervention_id))
+
+    def set_expected_objects(
+        self, intervention_id: int, objects: list[RemoteObject]
+    ) -> list[RemoteObject]:
+        """Record the listed objects and return those no longer expected."""
+        names = {obj.name for obj in objects}
+        with self._lock:
+            removed = [
+                obj
+                for obj in self._expected.get(str(intervention_id), [])
+                if obj.name not in names
+            ]
+            for obj in removed:
+                self._verified.pop(obj.name, None)
+            self._expected[str(intervention_id)] = objects
+        return removed
+
+    def is_verified(self, obj: RemoteObject, path: Path) -> bool:
+        with self._lock:
+            entry = self._verified.get(obj.name)
+        return (
+            entry == _to_entry(obj)
+            and path.is_file()
+            and path.stat().st_size == obj.size
+        )
+
+    def is_complete(self, intervention_id: int, store_dir: Path) -> bool:
+        """Return True if all the expected objects have a verified copy."""
+        objects = self.expected_objects(intervention_id)
+        return objects is not None and all(
+            self.is_verified(obj, _local_path(store_dir, obj.name))
+            for obj in objects
+        )
+
+    def record(self, obj: RemoteObject):
+        with self._lock:
+            self._verified[obj.name] = _to_entry(obj)
+            if time.monotonic() - self._last_save > _MANIFEST_SAVE_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = self._path.with_name(self._path.name + _PART_SUFFIX)
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "interventions": {
+                        intervention_id: [list(obj) for obj in objects]
+                        for intervention_id, objects in self._expected.items()
+                    },
+                    "verified": self._verified,
+                }
             )
-            yield output_path
+        )
+        os.replace(tmp_path, self._path)
+        self._last_save = time.monotonic()
+
+
+def _verify(part_path: Path, obj: RemoteObject):
+    """Raise an exception if the downloaded file is not the object."""
+    size = part_path.stat().st_size
+    if size != obj.size:
+        raise Exception(
+            f"{obj.name}: {size} bytes downloaded, {obj.size} expected"
+        )
+    # the ETag of an object uploaded in several parts is not its md5 digest
+    if _MD5_PATTERN.fullmatch(obj.etag) is None:
+        return
+    digest = hashlib.md5(usedforsecurity=False)
+    with part_path.open("rb") as f:
+        while data := f.read(_CHUNK_SIZE):
+            digest.update(data)
+    if digest.hexdigest() != obj.etag:
+        raise Exception(f"{obj.name}: the md5 digest does not match its ETag")
+
+
+def _download_object(client: Minio, obj: RemoteObject, path: Path) -> int:
+    """Download the object into the path, resuming a partial transfer.
+
+    Return the number of transferred bytes.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = _part_path(path, obj)
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if offset > obj.size:
+        offset = 0
+        part_path.unlink()
+    if offset < obj.size:
+        response = client.get_object(
+            BUCKET_NAME,
+            obj.name,
+            offset=offset,
+            # fail if the object has been replaced since the listing
+            request_headers={"If-Match": f'"{obj.etag}"'}
+            if obj.etag
+            else None,
+        )
+        try:
+            with part_path.open("ab") as f:
+                for data in response.stream(_CHUNK_SIZE):
+                    f.write(data)
+        finally:
+            response.close()
+            response.release_conn()
+    else:
+        part_path.touch()
+    try:
+        _verify(part_path, obj)
+    except Exception:
+        part_path.unlink()
+        raise
+    os.replace(part_path, path)
+    return obj.size - offset
+
+
+def _sync_object(
+    client: Minio,
+    manifest: _SyncManifest,
+    store_dir: Path,
+    obj: RemoteObject,
+) -> DownloadStats:
+    """Download the object if its local copy is not verified yet."""
+    path = _local_path(store_dir, obj.name)
+    if manifest.is_verified(obj, path):
+        return DownloadStats(0, 0, 1, 0)
+    if path.is_file() and path.stat().st_size == obj.size:
+        # e.g. downloaded before the object was recorded in the manifest
+        try:
+            _verify(path, obj)
+            manifest.record(obj)
+            return DownloadStats(0, 0, 1, 0)
+        except Exception:
+            pass
+    attempt = 1
+    while True:
+        resumed = _part_path(path, obj).exists()
+        try:
+            transferred_bytes = _download_object(client, obj, path)
+            break
+        except Exception as e:
+            if attempt == _MAX_ATTEMPTS:
+                raise
+            print_warning(
+                f"Download of {obj.name} failed (attempt {attempt}): {e}"
+            )
+            attempt += 1
+    manifest.record(obj)
+    return DownloadStats(int(not resumed), int(resumed), 0, transferred_bytes)
+
+
+def download_interventions(
+    intervention_ids: Iterable[int],
+    num_threads: int | None = None,
+    client: Minio | None = None,
+    store_dir: Path | None = None,
+    refresh: bool = False,
+) -> dict[int, list[Path]]:
+    """Download the PDF files of many interventions at once.
+
+    Only the interventions not completely synced yet are listed in the bucket.
+
+    Arguments:
+        intervention_ids: the interventions whose the files are needed
+        num_threads: the number of concurrent downloads, given by the \
+MINIO_DOWNLOAD_THREADS environment variable by default
+        client: the MinIO client, the one of the module by default
+        store_dir: the local directory of the files, data/external/pdfs by \
+default
+        refresh: if True, sync all the given interventions with the current \
+content of the bucket
+
+    Return:
+        the local paths of the files of each intervention, in the order of \
+the given identifiers
+    """
+    store_dir = store_dir or _pdf_store_dir()
+    intervention_ids = list(dict.fromkeys(intervention_ids))
+    manifest = _SyncManifest(store_dir / MANIFEST_FILENAME)
+    ids_to_sync = (
+        intervention_ids
+        if refresh
+        else [
+            intervention_id
+            for intervention_id in intervention_ids
+            if not manifest.is_complete(intervention_id, store_dir)
+        ]
+    )
+    if ids_to_sync:
+        _sync_interventions(
+            client or _get_client(),
+            manifest,
+            store_dir,
+            ids_to_sync,
+            num_threads or get_num_download_threads(),
+        )
+    return {
+        intervention_id: [
+            _local_path(store_dir, obj.name)
+            for obj in manifest.expected_objects(intervention_id) or []
+        ]
+        for intervention_id in intervention_ids
+    }
+
+
+def _sync_interventions(
+    client: Minio,
+    manifest: _SyncManifest,
+    store_dir: Path,
+    intervention_ids: list[int],
+    num_threads: int,
+):
+    """List the interventions in the bucket and sync their local files."""
+    remote_objects = list_bucket_objects(
+        client,
+        f"{intervention_ids[0]}/" if len(intervention_ids) == 1 else None,
+    )
+    objects: list[RemoteObject] = []
+    removed_number = 0
+    for intervention_id in intervention_ids:
+        expected = remote_objects.get(intervention_id, [])
+        for obj in manifest.set_expected_objects(intervention_id, expected):
+            _local_path(store_dir, obj.name).unlink(missing_ok=True)
+            removed_number += 1
+        objects.extend(expected)
+
+    def sync(obj: RemoteObject):
+        return _sync_object(client, manifest, store_dir, obj)
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=num_threads, thread_name_prefix="minio-download"
+        ) as executor:
+            object_stats = list(
+                tqdm(
+                    executor.map(sync, objects),
+                    desc="Downloaded files",
+                    total=len(objects),
+                    unit="files",
+                )
+            )
+    finally:
+        manifest.save()
+    stats = DownloadStats(
+        *map(sum, zip(DownloadStats(0, 0, 0, 0), *object_stats))
+    )
+    print_log(
+        f"{len(objects)} files of {len(intervention_ids)} interventions "
+        f"synced: {stats.downloaded} downloaded, {stats.resumed} resumed, "
+        f"{stats.skipped} already there, {removed_number} removed, "
+        f"{stats.transferred_bytes / 1e6:.1f} MB transferred"
+    )
+
+
+def download_files(intervention_id: int) -> list[Path]:
+    """Return the local paths of the files of an intervention.
 
-    return [p for p in download_and_return()]
+    Download the files if they are not on the disk yet.
+    """
+    return download_interventions([intervention_id])[intervention_id]
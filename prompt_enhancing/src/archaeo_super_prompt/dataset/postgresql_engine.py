@@ -2,13 +2,27 @@
 
 This module manages the interaction with the postgresql database to load a
 pandas DataFrame. The sqlalchemy library with the psycopg2 engine are used.
+
+The results can also be streamed in chunks of rows through a server-side
+cursor, so a large result set is never loaded at once in the memory.
+
+The identifiers of the sampled or of the requested interventions are stored
+once in a temporary table of the session, then the intervention records and
+their findings are fetched with joins on this table. So the random sampling
+is run once, and the requested identifiers are sent in batches of bounded
+size instead of in a single "in" clause.
 """
 
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
 import pandas as pd
 from pathlib import Path
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Connection, Engine, create_engine
 
-from ..config.env import getenv_or_throw
+from ..config.env import getenv, getenv_or_throw
+
+STREAM_CHUNK_SIZE = 10_000
+ID_BATCH_SIZE = 10_000
 
 
 def _create_engine_from_credentials():
@@ -22,7 +36,11 @@ def _create_engine_from_credentials():
     db_port = getenv_or_throw("PG_DB_PORT")
 
     return create_engine(
-        f"{DIALECT}+{DRIVER}://{writing_db_user}:{db_user_password}@{db_host}:{db_port}/{db_name}"
+        f"{DIALECT}+{DRIVER}://{writing_db_user}:{db_user_password}@{db_host}:{db_port}/{db_name}",
+        pool_size=int(getenv("PG_POOL_SIZE", "5")),
+        max_overflow=int(getenv("PG_POOL_MAX_OVERFLOW", "10")),
+        pool_recycle=int(getenv("PG_POOL_RECYCLE", "-1")),
+        pool_pre_ping=True,
     )
 
 
@@ -48,56 +66,148 @@ __sampling_request = _import_sql(__module_dir / Path("sql/sampling.sql"))
 __sampling_on_recents_request = _import_sql(
     __module_dir / Path("sql/sampling_on_recents.sql")
 )
-__get_sample_findings_request = _import_sql(
-    __module_dir / Path("sql/sample_findings.sql")
+__create_selection_request = _import_sql(
+    __module_dir / Path("sql/create_selection.sql")
+)
+__select_sample_ids_request = _import_sql(
+    __module_dir / Path("sql/select_sample_ids.sql")
 )
-__get_intervention_with_ids = _import_sql(
-    __module_dir / Path("sql/select_ids.sql")
+__insert_ids_request = _import_sql(__module_dir / Path("sql/insert_ids.sql"))
+__analyze_selection_request = _import_sql(
+    __module_dir / Path("sql/analyze_selection.sql")
 )
-__get_findings_with_ids = _import_sql(
-    __module_dir / Path("./sql/select_findings_ids.sql")
+__get_selected_interventions = _import_sql(
+    __module_dir / Path("sql/select_selected_interventions.sql")
+)
+__get_selected_findings = _import_sql(
+    __module_dir / Path("sql/select_selected_findings.sql")
 )
 
 
-def get_entries(max_number: int, seed: float, only_recent_entries=False):
-    """Fetch from the remote database a set of samples of interventions."""
-    engine = _get_engine()
-    findings_request = __get_sample_findings_request.replace(
+def _stream_request(
+    connection: Connection,
+    request: str,
+    params: dict | None,
+    chunk_size: int,
+) -> Iterator[pd.DataFrame]:
+    """Fetch the result of the request in chunks with a server-side cursor."""
+    yield from pd.read_sql(
+        request,
+        connection.execution_options(
+            stream_results=True, max_row_buffer=chunk_size
+        ),
+        params=params,
+        chunksize=chunk_size,
+    )
+
+
+@contextmanager
+def _open_selection(
+    select_ids: Callable[[Connection], None],
+    chunk_size: int,
+):
+    """Store the selected ids in a temporary table and stream their data.
+
+    Arguments:
+        select_ids: a function filling the selected_ids table through the \
+connection
+        chunk_size: the maximal number of rows of each chunk
+
+    Return:
+        a context manager giving the lazy iterators over the chunks of the \
+selected intervention records and over the chunks of their findings, to be \
+consumed in this order and inside the context
+    """
+    with _get_engine().connect() as connection:
+        # dropped at the end of the transaction, which is never committed
+        connection.exec_driver_sql(__create_selection_request)
+        select_ids(connection)
+        connection.exec_driver_sql(__analyze_selection_request)
+        yield (
+            _stream_request(
+                connection, __get_selected_interventions, None, chunk_size
+            ),
+            _stream_request(
+                connection, __get_selected_findings, None, chunk_size
+            ),
+        )
+
+
+def open_entries(
+    max_number: int,
+    seed: float,
+    only_recent_entries=False,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+):
+    """Stream from the remote database a set of samples of interventions.
+
+    Return:
+        a context manager giving the lazy iterators over the chunks of the \
+sampled intervention records and over the chunks of their findings, to be \
+consumed in this order
+    """
+    select_sample_ids_request = __select_sample_ids_request.replace(
         "-- sampling-placeholder",
         __sampling_request
         if not only_recent_entries
         else __sampling_on_recents_request,
     )
-    deterministic_params = {"seed": seed, "max_number": max_number}
-    print("Fetching structured intervention data...")
-    intervention_data = pd.read_sql(
-        __seed_setting_request + "\n" + __sampling_request,
-        engine,
-        params=deterministic_params,
-    )
-    print("Fetching done!")
-    print("Fetching saved findings for each intervention...")
-    findings = pd.read_sql(
-        __seed_setting_request + "\n" + findings_request,
-        engine,
-        params=deterministic_params,
-    )
-    print("Fetching done!")
+
+    def select_ids(connection: Connection):
+        deterministic_params = {"seed": seed, "max_number": max_number}
+        connection.exec_driver_sql(
+            __seed_setting_request, deterministic_params
+        )
+        connection.exec_driver_sql(
+            select_sample_ids_request, deterministic_params
+        )
+
+    return _open_selection(select_ids, chunk_size)
+
+
+def open_entries_with_ids(ids: set[int], chunk_size: int = STREAM_CHUNK_SIZE):
+    """Stream from the db the metadata of the interventions with the ids.
+
+    Return:
+        a context manager giving the lazy iterators over the chunks of the \
+intervention records and over the chunks of their findings, to be consumed \
+in this order
+    """
+    sorted_ids = sorted(ids)
+
+    def select_ids(connection: Connection):
+        for start in range(0, len(sorted_ids), ID_BATCH_SIZE):
+            connection.exec_driver_sql(
+                __insert_ids_request,
+                {
+                    "intervention_ids": sorted_ids[
+                        start : start + ID_BATCH_SIZE
+                    ]
+                },
+            )
+
+    return _open_selection(select_ids, chunk_size)
+
+
+def get_entries(max_number: int, seed: float, only_recent_entries=False):
+    """Fetch from the remote database a set of samples of interventions."""
+    with open_entries(max_number, seed, only_recent_entries) as (
+        intervention_chunks,
+        findings_chunks,
+    ):
+        print("Fetching structured intervention data...")
+        intervention_data = pd.concat(intervention_chunks, ignore_index=True)
+        print("Fetching done!")
+        print("Fetching saved findings for each intervention...")
+        findings = pd.concat(findings_chunks, ignore_index=True)
+        print("Fetching done!")
     return intervention_data, findings
 
 
 def get_entries_with_ids(ids: set[int]):
     """Fetch on the db the metadata of the intervention with the given ids."""
-    engine = _get_engine()
-    id_set_for_request = tuple(ids)
-    interventions = pd.read_sql(
-        __get_intervention_with_ids,
-        engine,
-        params={"intervention_ids": id_set_for_request},
-    )
-    findings = pd.read_sql(
-        __get_findings_with_ids,
-        engine,
-        params={"intervention_ids": id_set_for_request}
-    )
-    return interventions, findings
+    with open_entries_with_ids(ids) as (intervention_chunks, findings_chunks):
+        return (
+            pd.concat(intervention_chunks, ignore_index=True),
+            pd.concat(findings_chunks, ignore_index=True),
+        )
@@ -0,0 +1,152 @@
+"""Columnar snapshots of the records fetched from the Magoh database.
+
+The result of a request to the database (the intervention records and their
+findings) is streamed chunk by chunk into Parquet files, so an export never
+holds the whole result in the memory. The files are written in a temporary
+directory, renamed once all the tables are exported, so an interrupted export
+is never read as a snapshot.
+
+The snapshots are stored in data/external/snapshots, under a directory
+specific to the version of the snapshot format. They are read back with only
+the needed columns.
+"""
+
+import json
+import shutil
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager
+from datetime import datetime
+from pathlib import Path
+from typing import Literal
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config.debug_log import print_log
+from ..utils.cache import get_cache_dir_for
+
+# to be incremented when the exported data change, so the previous
+# snapshots are not read anymore
+SNAPSHOT_VERSION = 1
+
+SnapshotTable = Literal["interventions", "findings"]
+
+_METADATA_FILENAME = "metadata.json"
+
+
+def _part_paths(table_dir: Path) -> list[Path]:
+    return sorted(table_dir.glob("part-*.parquet"))
+
+
+class Snapshot:
+    """Read-only access to an exported snapshot."""
+
+    def __init__(self, path: Path):
+        """Open the snapshot stored in the given directory."""
+        self.path = path
+
+    @property
+    def metadata(self) -> dict:
+        """The description of the export (date, request, row numbers)."""
+        return json.loads((self.path / _METADATA_FILENAME).read_text())
+
+    def columns(self, table: SnapshotTable) -> list[str]:
+        """Return the names of the columns of the table."""
+        return pq.read_schema(_part_paths(self.path / table)[0]).names
+
+    def read(
+        self, table: SnapshotTable, columns: list[str] | None = None
+    ) -> pd.DataFrame:
+        """Load the table in a DataFrame.
+
+        Arguments:
+            table: the name of the table
+            columns: the columns to be loaded, all of them by default
+        """
+        tables = [
+            pq.read_table(part_path, columns=columns)
+            for part_path in _part_paths(self.path / table)
+        ]
+        # a column without any value in a chunk has no type in its part
+        return pa.concat_tables(
+            tables, promote_options="permissive"
+        ).to_pandas()
+
+
+def _export_table(chunks: Iterator[pd.DataFrame], table_dir: Path) -> int:
+    table_dir.mkdir(parents=True)
+    row_number = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_parquet(table_dir / f"part-{i:05d}.parquet", index=False)
+        row_number += len(chunk)
+    return row_number
+
+
+def export_snapshot(
+    path: Path,
+    tables: dict[SnapshotTable, Iterator[pd.DataFrame]],
+    description: dict | None = None,
+) -> Snapshot:
+    """Write the chunks of each table into a new snapshot.
+
+    Arguments:
+        path: the directory of the snapshot, which must not exist
+        tables: the lazy iterator over the chunks of each table, each \
+iterator yielding at least one chunk, even empty, with all the columns
+        description: information about the request saved with the snapshot
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    row_numbers = {
+        table: _export_table(chunks, tmp_path / table)
+        for table, chunks in tables.items()
+    }
+    (tmp_path / _METADATA_FILENAME).write_text(
+        json.dumps(
+            {
+                "version": SNAPSHOT_VERSION,
+                "created_at": datetime.now().isoformat(),
+                "request": description or {},
+                "row_numbers": row_numbers,
+            }
+        )
+    )
+    tmp_path.rename(path)
+    return Snapshot(path)
+
+
+def get_snapshot(
+    name: str,
+    open_tables: Callable[
+        [], AbstractContextManager[dict[SnapshotTable, Iterator[pd.DataFrame]]]
+    ],
+    description: dict | None = None,
+) -> Snapshot:
+    """Return the snapshot with the given name, exported if it is missing.
+
+    Arguments:
+        name: the identifier of the snapshot, specific to the request
+        open_tables: a function returning a context manager which gives \
+the chunks of the tables to be exported
+        description: information about the request saved with the snapshot
+    """
+    path = get_cache_dir_for("external", "snapshots") / (
+        f"v{SNAPSHOT_VERSION}"
+    )
+    path.mkdir(exist_ok=True)
+    path = path / name
+    if path.exists():
+        return Snapshot(path)
+    print_log(f"Exporting the snapshot {name} from the database...")
+    with open_tables() as tables:
+        snapshot = export_snapshot(path, tables, description)
+    print_log(
+        f"Snapshot {name} exported: "
+        + ", ".join(
+            f"{row_number} {table}"
+            for table, row_number in snapshot.metadata["row_numbers"].items()
+        )
+    )
+    return snapshot
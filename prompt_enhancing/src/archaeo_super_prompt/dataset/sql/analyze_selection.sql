@@ -0,0 +1 @@
+analyze selected_ids;
@@ -0,0 +1,4 @@
+create temporary table selected_ids (
+    position serial,
+    id bigint primary key
+) on commit drop;
@@ -0,0 +1,3 @@
+insert into selected_ids (id)
+select unnest(%(intervention_ids)s::bigint[])
+on conflict do nothing;
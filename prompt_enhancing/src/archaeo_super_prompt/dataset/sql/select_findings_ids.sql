@@ -1,5 +0,0 @@
-select
-    *
-from
-    findings
-    WHERE "scheda_intervento.id" in %(intervention_ids)s;
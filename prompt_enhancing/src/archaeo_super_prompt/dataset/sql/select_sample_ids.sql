@@ -0,0 +1,4 @@
+insert into selected_ids (id)
+select samples."scheda_intervento.id" from (
+-- sampling-placeholder
+) as samples;
@@ -0,0 +1,6 @@
+select
+    findings.*
+from
+    findings
+    inner join selected_ids
+    on findings."scheda_intervento.id" = selected_ids.id;
@@ -0,0 +1,7 @@
+select
+    interventions.*
+from
+    featured__intervention_data as interventions
+    inner join selected_ids
+    on interventions."scheda_intervento.id" = selected_ids.id
+order by selected_ids.position;
@@ -1,7 +1,7 @@
 """Code for loading thesaurus sets from data files."""
 
-from .comune_province import load_comune, load_comune_with_provincie, ComuneProvincia, Provincia
+from .comune_province import load_comune, load_comune_with_provincie, ComuneProvincia, Provincia, ComuneProvinciaLookup, get_comune_provincia_lookup
 
 __all__ = ["load_comune", "load_comune_with_provincie", "ComuneProvincia",
-           "Provincia"]
-
+           "Provincia", "ComuneProvinciaLookup",
+           "get_comune_provincia_lookup"]
@@ -1,6 +1,8 @@
 """Loading of thesauri related to the comune and the province."""
 
+from functools import cache
 from typing import NamedTuple
+import numpy as np
 import pandas as pd
 from pandera.pandas import DataFrameModel
 from pandera.typing.pandas import DataFrame, Index, Series
@@ -81,3 +83,79 @@ def load_comune_with_provincie() -> tuple[
         .rename(columns={"id_prov": "province_id", "nome": "name"})
         .set_index("province_id")
     )
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a comune or province name for an exact lookup."""
+    return " ".join(name.casefold().split())
+
+
+class ComuneProvinciaLookup:
+    """Array-backed lookup over the comune and province thesauri.
+
+    The data of a comune are stored in arrays, at a position given by a dense
+    array indexed by the comune identifier, so the candidates of an
+    intervention are fetched without any DataFrame operation. The reverse
+    lookup, from a (comune, provincia) pair of names to their identifiers, is a
+    dict over the normalized names.
+    """
+
+    def __init__(
+        self,
+        comuni: DataFrame[ComuneData],
+        province: DataFrame[ProvinciaData],
+    ):
+        """Build the arrays from the thesaurus dataframes."""
+        merged = comuni.join(
+            province, on="province_id", how="inner", rsuffix="_province"
+        )
+        comune_ids = merged.index.to_numpy(dtype=np.int64)
+        self._positions = np.full(
+            (comune_ids.max() + 1) if len(comune_ids) else 0, -1, np.int64
+        )
+        self._positions[comune_ids] = np.arange(len(comune_ids))
+        self._comune_names = merged["name"].to_numpy()
+        self._province_names = merged["name_province"].to_numpy()
+        self._sigle = merged["sigla"].to_numpy()
+        self._ids_by_names: dict[tuple[str, str], tuple[int, int]] = {}
+        for comune_id, comune, provincia_id, provincia in zip(
+            comune_ids,
+            self._comune_names,
+            merged["province_id"].to_numpy(),
+            self._province_names,
+        ):
+            self._ids_by_names.setdefault(
+                (normalize_name(comune), normalize_name(provincia)),
+                (int(comune_id), int(provincia_id)),
+            )
+
+    def candidates(self, comune_ids: list[int]) -> list[tuple[str, str, str]]:
+        """Return the (comune name, province name, sigla) of the given comuni.
+
+        The identifiers unknown in the thesauri are ignored.
+        """
+        ids = np.asarray(comune_ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < len(self._positions))]
+        positions = self._positions[ids]
+        positions = positions[positions >= 0]
+        return list(
+            zip(
+                self._comune_names[positions].tolist(),
+                self._province_names[positions].tolist(),
+                self._sigle[positions].tolist(),
+            )
+        )
+
+    def find_ids(
+        self, comune_name: str, provincia_name: str
+    ) -> tuple[int, int] | None:
+        """Return the (comune id, province id) of the named comune, if any."""
+        return self._ids_by_names.get(
+            (normalize_name(comune_name), normalize_name(provincia_name))
+        )
+
+
+@cache
+def get_comune_provincia_lookup() -> ComuneProvinciaLookup:
+    """Return the lookup over the thesauri, built once per process."""
+    return ComuneProvinciaLookup(*load_comune_with_provincie())
@@ -1,28 +1,30 @@
 """Utils to select boundaries page of interest in documents."""
 
 import math
-import functools as fnt
 from typing import cast
 
 from ..types.pdfchunks import PDFChunkPerInterventionDataset
 
+MAX_SELECTABLE_PAGE_NUMBER = 3
+
+
+def max_selected_page_number(total_page_number: int) -> int:
+    """Return the number of first or last pages selected in a document."""
+    return min(
+        MAX_SELECTABLE_PAGE_NUMBER, math.ceil(0.1 * total_page_number)
+    )
+
 
 def _get_reasonable_page_number(chunkDataset: PDFChunkPerInterventionDataset):
-    MAX_SELECTABLE_PAGE_NUMBER = 3
     total_page_number = max(
-        fnt.reduce(
-            lambda flat, lst: [*flat, *lst],
-            cast(
-                list[list[int]],
-                chunkDataset.data["chunk_page_position"].to_list(),
-            ),
-            cast(list[int], []),
+        page
+        for pages in cast(
+            list[list[int]],
+            chunkDataset.data["chunk_page_position"].to_list(),
         )
+        for page in pages
     )
-    max_selected_page_number = min(
-        MAX_SELECTABLE_PAGE_NUMBER, math.ceil(0.1 * total_page_number)
-    )
-    return max_selected_page_number, total_page_number
+    return max_selected_page_number(total_page_number), total_page_number
 
 
 def select_incipit(chunkDataset: PDFChunkPerInterventionDataset):
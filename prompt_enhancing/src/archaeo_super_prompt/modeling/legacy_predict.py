@@ -7,7 +7,7 @@ import sklearn
 from .entity_extractor.types import (
     ChunksWithThesaurus,
 )
-from .struct_extract.language_model import get_vllm_model
+from .struct_extract.language_model import get_language_model
 
 from ..types.pdfchunks import PDFChunkDatasetSchema
 
@@ -18,7 +18,7 @@ from .struct_extract.legacy_extractor.main_transformer import MagohDataExtractor
 
 def get_legacy_model():
     """Return the legacy model but with the vllm as pre-processing layer."""
-    llm_model = get_vllm_model(temperature=0.05)
+    llm_model = get_language_model("vllm", "google/gemma-3-27b-it", 0.05)
     with sklearn.config_context(transform_output="pandas"):
         return Pipeline(
             [
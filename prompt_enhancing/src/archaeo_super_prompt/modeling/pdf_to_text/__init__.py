@@ -47,6 +47,9 @@ class VLLM_Preprocessing(BaseTransformer):
         Environment variable:
             The VLM_HOST_URL env var must be set like this :
             http://localhost:8005 
+            To spread the pages over several servers of the same vlm, set
+            instead the VLM_HOST_URLS env var to their comma-separated urls
+            (OLLAMA_SERVER_BASE_URLS with ollama).
         """
         # store the parameters for logging
         self.vlm_provider = vlm_provider
@@ -66,29 +69,41 @@ class VLLM_Preprocessing(BaseTransformer):
         # instantiate the converter at runtime so the environment variable of
         # the endpoint of the vlm is not cached if the instance of the
         # Transformer is cached by joblib, as in standard sklearn workflows
-        converter = vllm_scan_mod.converter(
-                    vllm_scan_mod.vllm_vlm_options(
-                        self.vlm_model_id, self.prompt, allowed_timeout=self.allowed_timeout
-                    )
-                    if self.vlm_provider != "ollama"
-                    else vllm_scan_mod.ollama_vlm_options(
-                        self.vlm_model_id, self.prompt, allowed_timeout=self.allowed_timeout
-                    )
-                )
-        conversion_results = vllm_scan_mod.process_documents(
-            [(line["id"], Path(line["filepath"])) for _, line in X.iterrows()],
-            converter,
-            self.incipit_only,
+        vlm_options = (
+            vllm_scan_mod.vllm_vlm_options
+            if self.vlm_provider != "ollama"
+            else vllm_scan_mod.ollama_vlm_options
         )
-        chunked_results = iter(
-            tqdm(
-                (
-                    (f, vllm_doc_chunk_mod.get_chunks(self._chunker, r))
-                    for f, r in conversion_results
-                ),
-                desc="Chunking read text",
-                unit="chunked files",
-                total=len(X),
+        with vllm_scan_mod.converter_pool(
+            vllm_scan_mod.get_vlm_host_urls()
+            if self.vlm_provider != "ollama"
+            else vllm_scan_mod.get_ollama_server_base_urls(),
+            lambda base_url: vlm_options(
+                self.vlm_model_id,
+                self.prompt,
+                allowed_timeout=self.allowed_timeout,
+                base_url=base_url,
+            ),
+        ) as converters:
+            conversion_results = vllm_scan_mod.process_documents(
+                [
+                    (line["id"], Path(line["filepath"]))
+                    for _, line in X.iterrows()
+                ],
+                converters,
+                self.incipit_only,
+            )
+            chunked_results = iter(
+                tqdm(
+                    (
+                        (f, vllm_doc_chunk_mod.get_chunks(self._chunker, r))
+                        for f, r in conversion_results
+                    ),
+                    desc="Chunking read text",
+                    unit="chunked files",
+                    total=len(X),
+                )
+            )
+            return vllm_doc_chunk_mod.chunk_to_ds(
+                chunked_results, self._chunker
             )
-        )
-        return vllm_doc_chunk_mod.chunk_to_ds(chunked_results, self._chunker)
@@ -5,7 +5,7 @@ from typing import (
     cast,
     Literal,
 )
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 from pydantic import AnyUrl
 import pymupdf
 from tqdm import tqdm
@@ -22,15 +22,16 @@ from docling.datamodel.pipeline_options_vlm_model import (
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.pipeline.vlm_pipeline import VlmPipeline
 
-from .types import has_document_been_well_scanned, CorrectlyConvertedDocument
+from .types import CorrectlyConvertedDocument
 from ...types.intervention_id import InterventionId
 from .document_division import get_page_ranges
 
 from ...config.debug_log import print_log
-from ...config.env import getenv_or_throw
+from ...config.env import getenv, getenv_or_throw
 from ...utils import cache
 
 from . import cache_docling_documents as cache_dd
+from .vlm_pool import VlmConverterPool, pool_from_endpoints
 
 
 _PARALLEL_PAGE_NB = 2
@@ -45,6 +46,31 @@ def _document_page_number(file: Path) -> int:
     return page_count
 
 
+def _get_base_urls(list_var_name: str, var_name: str) -> list[str]:
+    urls = getenv(list_var_name)
+    if urls:
+        return [url.strip() for url in urls.split(",") if url.strip()]
+    return [getenv_or_throw(var_name)]
+
+
+def get_vlm_host_urls() -> list[str]:
+    """Return the base urls of the vllm servers serving the vision-llm.
+
+    They are read from the comma-separated VLM_HOST_URLS env var, else from
+    the VLM_HOST_URL one.
+    """
+    return _get_base_urls("VLM_HOST_URLS", "VLM_HOST_URL")
+
+
+def get_ollama_server_base_urls() -> list[str]:
+    """Return the base urls of the ollama servers serving the vision-llm.
+
+    They are read from the comma-separated OLLAMA_SERVER_BASE_URLS env var,
+    else from the OLLAMA_SERVER_BASE_URL one.
+    """
+    return _get_base_urls("OLLAMA_SERVER_BASE_URLS", "OLLAMA_SERVER_BASE_URL")
+
+
 def ollama_vlm_options(
     model: str,
     prompt: str,
@@ -52,6 +78,7 @@ def ollama_vlm_options(
         ResponseFormat.HTML, ResponseFormat.MARKDOWN
     ] = ResponseFormat.MARKDOWN,
     allowed_timeout: int = 60 * 3,
+    base_url: str | None = None,
 ):
     """Return a configuration for vlm model set with ollama.
 
@@ -61,6 +88,8 @@ def ollama_vlm_options(
         response_format: a supported response format for the vllm
         allowed_timeout: the allowed time for processing one page in one \
 document (default to 3 minutes)
+        base_url: the base url of the server, the first of the env vars by \
+default
     """
     # The ApiVlmOptions() allows to interface with APIs supporting
     # the multi-modal chat interface. Here follow a few example on how to configure those.
@@ -68,7 +97,7 @@ document (default to 3 minutes)
     # One possibility is self-hosting model, e.g. via LM Studio, Ollama or others.
     options = ApiVlmOptions(
         url=AnyUrl(
-            f"{getenv_or_throw("OLLAMA_SERVER_BASE_URL")}/v1/chat/completions"
+            f"{base_url or get_ollama_server_base_urls()[0]}/v1/chat/completions"
         ),  # the default Ollama endpoint
         params=dict(
             model=model,
@@ -90,6 +119,7 @@ def vllm_vlm_options(
         ResponseFormat.HTML, ResponseFormat.MARKDOWN
     ] = ResponseFormat.MARKDOWN,
     allowed_timeout: int = 60 * 3,
+    base_url: str | None = None,
 ):
     """Return a configuration for vlm model set with a vllm server (so an OpenAI compatible API).
 
@@ -99,6 +129,8 @@ def vllm_vlm_options(
         response_format: a supported response format for the vllm
         allowed_timeout: the allowed time for processing one page in one \
 document (default to 3 minutes)
+        base_url: the base url of the server, the first of the env vars by \
+default
     """
     # The ApiVlmOptions() allows to interface with APIs supporting
     # the multi-modal chat interface. Here follow a few example on how to configure those.
@@ -106,7 +138,7 @@ document (default to 3 minutes)
     # One possibility is self-hosting model, e.g. via LM Studio, Ollama or others.
     options = ApiVlmOptions(
         url=AnyUrl(
-            f"{getenv_or_throw("VLM_HOST_URL")}/v1/chat/completions"
+            f"{base_url or get_vlm_host_urls()[0]}/v1/chat/completions"
         ),  # an arbitraty port
         params=dict(
             model=model,
@@ -141,25 +173,31 @@ def converter(ollama_vlm_options: ApiVlmOptions):
     return doc_converter
 
 
+def converter_pool(
+    base_urls: list[str], options_for: Callable[[str], ApiVlmOptions]
+) -> VlmConverterPool:
+    """Return a pool of Docling PDF converters, one per vlm server.
+
+    Arguments:
+        base_urls: the base urls of the servers serving the same vlm
+        options_for: the function returning the vlm configuration bound to \
+a server from its base url
+    """
+    return pool_from_endpoints(
+        base_urls, lambda base_url: converter(options_for(base_url))
+    )
+
+
 def _process_page_ranges_with_cache(
     intervention_id: InterventionId,
     file: Path,
-    docConverter: DocumentConverter,
+    converters: VlmConverterPool,
     page_ranges: Iterator[PageRange],
 ) -> Iterator[tuple[PageRange, CorrectlyConvertedDocument | None]]:
     def scan_page_range(
         page_ranges: Iterator[PageRange],
     ) -> Iterator[CorrectlyConvertedDocument | None]:
-        return (
-            has_document_been_well_scanned(
-                docConverter.convert(
-                    file,
-                    page_range=p_range,
-                    raises_on_error=False,
-                )
-            )
-            for p_range in page_ranges
-        )
+        return converters.convert_all(file, page_ranges)
 
     def get_yaml_file_for_pdf_slice(page_range: PageRange):
         return cache_dd.get_yaml_file_for_pdf(
@@ -178,7 +216,7 @@ def _process_page_ranges_with_cache(
 def _retry_scanning_failed_document(
     intervention_id: InterventionId,
     doc: Path,
-    docConverter: DocumentConverter,
+    converters: VlmConverterPool,
     page_range: PageRange,
 ) -> Iterator[tuple[PageRange, CorrectlyConvertedDocument | None]]:
     print_log("Retry scanning the document page per page...")
@@ -189,7 +227,7 @@ def _retry_scanning_failed_document(
     return iter(
         tqdm(
             _process_page_ranges_with_cache(
-                intervention_id, doc, docConverter, iter(page_ranges)
+                intervention_id, doc, converters, iter(page_ranges)
             ),
             desc=f"({intervention_id}, {page_range[0]}-{page_range[1]}) rescanned pages",
             unit="page",
@@ -202,7 +240,7 @@ def _convert_document_with_parallel_pages(
     intervention_id: InterventionId,
     file: Path,
     p_count: int,
-    docConverter: DocumentConverter,
+    converters: VlmConverterPool,
     incipit_only: bool,
 ) -> Iterator[tuple[PageRange, CorrectlyConvertedDocument | None]]:
     page_ranges = get_page_ranges(
@@ -213,7 +251,7 @@ def _convert_document_with_parallel_pages(
     return iter(
         tqdm(
             _process_page_ranges_with_cache(
-                intervention_id, file, docConverter, iter(page_ranges)
+                intervention_id, file, converters, iter(page_ranges)
             ),
             desc=f"Doc n°{intervention_id}'s scanned proportion",
             unit="page batch",
@@ -224,7 +262,7 @@ def _convert_document_with_parallel_pages(
 
 def process_documents(
     file_inputs: list[tuple[InterventionId, Path]],
-    documentConvertor: DocumentConverter,
+    converters: VlmConverterPool,
     incipit_only=True,
 ) -> Iterator[
     tuple[
@@ -232,7 +270,10 @@ def process_documents(
         Iterator[tuple[PageRange, CorrectlyConvertedDocument]],
     ]
 ]:
-    """Convert the documents into text with Docling, using the given converter.
+    """Convert the documents into text with Docling, using the given converters.
+
+    The page ranges of a document are scanned in parallel over the vlm
+    servers of the pool.
 
     Return:
     For each file, either a list of one docling document, if all the document
@@ -245,13 +286,13 @@ def process_documents(
         intervention_id: InterventionId, file: Path, p_count: int
     ) -> Iterator[tuple[PageRange, CorrectlyConvertedDocument]]:
         for p_range, result in _convert_document_with_parallel_pages(
-            intervention_id, file, p_count, documentConvertor, incipit_only
+            intervention_id, file, p_count, converters, incipit_only
         ):
             if result is not None:
                 yield p_range, result
             else:
                 for p_range, result in _retry_scanning_failed_document(
-                    intervention_id, file, documentConvertor, p_range
+                    intervention_id, file, converters, p_range
                 ):
                     if result is not None:
                         yield p_range, result
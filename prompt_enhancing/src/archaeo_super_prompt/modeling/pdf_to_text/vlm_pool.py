@@ -0,0 +1,170 @@
+"""Spreading of the OCR of the PDF pages over several vision-llm servers.
+
+The pool holds one Docling converter per server, each converting one page
+range at a time with its own page concurrency. The page ranges of a document
+are converted in parallel, each on the healthy server with the least
+outstanding conversions (see the endpoint_router module). A server failing
+several conversions in a row is ejected for a cooldown period, then probed
+before receiving pages again.
+
+A page range whose conversion has failed (e.g. after a timeout of the
+server) is converted again on another server before being given up. Only the
+failures of the server (connection errors, timeouts, server errors) count
+towards its ejection: a page range badly scanned or unreadable, whichever the
+server, does not eject the healthy ones.
+
+The pool owns the threads of the parallel conversions, which are stopped
+when it is closed (e.g. at the end of a with block).
+"""
+
+import threading
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Protocol, Self
+
+import requests
+from docling.datamodel.document import ConversionResult
+from docling.datamodel.settings import PageRange
+
+from ...config.debug_log import print_log
+from ..struct_extract.endpoint_router import EndpointRouter, probe_endpoint
+from .types import CorrectlyConvertedDocument, has_document_been_well_scanned
+
+_MAX_ATTEMPTS = 2
+
+# the errors of the requests to the server, and not of the pages
+_ENDPOINT_FAILURES = (requests.ConnectionError, requests.Timeout)
+
+
+class PageRangeConverter(Protocol):
+    """The part of the Docling DocumentConverter used by the pool."""
+
+    def convert(
+        self, source: Path, *, page_range: PageRange, raises_on_error: bool
+    ) -> ConversionResult:
+        """Convert the page range of the PDF file."""
+        ...
+
+
+def probe_vlm_endpoint(endpoint: str) -> bool:
+    """Return True if the OpenAI-compatible vlm server answers."""
+    return probe_endpoint(f"{endpoint.rstrip('/')}/v1")
+
+
+def is_vlm_endpoint_failure(error: BaseException) -> bool:
+    """Return True if the error is due to the vlm server and not the pages."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    return isinstance(error, _ENDPOINT_FAILURES)
+
+
+class VlmConverterPool:
+    """Thread-safe pool of Docling converters bound to several vlm servers.
+
+    It is a context manager closing the pool at the end of the block.
+    """
+
+    def __init__(
+        self,
+        converters: dict[str, PageRangeConverter],
+        router: EndpointRouter | None = None,
+    ):
+        """Initialize the pool with all the servers healthy.
+
+        Arguments:
+            converters: the converter of each server, identified by its \
+base url
+            router: the balancer of the conversions over the servers, \
+probing the servers on their /v1/models route by default
+        """
+        self.converters = converters
+        self._router = router or EndpointRouter(
+            list(converters), probe=probe_vlm_endpoint
+        )
+        # a converter sends the pages of one range at a time, with the
+        # concurrency of its options
+        self._locks = {endpoint: threading.Lock() for endpoint in converters}
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(converters), thread_name_prefix="vlm-pool"
+        )
+
+    def _convert_on(
+        self, endpoint: str, file: Path, page_range: PageRange
+    ) -> tuple[CorrectlyConvertedDocument | None, bool]:
+        """Convert the page range on the server.
+
+        Return the converted pages, None if the conversion has failed, and
+        whether this failure is due to the server.
+        """
+        with self._locks[endpoint]:
+            try:
+                # the errors of the requests to the server are raised
+                return has_document_been_well_scanned(
+                    self.converters[endpoint].convert(
+                        file, page_range=page_range, raises_on_error=True
+                    )
+                ), False
+            except Exception as e:
+                print_log(
+                    f"The vlm server {endpoint} has failed to scan the pages "
+                    f"{page_range[0]}-{page_range[1]} of {file.name}: {e}"
+                )
+                return None, is_vlm_endpoint_failure(e)
+
+    def convert(
+        self, file: Path, page_range: PageRange
+    ) -> CorrectlyConvertedDocument | None:
+        """Convert the page range, on another server if the first one fails.
+
+        Return None if the conversion has failed on all the tried servers.
+        """
+        tried: list[str] = []
+        for _ in range(min(_MAX_ATTEMPTS, len(self.converters))):
+            endpoint = self._router.acquire(exclude=tried)
+            result, endpoint_failed = None, False
+            try:
+                result, endpoint_failed = self._convert_on(
+                    endpoint, file, page_range
+                )
+            finally:
+                self._router.release(endpoint, not endpoint_failed)
+            if result is not None:
+                return result
+            tried.append(endpoint)
+        return None
+
+    def convert_all(
+        self, file: Path, page_ranges: Iterator[PageRange]
+    ) -> Iterator[CorrectlyConvertedDocument | None]:
+        """Convert the page ranges in parallel, in their order."""
+        return self._executor.map(
+            lambda page_range: self.convert(file, page_range), page_ranges
+        )
+
+    def close(self):
+        """Wait for the running conversions and stop the threads of the pool."""
+        self._executor.shutdown()
+
+    def __enter__(self) -> Self:
+        """Return the pool, closed at the end of the block."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the pool."""
+        self.close()
+
+
+def pool_from_endpoints(
+    endpoints: Sequence[str],
+    converter_for: Callable[[str], PageRangeConverter],
+) -> VlmConverterPool:
+    """Build a pool with one converter per server.
+
+    Arguments:
+        endpoints: the base urls of the vlm servers
+        converter_for: the function building the converter bound to a server
+    """
+    return VlmConverterPool(
+        {endpoint: converter_for(endpoint) for endpoint in endpoints}
+    )
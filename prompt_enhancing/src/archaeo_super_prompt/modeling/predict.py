@@ -3,6 +3,7 @@
 from ..dataset.load import MagohDataset
 from ..types.pdfpaths import PDFPathDataset
 from .train import ExtractionDAGParts
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 import pandas as pd
 
@@ -21,21 +22,49 @@ def build_complete_inference_dag(parts: ExtractionDAGParts):
 
 
 def score_dag(
-    parts: ExtractionDAGParts, inputs: PDFPathDataset, eval_ds: MagohDataset
+    parts: ExtractionDAGParts,
+    inputs: PDFPathDataset,
+    eval_ds: MagohDataset,
+    num_threads: int | None = None,
 ):
-    """From an already fitted model, apply scoring over the extractors."""
+    """From an already fitted model, apply scoring over the extractors.
+
+    The extractors are evaluated concurrently. The number of in-flight
+    requests on each llm endpoint stays bounded by the language model clients
+    (see the language_model module), which send the waiting requests of all
+    the extractors in the order of their prompts (see the request_ordering
+    module).
+
+    Arguments:
+        parts: the fitted parts of the DAG
+        inputs: the pdf files of the evaluation records
+        eval_ds: the dataset with the answers of the evaluation records
+        num_threads: if given, override for this run the number of \
+evaluation threads of each extractor
+    """
     preprocessed_input = parts.preprocessing_root.make_dag().transform(inputs)
 
-    scores = [
-        (
-            extract_id,
-            *fe.score_and_transform(
-                preprocessed_input[dep.component_id], eval_ds
-            ),
-        )
+    extractors = [
+        (extract_id, fe, dep)
         for (extract_id, fe), dep in parts.extraction_parts
         if not isinstance(fe, str)
     ]
+    with ThreadPoolExecutor(max_workers=max(len(extractors), 1)) as executor:
+        futures = [
+            (
+                extract_id,
+                executor.submit(
+                    fe.score_and_transform,
+                    preprocessed_input[dep.component_id],
+                    eval_ds,
+                    num_threads=num_threads,
+                ),
+            )
+            for extract_id, fe, dep in extractors
+        ]
+        scores = [
+            (extract_id, *future.result()) for extract_id, future in futures
+        ]
     return {extract_id: score for extract_id, score, _ in scores}, pd.concat(
         df for _, _, df in scores
     )
@@ -0,0 +1,113 @@
+"""Accounting of the tiers of the extraction cascade.
+
+A field extractor answers each intervention with the first tier able to
+answer it confidently:
+1. the deterministic resolver
+2. a small llm, whose answers are checked by the extractor
+3. the llm of the extractor
+
+The recorder below keeps which tier has answered each intervention during a
+run, with the latency and the tokens consumed by each llm tier, so the share,
+the score and the cost of each tier can be reported after the run.
+"""
+
+import threading
+from collections import defaultdict
+from statistics import mean
+from typing import Literal, NamedTuple
+
+from . import language_model as lm_provider_mod
+
+type Tier = Literal["resolver", "small llm", "llm"]
+TIERS: tuple[Tier, ...] = ("resolver", "small llm", "llm")
+
+
+class TierStats(NamedTuple):
+    """Share, score and cost of one tier of the cascade during a run.
+
+    Arguments:
+        tier: the tier
+        processed: the number of interventions sent to this tier
+        answered: the number of interventions whose answer has been kept
+        score: the mean score of the kept answers, in an evaluation
+        tokens: the tokens consumed by the llm of the tier
+        mean_latency: the mean duration in seconds of the processing of \
+an intervention by this tier
+    """
+
+    tier: Tier
+    processed: int
+    answered: int
+    score: float | None
+    tokens: int
+    mean_latency: float | None
+
+
+class CascadeRecorder:
+    """Thread-safe record of the tier answering each intervention of a run."""
+
+    def __init__(self, tier_models: dict[Tier, str]):
+        """Start the recording of a run.
+
+        Arguments:
+            tier_models: the identifier of the llm of each llm tier, whose \
+consumed tokens are counted from now on
+        """
+        self._tier_models = tier_models
+        self._start_tokens = {
+            tier: lm_provider_mod.get_total_token_usage(model_id)
+            for tier, model_id in tier_models.items()
+        }
+        self._lock = threading.Lock()
+        self._answering_tiers: dict[str, Tier] = {}
+        self._latencies: dict[Tier, list[float]] = defaultdict(list)
+
+    def record_processing(self, tier: Tier, seconds: float):
+        """Record the processing of an intervention by a tier."""
+        with self._lock:
+            self._latencies[tier].append(seconds)
+
+    def record_answer(self, key: str, tier: Tier):
+        """Record the tier whose answer is kept for the identified input."""
+        with self._lock:
+            self._answering_tiers[key] = tier
+
+    def stats(self, scores: dict[str, float] | None = None) -> list[TierStats]:
+        """Return the stats of each tier used in the run.
+
+        Arguments:
+            scores: if given, the score of the answer of each identified \
+input, to compute the score of each tier
+        """
+        with self._lock:
+            answering_tiers = dict(self._answering_tiers)
+            latencies = {k: list(v) for k, v in self._latencies.items()}
+        scores_per_tier: dict[Tier, list[float]] = defaultdict(list)
+        answered: dict[Tier, int] = defaultdict(int)
+        for key, tier in answering_tiers.items():
+            answered[tier] += 1
+            if scores is not None and key in scores:
+                scores_per_tier[tier].append(scores[key])
+        return [
+            TierStats(
+                tier=tier,
+                processed=len(latencies.get(tier, []))
+                if tier != "resolver"
+                else answered[tier],
+                answered=answered[tier],
+                score=mean(scores_per_tier[tier])
+                if scores_per_tier[tier]
+                else None,
+                tokens=lm_provider_mod.get_total_token_usage(
+                    self._tier_models[tier]
+                )
+                - self._start_tokens[tier]
+                if tier in self._tier_models
+                else 0,
+                mean_latency=mean(latencies[tier])
+                if latencies.get(tier)
+                else None,
+            )
+            for tier in TIERS
+            if answered[tier] or latencies.get(tier)
+        ]
@@ -1,59 +1,328 @@
-"""Management of the prompt attachment creation."""
+"""Management of the prompt attachment creation.
 
-from typing import cast
-from pandera.typing.pandas import DataFrame
+The contexts of all the interventions are rendered in one columnar pass over
+the chunk dataframe. The rendered contexts are cached on the disk with a
+fingerprint of the chunks and the rendering format, so a re-run over the same
+preprocessing output skips the rendering.
+"""
+
+from collections.abc import Callable
+from functools import cache
+from typing import NamedTuple, cast, override
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.pipeline import FunctionTransformer
+from joblib.memory import MemorizedFunc
+from pandera.typing.pandas import DataFrame
+
+from ...config.debug_log import print_debug_log, print_log
+from ...utils.cache import (
+    get_memory_for,
+    identity_function,
+    is_input_in_the_cache,
+    manually_cache_result,
+)
 from ..entity_extractor.types import ChunksWithThesaurus
+from ..types.base_transformer import BaseTransformer
 from .types import InputForExtractionWithSuggestedThesauri
-from tqdm import tqdm
+
+# the tokenizer of the embedding model, already fetched for the chunking
+DEFAULT_TOKENIZER_HF_ID = "nomic-ai/nomic-embed-text-v1.5"
+
+type TokenCounter = Callable[[list[str]], list[int]]
+"""Count the tokens of each text of a batch."""
+
+type RenderingFormat = tuple[str, ...]
+
+_SEPARATOR = "`" + "-" * 60 + "`\n\n"
+
+
+class PackingStats(NamedTuple):
+    """Truncation statistics of the context of one intervention."""
+
+    kept_chunks: int
+    dropped_chunks: int
+    kept_tokens: int
+    dropped_tokens: int
+
+
+@cache
+def get_token_counter(tokenizer_hf_id: str) -> TokenCounter:
+    """Return a function counting the tokens of texts with a HF tokenizer.
+
+    The tokenizer is fetched from the HuggingFace's repositories once per
+    process and the texts are tokenized in batch.
+    """
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_hf_id)
+    return lambda texts: [
+        len(ids)
+        for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]
+    ]
+
+
+def _render_chunks(chunks: pd.DataFrame, compact: bool) -> "pd.Series[str]":
+    """Render each chunk with its header, column-wise."""
+    # the columns are typed as strings for the concatenation operators
+    filenames = cast("pd.Series[str]", chunks["filename"])
+    content = cast("pd.Series[str]", chunks["chunk_content"])
+    pages = cast("pd.Series[str]", chunks["chunk_page_position"].astype(str))
+    if compact:
+        pages = pages.str.slice(1, -1).str.replace(", ", ",")
+        return "[" + filenames + " p." + pages + "]\n" + content + "\n\n"
+    return (
+        "`%% "
+        + filenames
+        + " | Page "
+        + pages
+        + " ("
+        + cast("pd.Series[str]", chunks["chunk_type"].astype(str))
+        + ") %%`\n\n"
+        + content
+        + "\n\n"
+        + _SEPARATOR
+    )
+
+
+def _join_per_intervention(chunks: pd.DataFrame, texts: "pd.Series[str]"):
+    ordered = chunks.assign(_text=texts).sort_values(
+        by=["id", "chunk_index"], kind="stable"
+    )
+    return ordered.groupby("id", sort=True)["_text"].agg("".join)
+
+
+def render_contexts(
+    chunks: DataFrame[ChunksWithThesaurus],
+) -> "pd.Series[str]":
+    """Concatenate all the chunks of each intervention with a verbose header.
+
+    Return the contexts indexed by the intervention identifiers.
+    """
+    return _join_per_intervention(chunks, _render_chunks(chunks, False))
 
 
-def ChunksToText():
+def pack_contexts(
+    chunks: DataFrame[ChunksWithThesaurus],
+    token_budget: int,
+    count_tokens: TokenCounter,
+) -> tuple["pd.Series[str]", pd.DataFrame]:
+    """Concatenate the most relevant chunks whose size fits the token budget.
+
+    For each intervention, the chunks are ranked by their number of
+    identified thesaurus, then by their page position (the first pages of a
+    report are often the most informative). The best ones are packed while
+    they fit in the budget, then rendered in their reading order with a
+    compact header.
+
+    Arguments:
+        chunks: the chunks of all the interventions
+        token_budget: the maximum number of tokens of each context
+        count_tokens: the function counting the tokens of texts, such as \
+the one returned by get_token_counter
+
+    Return:
+        the contexts indexed by the intervention identifiers
+        the truncation statistics per intervention, with the fields of \
+PackingStats as columns
+    """
+    chunks = cast(
+        DataFrame[ChunksWithThesaurus], chunks.reset_index(drop=True)
+    )
+    texts = _render_chunks(chunks, True)
+    first_page = (
+        pd.to_numeric(chunks["chunk_page_position"].explode(), errors="coerce")
+        .groupby(level=0)
+        .min()
+        .fillna(np.inf)
+    )
+    ranked = chunks.assign(
+        _text=texts,
+        _tokens=count_tokens(texts.tolist()),
+        _hits=chunks["identified_thesaurus"].str.len(),
+        _first_page=first_page,
+    ).sort_values(
+        by=["id", "_hits", "_first_page", "chunk_index"],
+        ascending=[True, False, True, True],
+        kind="stable",
+    )
+    ids = ranked["id"].to_numpy()
+    tokens = ranked["_tokens"].to_numpy()
+    kept = np.zeros(len(ranked), dtype=bool)
+    total, current_id = 0, None
+    for i in range(len(ranked)):
+        if ids[i] != current_id:
+            total, current_id = 0, ids[i]
+        if total + tokens[i] <= token_budget:
+            kept[i] = True
+            total += tokens[i]
+    ranked = ranked.assign(_kept=kept, _kept_tokens=np.where(kept, tokens, 0))
+    stats = ranked.groupby("id", sort=True).agg(
+        kept_chunks=("_kept", "sum"),
+        dropped_chunks=("_kept", "size"),
+        kept_tokens=("_kept_tokens", "sum"),
+        dropped_tokens=("_tokens", "sum"),
+    )
+    stats["dropped_chunks"] -= stats["kept_chunks"]
+    stats["dropped_tokens"] -= stats["kept_tokens"]
+    contexts = _join_per_intervention(
+        ranked[kept], ranked.loc[kept, "_text"]
+    ).reindex(stats.index, fill_value="")
+    return contexts, stats.astype(int)
+
+
+def pack_chunks(
+    filtered_chunks: DataFrame[ChunksWithThesaurus],
+    token_budget: int,
+    count_tokens: TokenCounter,
+) -> tuple[str, PackingStats]:
+    """Pack the chunks of one intervention, as pack_contexts does."""
+    contexts, stats = pack_contexts(
+        filtered_chunks, token_budget, count_tokens
+    )
+    return cast(str, contexts.iloc[0]), PackingStats(
+        *(int(v) for v in stats.iloc[0])
+    )
+
+
+def unify_thesaurus(chunks: DataFrame[ChunksWithThesaurus]) -> "pd.Series":
+    """Return the sorted identified thesaurus of each intervention."""
+    exploded = (
+        chunks[["id", "identified_thesaurus"]]
+        .explode("identified_thesaurus")
+        .dropna()
+        .drop_duplicates()
+        .astype({"identified_thesaurus": int})
+        .sort_values(by=["id", "identified_thesaurus"])
+    )
+    return exploded.groupby("id")["identified_thesaurus"].agg(list)
+
+
+def chunks_fingerprint(chunks: DataFrame[ChunksWithThesaurus]) -> str:
+    """Return a hash of the chunk columns read by the rendering."""
+    hashable = chunks[
+        ["id", "filename", "chunk_index", "chunk_content"]
+    ].assign(
+        **{
+            column: chunks[column].astype(str)
+            for column in (
+                "chunk_type",
+                "chunk_page_position",
+                "identified_thesaurus",
+            )
+        }
+    )
+    return cast(
+        str,
+        joblib.hash(
+            pd.util.hash_pandas_object(hashable, index=False).to_numpy()
+        ),
+    )
+
+
+def _rendered_contexts(
+    key: tuple[str, RenderingFormat],
+    output: tuple[pd.DataFrame, pd.DataFrame | None] | None = None,
+):
+    return identity_function(key, output)
+
+
+def _get_rendered_contexts_cache() -> MemorizedFunc:
+    # resolved at each call, as the data directory can be moved
+    return cast(
+        MemorizedFunc,
+        get_memory_for("interim").cache(
+            _rendered_contexts, ignore=["output"]
+        ),
+    )
+
+
+class ChunksToText(BaseTransformer):
     """Unifies the filtered chunks into one attachment text for an LLM prompt.
 
     This pipeline Transformer applies this chunk merge for each intervention.
     """
-    # TODO: define a unique ChunksWithSuggestedValues, regardless if its a
-    # thesaurus identifier, an identified number, etc.
-
-    def to_readable_context_string(
-        filtered_chunks: DataFrame[ChunksWithThesaurus],
-    ) -> str:
-        msg: str = ""
-        for _, chunk in filtered_chunks.sort_values(
-            by="chunk_index"
-        ).iterrows():
-            msg += f"`%% {chunk['filename']} | Page {chunk['chunk_page_position']} ({chunk['chunk_type']}) %%`\n\n"
-            msg += chunk["chunk_content"] + "\n" * 2
-            msg += "`" + "-" * 60 + "`\n\n"
-        return msg
-
-    def unify_thesaurus(X: DataFrame[ChunksWithThesaurus]):
-        return set().union(*X["identified_thesaurus"].tolist())
-
-    def ChunksToPromptContent(
-        X: DataFrame[ChunksWithThesaurus],
-    ) -> DataFrame[InputForExtractionWithSuggestedThesauri]:
-        return InputForExtractionWithSuggestedThesauri.validate(
-            pd.DataFrame(
-                (
-                    lambda filtered_chunks: {
-                        "id": id_,
-                        "merged_chunks": to_readable_context_string(
-                            filtered_chunks
-                        ),
-                        "identified_thesaurus": list(
-                            unify_thesaurus(filtered_chunks)
-                        ),
-                    }
-                )(cast(DataFrame[ChunksWithThesaurus], filtered_chunks))
-                for id_, filtered_chunks in tqdm(
-                    X.groupby("id"),
-                    "Gathering filtered chunks",
-                    unit="intervention",
-                )
-            ).set_index("id")
+
+    def __init__(
+        self,
+        token_budget: int | None = None,
+        tokenizer_hf_id: str = DEFAULT_TOKENIZER_HF_ID,
+    ):
+        """Initialize the rendering of the contexts.
+
+        Arguments:
+            token_budget: if given, only the most relevant chunks fitting in \
+this number of tokens are kept, with compact headers (see pack_contexts), and \
+the truncation statistics are saved in the packing_stats_ attribute. \
+Otherwise, all the chunks are kept.
+            tokenizer_hf_id: the identifier on HuggingFace of the tokenizer \
+with which the budget is counted (the one of the llm for an accurate budget)
+        """
+        # TODO: define a unique ChunksWithSuggestedValues, regardless if its a
+        # thesaurus identifier, an identified number, etc.
+        self.token_budget = token_budget
+        self.tokenizer_hf_id = tokenizer_hf_id
+
+    def _rendering_format(self) -> RenderingFormat:
+        if self.token_budget is None:
+            return ("verbose",)
+        return ("compact", str(self.token_budget), self.tokenizer_hf_id)
+
+    def _render(
+        self, X: DataFrame[ChunksWithThesaurus]
+    ) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+        if self.token_budget is None:
+            contexts, stats = render_contexts(X), None
+        else:
+            contexts, stats = pack_contexts(
+                X, self.token_budget, get_token_counter(self.tokenizer_hf_id)
+            )
+        thesaurus = unify_thesaurus(X).reindex(contexts.index)
+        return pd.DataFrame(
+            {
+                "merged_chunks": contexts,
+                "identified_thesaurus": [
+                    t if isinstance(t, list) else [] for t in thesaurus
+                ],
+            },
+            index=contexts.index.rename("id"),
+        ), stats
+
+    def _log_stats(self, stats: pd.DataFrame):
+        truncated = stats[stats["dropped_chunks"] > 0]
+        for id_, row in truncated.iterrows():
+            print_debug_log(
+                f"Context of the intervention {id_} truncated: "
+                f"{PackingStats(*row)}"
+            )
+        print_log(
+            f"{len(truncated)}/{len(stats)} contexts truncated to "
+            f"{self.token_budget} tokens, "
+            f"{truncated['dropped_chunks'].sum()} chunks dropped"
         )
 
-    return FunctionTransformer(ChunksToPromptContent)
+    @override
+    def transform(
+        self, X: DataFrame[ChunksWithThesaurus]
+    ) -> DataFrame[InputForExtractionWithSuggestedThesauri]:
+        """Render the context of each intervention.
+
+        With a token budget, the truncation statistics of the contexts are
+        saved in the packing_stats_ attribute, a dataframe indexed by the
+        intervention identifiers with the fields of PackingStats as columns.
+        """
+        key = (chunks_fingerprint(X), self._rendering_format())
+        rendered_contexts_cache = _get_rendered_contexts_cache()
+        if is_input_in_the_cache(rendered_contexts_cache, key):
+            print_debug_log("Rendered contexts loaded from the cache")
+            result, stats = rendered_contexts_cache(key)
+        else:
+            result, stats = self._render(X)
+            manually_cache_result(
+                rendered_contexts_cache, key, (result, stats)
+            )
+        if stats is not None:
+            self.packing_stats_ = stats
+            self._log_stats(stats)
+        return InputForExtractionWithSuggestedThesauri.validate(result)
@@ -0,0 +1,30 @@
+"""Propagation of the dspy context to the threads of the extraction models.
+
+The settings given to dspy.settings.context (e.g. the llm) are local to the
+thread entering the context block, and only the parallel primitives of dspy
+pass them to their threads. The functions submitted by the extraction models
+to their own thread pools are bound to the context of the caller below.
+"""
+
+from collections.abc import Callable
+
+from dspy.dsp.utils.settings import thread_local_overrides
+
+
+def in_dspy_context[**P, T](function: Callable[P, T]) -> Callable[P, T]:
+    """Bind the function to the dspy context of the calling thread.
+
+    The returned function can be run in another thread, with the settings of
+    the context block in which it has been bound.
+    """
+    parent_overrides = thread_local_overrides.overrides.copy()
+
+    def run(*args: P.args, **kwargs: P.kwargs) -> T:
+        original_overrides = thread_local_overrides.overrides
+        thread_local_overrides.overrides = parent_overrides.copy()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            thread_local_overrides.overrides = original_overrides
+
+    return run
@@ -0,0 +1,197 @@
+"""Load balancing of the llm requests over several OpenAI-compatible servers.
+
+Each request is sent to the healthy endpoint with the least outstanding
+requests. An endpoint failing several times in a row (connection error,
+timeout, server error) is ejected for a cooldown period, then probed on its
+/models route before receiving requests again.
+
+With the prefix affinity, the requests sharing the beginning of their last
+message (the report fragments of an intervention) are preferably sent to the
+same endpoint, whose KV-cache already holds this prefix, as long as this
+endpoint is not much more loaded than the others.
+
+The state of the endpoints is kept at the module level, so all the clients
+bound to the same servers share it.
+"""
+
+import hashlib
+import threading
+import time
+import urllib.request
+from collections.abc import Callable, Collection, Sequence
+from functools import cache
+from typing import NamedTuple
+
+import litellm
+
+_FAILURES_BEFORE_EJECTION = 3
+_EJECTION_SECONDS = 30.0
+_PROBE_TIMEOUT_SECONDS = 2.0
+# the preferred endpoint of a prefix is kept while it has at most this number
+# of outstanding requests more than the least loaded endpoint
+_AFFINITY_SLACK = 2
+_AFFINITY_PREFIX_CHARS = 1024
+
+# the errors of the server, and not of the request
+_ENDPOINT_FAILURES = (
+    litellm.APIConnectionError,
+    litellm.Timeout,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+)
+
+
+class EndpointState(NamedTuple):
+    """The load and the health of an endpoint."""
+
+    outstanding: int
+    consecutive_failures: int
+    ejected_until: float | None
+
+
+def probe_endpoint(endpoint: str) -> bool:
+    """Return True if the OpenAI-compatible server answers on /models."""
+    try:
+        with urllib.request.urlopen(
+            f"{endpoint.rstrip('/')}/models", timeout=_PROBE_TIMEOUT_SECONDS
+        ) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Return True if the error is due to the server and not the request."""
+    return isinstance(error, _ENDPOINT_FAILURES)
+
+
+def affinity_key(prompt: str | None, messages: list[dict] | None) -> str:
+    """Return the prefix of the request on which the affinity is computed."""
+    if messages:
+        content = messages[-1].get("content", "")
+        text = content if isinstance(content, str) else str(content)
+    else:
+        text = prompt or ""
+    return text[:_AFFINITY_PREFIX_CHARS]
+
+
+class EndpointRouter:
+    """Thread-safe least-outstanding-requests balancer over endpoints."""
+
+    def __init__(
+        self,
+        endpoints: Sequence[str],
+        probe: Callable[[str], bool] = probe_endpoint,
+    ):
+        """Initialize the router with all the endpoints healthy.
+
+        Arguments:
+            endpoints: the base urls of the servers
+            probe: the health check of an endpoint after its ejection
+        """
+        self.endpoints = tuple(endpoints)
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._states = {
+            endpoint: EndpointState(0, 0, None) for endpoint in endpoints
+        }
+
+    def _readmit_expired(self):
+        """Probe the endpoints whose ejection has expired."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                endpoint
+                for endpoint, state in self._states.items()
+                if state.ejected_until is not None
+                and state.ejected_until <= now
+            ]
+            # the ejection is extended until the probe succeeds, so one
+            # thread only probes an endpoint
+            for endpoint in expired:
+                self._states[endpoint] = self._states[endpoint]._replace(
+                    ejected_until=now + _EJECTION_SECONDS
+                )
+        for endpoint in expired:
+            if self._probe(endpoint):
+                with self._lock:
+                    self._states[endpoint] = self._states[endpoint]._replace(
+                        consecutive_failures=0, ejected_until=None
+                    )
+
+    def acquire(
+        self, prefix: str | None = None, exclude: Collection[str] = ()
+    ) -> str:
+        """Choose the endpoint of a request and count it as outstanding.
+
+        Arguments:
+            prefix: if given, the prefix of the request for the affinity
+            exclude: the endpoints to avoid if there is any other, e.g. \
+those which have already failed to answer this request
+        """
+        self._readmit_expired()
+        with self._lock:
+            candidates = [
+                endpoint
+                for endpoint in self.endpoints
+                if endpoint not in exclude
+            ] or list(self.endpoints)
+            healthy = [
+                endpoint
+                for endpoint in candidates
+                if self._states[endpoint].ejected_until is None
+            ]
+            if not healthy:
+                # all the servers are down, try the first to come back
+                healthy = [
+                    min(
+                        candidates,
+                        key=lambda e: self._states[e].ejected_until or 0.0,
+                    )
+                ]
+            least_loaded = min(
+                healthy, key=lambda e: self._states[e].outstanding
+            )
+            chosen = least_loaded
+            if prefix is not None:
+                # rendezvous hashing, stable when an endpoint is ejected
+                preferred = max(
+                    healthy,
+                    key=lambda e: hashlib.md5(
+                        f"{e}\n{prefix}".encode()
+                    ).digest(),
+                )
+                if (
+                    self._states[preferred].outstanding
+                    <= self._states[least_loaded].outstanding + _AFFINITY_SLACK
+                ):
+                    chosen = preferred
+            state = self._states[chosen]
+            self._states[chosen] = state._replace(
+                outstanding=state.outstanding + 1
+            )
+            return chosen
+
+    def release(self, endpoint: str, succeeded: bool):
+        """Count the request as done, and eject the endpoint if it fails."""
+        with self._lock:
+            state = self._states[endpoint]
+            failures = 0 if succeeded else state.consecutive_failures + 1
+            self._states[endpoint] = EndpointState(
+                outstanding=state.outstanding - 1,
+                consecutive_failures=failures,
+                ejected_until=time.monotonic() + _EJECTION_SECONDS
+                if failures >= _FAILURES_BEFORE_EJECTION
+                else state.ejected_until,
+            )
+
+    def states(self) -> dict[str, EndpointState]:
+        """Return the current state of each endpoint."""
+        with self._lock:
+            return dict(self._states)
+
+
+@cache
+def get_router(endpoints: tuple[str, ...]) -> EndpointRouter:
+    """Return the router shared by the clients bound to these endpoints."""
+    return EndpointRouter(endpoints)
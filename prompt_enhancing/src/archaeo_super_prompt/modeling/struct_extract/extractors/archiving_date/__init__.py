@@ -88,5 +88,6 @@ class ArchivingDateProvider(DetailedEvaluatorMixin[Any, MagohDataset, Any]):
         return 1.0
 
     @override
-    def score_and_transform(self, X, y):
+    def score_and_transform(self, X, y, num_threads=None):
+        num_threads = num_threads  # unused
         return self.score(X, y), self.predict(X)
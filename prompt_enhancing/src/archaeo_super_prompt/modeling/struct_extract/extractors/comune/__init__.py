@@ -4,11 +4,15 @@ import re
 from typing import cast, override
 
 import dspy
+import pandas as pd
 import pydantic
 from pandera.typing.pandas import Series
 
 from archaeo_super_prompt.dataset.load import MagohDataset
-from archaeo_super_prompt.dataset.thesauri import load_comune_with_provincie
+from archaeo_super_prompt.dataset.thesauri import get_comune_provincia_lookup
+from archaeo_super_prompt.dataset.thesauri.comune_province import (
+    normalize_name,
+)
 from archaeo_super_prompt.modeling.struct_extract.types import (
     InputForExtractionWithSuggestedThesauri,
     InputForExtractionWithSuggestedThesauriRowSchema,
@@ -19,6 +23,7 @@ from .....types.per_intervention_feature import (
     BasePerInterventionFeatureSchema,
 )
 from ...field_extractor import FieldExtractor, LLMProvider, to_prediction
+from ...structured_output import make_predictor
 
 # -- DSPy part
 
@@ -64,9 +69,16 @@ class ComuneOutputData(pydantic.BaseModel):
 class FindComune(dspy.Module):
     """DSPy model for the extraction of the comune."""
 
-    def __init__(self):
-        """Initialize only a chain of thought."""
-        self._estrattore_di_comune = dspy.ChainOfThought(IdentificaComune)
+    def __init__(self, fast_mode: bool = False):
+        """Initialize only a chain of thought, or a direct prediction.
+
+        Arguments:
+            fast_mode: if True, the outputs are directly predicted, without \
+the reasoning of the chain of thought
+        """
+        self._estrattore_di_comune = make_predictor(
+            IdentificaComune, fast_mode
+        )
 
     def forward(
         self, fragmenti_relazione: str, possibili_comuni: list[Comune]
@@ -117,6 +129,12 @@ class ComuneExtractor(
         llm_model_provider: LLMProvider,
         llm_model_id: str,
         llm_temperature: float,
+        eval_num_threads: int = 1,
+        bypass_response_cache: bool = False,
+        use_resolver: bool = False,
+        fast_mode: bool = False,
+        checkpoint_run: str | None = None,
+        small_llm_model_id: str | None = None,
     ) -> None:
         """Initialize the extractor with providing it the llm which will be used."""
         example = (
@@ -133,53 +151,88 @@ L'evento si è svolto a Lucca.""",
             ),
             ComuneOutputData(comune="Lucca", provincia="Lucca"),
         )
-        # TODO: load this more lazily
-        self._thesaurus = load_comune_with_provincie()
         super().__init__(
             llm_model_provider,
             llm_model_id,
             llm_temperature,
-            FindComune(),
+            FindComune(fast_mode),
             example,
             ComuneOutputData,
+            eval_num_threads,
+            bypass_response_cache,
+            use_resolver,
+            fast_mode,
+            checkpoint_run,
+            small_llm_model_id,
         )
 
     @override
     def _to_dspy_input(self, x) -> ComuneInputData:
-        comuni, province = self._thesaurus
-        possible_comuni = comuni.iloc[x.identified_thesaurus].merge(
-            province, on="province_id", suffixes=("_comune", "_province")
-        )
         return ComuneInputData(
             fragmenti_relazione=x.merged_chunks,
             possibili_comuni=[
                 Comune(
-                    citta_nome=cast(str, c.name_comune),
-                    provicia_nome=cast(str, c.name_province),
-                    provincia_sigla=cast(str, c.sigla),
+                    citta_nome=comune,
+                    provicia_nome=provincia,
+                    provincia_sigla=sigla,
+                )
+                for comune, provincia, sigla in (
+                    get_comune_provincia_lookup().candidates(
+                        x.identified_thesaurus
+                    )
                 )
-                for c in possible_comuni.itertuples()
             ],
         )
 
+    @override
+    def _resolve(self, inpt):
+        # a unique comune identified in the chunks is the answer
+        if len(inpt.possibili_comuni) != 1:
+            return None
+        (comune,) = inpt.possibili_comuni
+        return ComuneOutputData(
+            comune=comune.citta_nome, provincia=comune.provicia_nome
+        )
+
+    @override
+    def _is_confident(self, inpt, output):
+        # the answer must be one of the suggested comuni, if any, and exist
+        candidates = {
+            (normalize_name(c.citta_nome), normalize_name(c.provicia_nome))
+            for c in inpt.possibili_comuni
+        }
+        if candidates and (
+            (normalize_name(output.comune), normalize_name(output.provincia))
+            not in candidates
+        ):
+            return False
+        return (
+            get_comune_provincia_lookup().find_ids(
+                output.comune, output.provincia
+            )
+            is not None
+        )
+
     @override
     def _transform_dspy_output(self, y):
-        comuni, province = self._thesaurus
+        lookup = get_comune_provincia_lookup()
+        found_ids = (
+            (intervention_id, lookup.find_ids(output.comune, output.provincia))
+            for intervention_id, output in y
+        )
         return ComuneFeatSchema.validate(
-            self._identity_output_set_transform_to_df(y)
-            .assign(schedaid=lambda df: df.index)
-            .merge(
-                province[["name"]].assign(provincia_id=province.index),
-                left_on="provincia",
-                right_on="name",
-            )[["schedaid", "comune", "provincia_id"]]
-            .merge(
-                comuni.assign(comune_id=comuni.index),
-                left_on=["comune", "provincia_id"],
-                right_on=["name", "province_id"],
-            )[["schedaid", "comune_id", "provincia_id"]]
-            .rename(columns={"schedaid": "id"})
-            .set_index("id"),
+            pd.DataFrame(
+                [
+                    {
+                        "id": intervention_id,
+                        "comune_id": ids[0],
+                        "provincia_id": ids[1],
+                    }
+                    for intervention_id, ids in found_ids
+                    if ids is not None
+                ],
+                columns=["id", "comune_id", "provincia_id"],
+            ).set_index("id"),
             # TODO: add this after tests
             # lazy=True
         )
@@ -192,6 +245,11 @@ L'evento si è svolto a Lucca.""",
             predicted.provincia == expected.provincia
         ), TRESHOLD
 
+    @override
+    @classmethod
+    def _stratum(cls, answer):
+        return answer.provincia
+
     @override
     @classmethod
     def filter_training_dataset(
@@ -33,6 +33,8 @@ from .....types.per_intervention_feature import (
     BasePerInterventionFeatureSchema,
 )
 from ...field_extractor import FieldExtractor, LLMProvider, to_prediction
+from ...structured_output import make_predictor
+from .resolver import find_explicit_start_date
 from .type_models import ITALIAN_MONTHS, Data, Precision, Precisione
 
 
@@ -92,21 +94,30 @@ def _get_min_date(output_model: DataInterventoOutputData):
     )
 
 
+def _to_date(data: Data):
+    return datetime.date(
+        data.anno, ITALIAN_MONTHS.index(data.mese) + 1, data.giorno
+    )
+
+
 def _get_max_date(output_model: DataInterventoOutputData):
     return datetime.date(
         output_model.end_year, output_model.end_month, output_model.end_day
     )
 
 
-class EstimateInterventionDate(
-    dspy.Module
-):
+class EstimateInterventionDate(dspy.Module):
     """DSPy model for the extraction of the date of the intervention."""
 
-    def __init__(self):
-        """Initialize only a chain of thought."""
-        self._estrattore_della_data = dspy.ChainOfThought(
-            StimareDataDellIntervento
+    def __init__(self, fast_mode: bool = False):
+        """Initialize the predictor of the window of dates.
+
+        Arguments:
+            fast_mode: if True, the window is predicted directly instead of \
+with a chain of thought
+        """
+        self._estrattore_della_data = make_predictor(
+            StimareDataDellIntervento, fast_mode
         )
 
     def forward(
@@ -147,13 +158,15 @@ class EstimateInterventionDate(
                 if data_minima_di_inizio is not None
                 else None,
                 start_month=ITALIAN_MONTHS.index(data_minima_di_inizio.mese)
+                + 1
                 if data_minima_di_inizio is not None
                 else None,
                 start_year=data_minima_di_inizio.anno
                 if data_minima_di_inizio is not None
                 else None,
                 end_day=data_massima_di_inizio.giorno,
-                end_month=ITALIAN_MONTHS.index(data_massima_di_inizio.mese),
+                end_month=ITALIAN_MONTHS.index(data_massima_di_inizio.mese)
+                + 1,
                 end_year=data_massima_di_inizio.anno,
                 precision=TO_ENGLISH_PRECISION[precisione],
             )
@@ -182,8 +195,8 @@ class DateFeatSchema(BasePerInterventionFeatureSchema):
         nullable=True
     )
     intervention_start_date_max: datetime.date
-    intervention_start_date_precision: Series[str] = (
-        pa.Field(isin=["day", "month", "year"])
+    intervention_start_date_precision: Series[str] = pa.Field(
+        isin=["day", "month", "year"]
     )
 
 
@@ -203,6 +216,12 @@ class InterventionStartExtractor(
         llm_model_provider: LLMProvider,
         llm_model_id: str,
         llm_temperature: float,
+        eval_num_threads: int = 1,
+        bypass_response_cache: bool = False,
+        use_resolver: bool = False,
+        fast_mode: bool = False,
+        checkpoint_run: str | None = None,
+        small_llm_model_id: str | None = None,
     ) -> None:
         """Initialize the extractor with providing it the llm which will be used."""
         example = (
@@ -225,9 +244,15 @@ Lo scavo è iniziato il 18 marzo 1985 ed è terminato il 20 marzo.""",
             llm_model_provider,
             llm_model_id,
             llm_temperature,
-            EstimateInterventionDate(),
+            EstimateInterventionDate(fast_mode),
             example,
             DataInterventoOutputData,
+            eval_num_threads,
+            bypass_response_cache,
+            use_resolver,
+            fast_mode,
+            checkpoint_run,
+            small_llm_model_id,
         )
 
     @override
@@ -237,11 +262,40 @@ Lo scavo è iniziato il 18 marzo 1985 ed è terminato il 20 marzo.""",
             fragmenti_relazione=x.merged_chunks,
             data_di_archiviazone=Data(
                 giorno=date_of_archiving.day,
-                mese=ITALIAN_MONTHS[date_of_archiving.month],
+                mese=ITALIAN_MONTHS[date_of_archiving.month - 1],
                 anno=date_of_archiving.year,
             ),
         )
 
+    @override
+    def _resolve(self, inpt):
+        start_date = find_explicit_start_date(
+            inpt.fragmenti_relazione, _to_date(inpt.data_di_archiviazone)
+        )
+        if start_date is None:
+            return None
+        return DataInterventoOutputData(
+            start_day=start_date.day,
+            start_month=start_date.month,
+            start_year=start_date.year,
+            end_day=start_date.day,
+            end_month=start_date.month,
+            end_year=start_date.year,
+            precision="day",
+        )
+
+    @override
+    def _is_confident(self, inpt, output):
+        # the window must be made of valid dates, before the archiving
+        try:
+            min_date = _get_min_date(output)
+            max_date = _get_max_date(output)
+        except ValueError:
+            return False
+        return (
+            min_date is None or min_date <= max_date
+        ) and max_date <= _to_date(inpt.data_di_archiviazone)
+
     @override
     def _transform_dspy_output(self, y):
         return DateFeatSchema.validate(
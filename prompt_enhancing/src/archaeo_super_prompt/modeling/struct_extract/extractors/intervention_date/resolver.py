@@ -0,0 +1,57 @@
+"""Deterministic resolution of the start date from the report fragments.
+
+Some reports explicitly state when the works have started ("lo scavo è
+iniziato il 18 marzo 1985"). If exactly one such date is written in the
+fragments, it is taken as the start date without querying the llm.
+"""
+
+import datetime
+import re
+
+from .....dataset.normalization.intervention_date.month_normalization import (
+    to_int_month,
+)
+from .....dataset.normalization.intervention_date.transforms import (
+    DAY_PATTERN,
+    MONTH_PATTERN,
+    YEAR_PATTERN,
+)
+
+# a verb or a noun stating the start, then at most a few words before the date
+_START_PATTERN = re.compile(
+    r"\b(?:iniziat[aeio]|avviat[aeio]|cominciat[aeio]|intrapres[aeio]|"
+    r"(?:ha|hanno) avuto inizio|inizio dei lavori|inizio dello scavo)\b"
+    r"[^.\n]{0,40}?\b(?:il|in data|dal)\s+"
+    + DAY_PATTERN
+    + r"\s+"
+    + MONTH_PATTERN
+    + r"\s+"
+    + YEAR_PATTERN,
+    re.IGNORECASE,
+)
+
+
+def find_explicit_start_date(
+    fragments: str, archiving_date: datetime.date
+) -> datetime.date | None:
+    """Return the start date explicitly written in the fragments, if unique.
+
+    Arguments:
+        fragments: the merged chunks of the reports of the intervention
+        archiving_date: the date of archiving of the report, after which the \
+intervention cannot have started
+
+    Return:
+        None if no date or several different dates are stated as a start, or
+        if the date is not valid or after the archiving date
+    """
+    dates: set[datetime.date] = set()
+    for day, month, year in _START_PATTERN.findall(fragments):
+        try:
+            dates.add(datetime.date(int(year), to_int_month(month), int(day)))
+        except ValueError:
+            return None
+    if len(dates) != 1:
+        return None
+    (start_date,) = dates
+    return start_date if start_date <= archiving_date else None
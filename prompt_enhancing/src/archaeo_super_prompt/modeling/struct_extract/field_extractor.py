@@ -4,14 +4,17 @@ This transformer is a classifier which scorable and trainable.
 """
 
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
 from logging import warning
 from pathlib import Path
-from typing import Literal, cast, override
+import time
+from typing import cast, override
 from pydantic import BaseModel
 from pandera.typing.pandas import DataFrame
 import pandas as pd
 import dspy
+import joblib
 import tqdm
 
 from archaeo_super_prompt.dataset.load import MagohDataset
@@ -19,16 +22,26 @@ from archaeo_super_prompt.types.intervention_id import InterventionId
 from archaeo_super_prompt.types.per_intervention_feature import (
     BasePerInterventionFeatureSchema,
 )
+from ...config.debug_log import print_log
 from ...types.results import ResultSchema
+from ...utils.cache import get_cache_dir_for
 
 from . import types as extract_input_type
 from ..types.detailed_evaluator import DetailedEvaluatorMixin
 
+from . import cascade
+from . import hedging
 from . import language_model as lm_provider_mod
+from . import prediction_checkpoint
+from . import prompt_optimization
+from .prompt_optimization import OptimizationBudget
+from . import request_ordering
+from . import response_cache
+from . import structured_output
 
 
 EvalDetailedResult = list[tuple[dspy.Example, dspy.Prediction, float]]
-LLMProvider = Literal["vllm", "ollama", "openai"]
+LLMProvider = lm_provider_mod.LLMProvider
 
 
 def to_prediction(output: BaseModel) -> dspy.Prediction:
@@ -71,6 +84,9 @@ the DSPy model as input in its forward method.
     - DFOutputType is a subtype of pandera.pandas.DataFrameModel
     """
 
+    # the run mode of MIPROv2 for the optimization of the prompts
+    _OPTIMIZATION_MODE = "medium"
+
     def __init__(
         self,
         llm_model_provider: LLMProvider,
@@ -79,6 +95,12 @@ the DSPy model as input in its forward method.
         model: dspy.Module,
         example: tuple[DSPyInput, DSPyOutput],
         output_constructor: type[DSPyOutput],
+        eval_num_threads: int = 1,
+        bypass_response_cache: bool = False,
+        use_resolver: bool = False,
+        fast_mode: bool = False,
+        checkpoint_run: str | None = None,
+        small_llm_model_id: str | None = None,
     ) -> None:
         """Initialize the abstract class with the custom dspy module.
 
@@ -93,6 +115,22 @@ inference
 runtime the genericity and also to be able to log the model in mlflow
             output_constructor: the type of the output model for building it \
 generically from dictionnary expansion
+            eval_num_threads: the number of threads with which the \
+evaluations of this extractor are run (can be overriden per run)
+            bypass_response_cache: if True, the llm is always queried, \
+without reading or writing in the persistent cache of the outputs (set it for \
+sampling runs, with a temperature above zero)
+            use_resolver: if True, the interventions which can be resolved \
+deterministically (see the _resolve method) are not sent to the llm
+            fast_mode: if True, the outputs are decoded with the JSON schema \
+of the output model (see the structured_output module); the model must then \
+be built in fast mode too
+            checkpoint_run: if given, the name of the run under which the \
+predictions are checkpointed on the disk (see the prediction_checkpoint \
+module); an interrupted predict call is resumed with the same name
+            small_llm_model_id: if given, a smaller llm of the same provider \
+which is queried first; only the interventions whose answer is not confident \
+(see the _is_confident method) are sent to the main llm
 
         Environment variables:
             According to the llm provider, either the following env vars is
@@ -100,6 +138,11 @@ generically from dictionnary expansion
                OPENAI_API_KEY
                OLLAMA_SERVER_BASE_URL (default to http://localhost:11434)
                VLLM_SERVER_BASE_URL (default to http://localhost:8006/v1)
+            The LLM_MAX_IN_FLIGHT_REQUESTS env var bounds the number of
+            concurrent requests sent to one llm endpoint (default to 8).
+            The LLM_HEDGING_PERCENTILE env var enables the duplication of the
+            requests slower than this percentile of the latencies (see the
+            hedging module).
         """
         super().__init__()
         self.llm_model_provider: LLMProvider = llm_model_provider
@@ -108,21 +151,96 @@ generically from dictionnary expansion
         self._base_dspy_module = model
         self._example = example
         self._output_constructor = output_constructor
+        self.eval_num_threads = eval_num_threads
+        self.bypass_response_cache = bypass_response_cache
+        self.use_resolver = use_resolver
+        self.fast_mode = fast_mode
+        self.checkpoint_run = checkpoint_run
+        self.small_llm_model_id = small_llm_model_id
 
     def _infer_language_model(self):
-        match self.llm_model_provider:
-            case "ollama":
-                return lm_provider_mod.get_ollama_model(
-                    self.llm_model_id, self.llm_temperature
-                )
-            case "vllm":
-                return lm_provider_mod.get_vllm_model(
-                    self.llm_model_id, self.llm_temperature
-                )
-            case "openai":
-                return lm_provider_mod.get_openai_model(
-                    self.llm_model_id, self.llm_temperature
-                )
+        return lm_provider_mod.get_language_model(
+            self.llm_model_provider, self.llm_model_id, self.llm_temperature
+        )
+
+    def _infer_small_language_model(self):
+        return lm_provider_mod.get_language_model(
+            self.llm_model_provider,
+            cast(str, self.small_llm_model_id),
+            self.llm_temperature,
+        )
+
+    @contextmanager
+    def _dspy_context(self):
+        """Set the llm of dspy, with the constrained adapter in fast mode.
+
+        In fast mode, the parse failures and the retries of the requests sent
+        in this context are logged and saved in the structured_output_stats_
+        attribute. If the hedging of the requests is enabled, its stats are
+        saved in the hedging_stats_ attribute.
+        """
+        output_recorder = structured_output.StructuredOutputRecorder()
+        hedging_recorder = hedging.HedgingRecorder()
+        with (
+            dspy.settings.context(
+                lm=self._infer_language_model(),
+                **({"adapter": self._adapter()} if self.fast_mode else {}),
+            ),
+            structured_output.recording(output_recorder),
+            hedging.recording(hedging_recorder),
+        ):
+            yield
+        if self.fast_mode:
+            self.structured_output_stats_ = output_recorder.stats()
+            print_log(
+                f"{self.field_to_be_extracted()}: "
+                f"{self.structured_output_stats_}"
+            )
+        if hedging.get_hedging_percentile() is not None:
+            self.hedging_stats_ = hedging_recorder.stats()
+            print_log(f"{self.field_to_be_extracted()}: {self.hedging_stats_}")
+
+    def _adapter(self) -> dspy.Adapter:
+        """Return the adapter formatting the prompts of the extractor."""
+        if self.fast_mode:
+            return structured_output.ConstrainedJSONAdapter()
+        return dspy.settings.adapter or dspy.ChatAdapter()
+
+    def _prompt_contents(self, inputs: list[DSPyInput]) -> list[str]:
+        """Return the first prompt sent to the llm for each input."""
+        program = getattr(self, "prompt_model_", self._base_dspy_module)
+        adapter = self._adapter()
+        return [
+            request_ordering.prompt_content(program, inpt, adapter)
+            for inpt in inputs
+        ]
+
+    def _get_prediction_checkpoint(
+        self,
+    ) -> prediction_checkpoint.PredictionCheckpoint | None:
+        if self.checkpoint_run is None:
+            return None
+        return prediction_checkpoint.PredictionCheckpoint(
+            self.field_to_be_extracted(), self.checkpoint_run
+        )
+
+    def _model_key(self):
+        """Identify the fitted model, whose predictions are checkpointed."""
+        return (
+            self._llm_key(),
+            self.small_llm_model_id,
+            self.llm_temperature,
+            response_cache.program_fingerprint(self.prompt_model_),
+        )
+
+    def _llm_key(self, lm: dspy.LM | None = None):
+        # the llm of the context may be a plain dspy one (e.g. in the tests)
+        model_id = (
+            self.llm_model_id
+            if lm is None
+            else getattr(lm, "model_id", lm.model)
+        )
+        return f"{self.llm_model_provider}/{model_id}"
 
     @classmethod
     def _itertuples(cls, X: DataFrame[InputDataFrameWithKnowledge]):
@@ -190,15 +308,31 @@ generically from dictionnary expansion
         *,
         compiled_dspy_model_path: Path | None = None,
         skip_optimization=False,
+        optimization_budget: OptimizationBudget | None = None,
+        resume=True,
+        seed: int = 9,
         **kwargs,
     ):
         """Optimize the dspy model according to the given dataset.
 
+        The optimization is checkpointed in the interim data directory (see
+        the prompt_optimization module): if it is stopped by a crash or by its
+        budget, fitting again with the same arguments resumes it without
+        re-evaluating the already evaluated candidate programs, and an
+        already completed optimization is directly loaded. The best program
+        found by a run is saved in this directory, even if the budget has
+        stopped it.
+
         Arguments:
            X: the input dataframe with the required fields for the FieldExtractor
            y: the Magoh training dataset
            compiled_dspy_model_path: if given, a path to an already optimized dspy model, so this prompt model is directly used without reoptimize the program
            skip_optimization: if set to True, then the model is fitted with the not optimized dspy program
+           optimization_budget: if given, the wall-clock or token limits \
+after which the best program found so far is kept
+           resume: if False, a completed optimization with the same inputs \
+is not loaded but run again (the cached evaluations are still reused)
+           seed: the seed of the optimization, which must be kept to resume it
            kwargs: nothing usefull (just to fit the initial overriding)
         """
         kwargs = kwargs  # unused
@@ -209,49 +343,272 @@ generically from dictionnary expansion
             self._base_dspy_module.load(compiled_dspy_model_path)
             self.prompt_model_ = self._base_dspy_module
             return self
-        with dspy.settings.context(lm=self._infer_language_model()):
-            tp = dspy.MIPROv2(
-                metric=self._dspy_metric, auto="medium", num_threads=24
+        kept_ids, examples = self._compute_devset(X, y)
+        checkpoint_dir = self._get_optimization_checkpoint_dir(kept_ids, seed)
+        checkpoint_path = checkpoint_dir / "best_program.json"
+        completion_path = checkpoint_dir / "completed"
+        if resume and completion_path.exists():
+            print_log(f"Loading the completed optimization {checkpoint_path}")
+            self._base_dspy_module.load(checkpoint_path)
+            self.prompt_model_ = self._base_dspy_module
+            return self
+        trainset, valset = prompt_optimization.stratified_split(
+            examples,
+            [
+                self._stratum(self._output_constructor(**ex.toDict()))
+                for ex in examples
+            ],
+            prompt_optimization.get_valset_size(self._OPTIMIZATION_MODE),
+            seed,
+        )
+        with self._dspy_context():
+            tp = prompt_optimization.BudgetedMIPROv2(
+                metric=self._dspy_metric,
+                auto=self._OPTIMIZATION_MODE,
+                num_threads=lm_provider_mod.get_max_in_flight_requests(),
+                budget=optimization_budget or OptimizationBudget(),
+                log_dir=str(checkpoint_path.parent),
             )
-            self.prompt_model_ = tp.compile(
-                self._base_dspy_module,
-                trainset=list(self._compute_devset(X, y)[1]),
-                max_bootstrapped_demos=2,
-                max_labeled_demos=2,
-                requires_permission_to_run=False,
+            optimized = cast(
+                response_cache.CachedProgram,
+                tp.compile(
+                    response_cache.CachedProgram(
+                        self._base_dspy_module, self._llm_key()
+                    ),
+                    trainset=trainset,
+                    valset=valset,
+                    max_bootstrapped_demos=2,
+                    max_labeled_demos=2,
+                    seed=seed,
+                    requires_permission_to_run=False,
+                ),
             )
-            return self
+            self.prompt_model_ = optimized.program
+        self.prompt_model_.save(checkpoint_path)
+        # a run stopped by its budget is resumed by the next fit
+        if not tp.is_budget_exhausted():
+            completion_path.touch()
+        else:
+            completion_path.unlink(missing_ok=True)
+        return self
+
+    def _get_optimization_checkpoint_dir(
+        self, kept_ids: tuple[int, ...], seed: int
+    ) -> Path:
+        """Return the directory where an optimization run is checkpointed.
+
+        A run is identified by the llm, the initial program, the training
+        records and the seed.
+        """
+        run_id = cast(
+            str,
+            joblib.hash(
+                (
+                    self._llm_key(),
+                    self.llm_temperature,
+                    response_cache.program_fingerprint(self._base_dspy_module),
+                    sorted(kept_ids),
+                    seed,
+                )
+            ),
+        )
+        return get_cache_dir_for(
+            "interim",
+            f"prompt_optimization/{self.field_to_be_extracted()}/{run_id}",
+        )
+
+    @classmethod
+    def _stratum(cls, answer: DSPyOutput) -> Hashable:
+        """Return the stratum of an answer for the split of the devset.
+
+        By default, all the answers are in the same stratum. Override it to
+        balance the validation set on a class of the answers.
+        """
+        answer = answer  # unused
+        return None
+
+    def _cached_forward(self, **program_input) -> dspy.Prediction:
+        """Forward on the dspy module, without querying the llm if the output is cached.
+
+        The llm is the one of the current dspy context. See the
+        response_cache module for the identification of the outputs.
+        """
+        if self.bypass_response_cache:
+            response_cache.count_bypass()
+            return cast(dspy.Prediction, self.prompt_model_(**program_input))
+        return response_cache.cached_call(
+            self.prompt_model_,
+            self._llm_key(dspy.settings.lm),
+            self.llm_temperature,
+            program_input,
+        )
+
+    def _resolve(self, inpt: DSPyInput) -> DSPyOutput | None:
+        """Try to resolve the field without the llm.
+
+        Override it with a cheap deterministic rule. It must return None if
+        the input is ambiguous, so the intervention is sent to the dspy
+        program. By default, nothing is resolved.
+        """
+        inpt = inpt  # unused
+        return None
+
+    def _is_confident(self, inpt: DSPyInput, output: DSPyOutput) -> bool:
+        """Return True if the answer of the small llm can be kept.
 
-    def _typed_forward(self, inpt: DSPyInput) -> DSPyOutput:
-        """Carry out a type safe forward on the dspy module."""
-        return prediction_to_output(
+        Override it with validity checks of the answer against the input, so
+        the doubtful answers are sent to the main llm. By default, all the
+        answers are kept.
+        """
+        inpt = inpt  # unused
+        output = output  # unused
+        return True
+
+    def _timed_forward(
+        self,
+        inpt: DSPyInput,
+        tier: cascade.Tier,
+        recorder: cascade.CascadeRecorder,
+    ) -> DSPyOutput:
+        start = time.perf_counter()
+        output = prediction_to_output(
             self._output_constructor,
-            cast(dspy.Prediction, self.prompt_model_(**inpt.model_dump())),
+            self._cached_forward(**inpt.model_dump()),
         )
+        recorder.record_processing(tier, time.perf_counter() - start)
+        return output
+
+    def _llm_forward(
+        self, inpt: DSPyInput, recorder: cascade.CascadeRecorder
+    ) -> tuple[DSPyOutput, cascade.Tier]:
+        """Query the small llm, then the main one if its answer is doubtful.
+
+        It must be called in the dspy context of the main llm.
+        """
+        if self.small_llm_model_id is not None:
+            with dspy.settings.context(lm=self._infer_small_language_model()):
+                output = self._timed_forward(inpt, "small llm", recorder)
+            if self._is_confident(inpt, output):
+                return output, "small llm"
+        return self._timed_forward(inpt, "llm", recorder), "llm"
+
+    def _cascade_forward(
+        self,
+        recorder: cascade.CascadeRecorder,
+        program_input: dict,
+    ) -> dspy.Prediction:
+        """Forward through the tiers of the cascade and record the answering one."""
+        inpt = type(self._example[0])(**program_input)
+        output = self._resolve(inpt) if self.use_resolver else None
+        if output is not None:
+            tier: cascade.Tier = "resolver"
+        else:
+            output, tier = self._llm_forward(inpt, recorder)
+        recorder.record_answer(cast(str, joblib.hash(program_input)), tier)
+        return to_prediction(output)
+
+    def _start_cascade_recording(self) -> cascade.CascadeRecorder:
+        tier_models: dict[cascade.Tier, str] = {"llm": self.llm_model_id}
+        if self.small_llm_model_id is not None:
+            tier_models["small llm"] = self.small_llm_model_id
+        return cascade.CascadeRecorder(tier_models)
+
+    def _report_tiers(
+        self,
+        recorder: cascade.CascadeRecorder,
+        scores: dict[str, float] | None = None,
+    ):
+        """Log the share, the score and the cost of the tiers of the cascade.
+
+        The stats are saved in the tier_stats_ attribute.
+        """
+        self.tier_stats_ = recorder.stats(scores)
+        for stats in self.tier_stats_:
+            print_log(f"{self.field_to_be_extracted()}: {stats}")
 
     @override
     def predict(
         self,
         X: DataFrame[InputDataFrameWithKnowledge],
     ) -> DataFrame[DFOutput]:
-        """Generic transform operation."""
-        inputs = (
+        """Generic transform operation.
+
+        If the resolver is used, the interventions that it resolves are not
+        sent to the llm. If a small llm is set, the main llm only receives the
+        interventions whose answer of the small llm is doubtful. If a
+        checkpoint run is set, each prediction of the llm is saved as soon as
+        it is computed, and the ones already saved by a previous interrupted
+        run are restored instead of being predicted again. The llm is queried
+        with the other inputs sorted so the prompts sharing a prefix are sent
+        one after another (see the request_ordering module), but the output
+        rows follow the order of X.
+        """
+        inputs = [
             (InterventionId(row.Index), self._to_dspy_input(row))
             for row in self._itertuples(X)
-        )
-        with dspy.settings.context(lm=self._infer_language_model()):
-            return self._transform_dspy_output(
-                (
-                    intervention_id,
-                    self._typed_forward(inpt),
-                )
-                for intervention_id, inpt in tqdm.tqdm(
-                    inputs,
-                    total=len(X),
-                    desc="Field extraction",
-                    unit="processed intervention",
+        ]
+        outputs: dict[int, DSPyOutput] = {}
+        recorder = self._start_cascade_recording()
+        if self.use_resolver:
+            for position, (intervention_id, inpt) in enumerate(inputs):
+                output = self._resolve(inpt)
+                if output is not None:
+                    outputs[position] = output
+                    recorder.record_answer(str(intervention_id), "resolver")
+            print_log(
+                f"{len(outputs)}/{len(inputs)} interventions resolved "
+                "without the llm"
+            )
+        checkpoint = self._get_prediction_checkpoint()
+        # the fingerprint of the program is computed once for all the inputs
+        model_key = self._model_key() if checkpoint is not None else None
+        if checkpoint is not None:
+            restored = 0
+            for position, (intervention_id, inpt) in enumerate(inputs):
+                if position in outputs:
+                    continue
+                saved = checkpoint.load(
+                    intervention_id, model_key, inpt.model_dump()
                 )
+                if saved is not None:
+                    outputs[position] = self._output_constructor(**saved)
+                    restored += 1
+            print_log(
+                f"{restored}/{len(inputs)} predictions restored from the "
+                f"checkpoint {checkpoint.directory}"
             )
+        unresolved = [
+            position
+            for position in range(len(inputs))
+            if position not in outputs
+        ]
+        order = request_ordering.prefix_order(
+            self._prompt_contents(
+                [inputs[position][1] for position in unresolved]
+            )
+        )
+        with self._dspy_context():
+            for i in tqdm.tqdm(
+                order,
+                desc="Field extraction",
+                unit="processed intervention",
+            ):
+                position = unresolved[i]
+                intervention_id, inpt = inputs[position]
+                outputs[position], tier = self._llm_forward(inpt, recorder)
+                recorder.record_answer(str(intervention_id), tier)
+                if checkpoint is not None:
+                    checkpoint.save(
+                        intervention_id,
+                        model_key,
+                        inpt.model_dump(),
+                        outputs[position].model_dump(),
+                    )
+        self._report_tiers(recorder)
+        return self._transform_dspy_output(
+            (intervention_id, outputs[position])
+            for position, (intervention_id, _) in enumerate(inputs)
+        )
 
     @classmethod
     @abstractmethod
@@ -286,6 +643,14 @@ generically from dictionnary expansion
             for row in self._itertuples(X[X.index.isin(good_ids)])
         }
         answers = self._select_answers(y, set(inputs.keys()))
+        # the examples are evaluated in the order of the prefix caching
+        ids = list(inputs.keys())
+        ids = [
+            ids[position]
+            for position in request_ordering.prefix_order(
+                self._prompt_contents([inputs[id_] for id_ in ids])
+            )
+        ]
         kept_ids, examples = zip(
             *(
                 (
@@ -298,7 +663,7 @@ generically from dictionnary expansion
                         ).with_inputs(*model_input.keys())
                     )(inputs[id_].model_dump()),
                 )
-                for id_ in inputs.keys()
+                for id_ in ids
             )
         )
         return kept_ids, examples
@@ -314,12 +679,57 @@ generically from dictionnary expansion
             return result
         return result >= passable_treshold
 
+    def _get_evaluator(
+        self,
+        devset: tuple[dspy.Example, ...],
+        return_outputs: bool,
+        num_threads: int | None,
+    ):
+        return dspy.Evaluate(
+            devset=list(devset),
+            metric=self._dspy_metric,
+            return_outputs=return_outputs,
+            provide_traceback=True,  # TODO: remove it for traceback
+            num_threads=num_threads
+            if num_threads is not None
+            else self.eval_num_threads,
+            display_progress=True,
+            display_table=5,
+        )
+
+    def _evaluate(
+        self, devset: tuple[dspy.Example, ...], num_threads: int | None
+    ) -> tuple[float, EvalDetailedResult]:
+        """Evaluate the cascade over the devset and report its tiers."""
+        recorder = self._start_cascade_recording()
+        with self._dspy_context():
+            evaluator = self._get_evaluator(devset, True, num_threads)
+            score, score_table = cast(
+                tuple[float, EvalDetailedResult],
+                evaluator(
+                    lambda **program_input: self._cascade_forward(
+                        recorder, program_input
+                    )
+                ),
+            )
+        self._report_tiers(
+            recorder,
+            {
+                cast(
+                    str, joblib.hash(example.inputs().toDict())
+                ): example_score
+                for example, _, example_score in score_table
+            },
+        )
+        return score, score_table
+
     @override
     def score(
         self,
         X: DataFrame[InputDataFrameWithKnowledge],
         y: MagohDataset,
         sample_weight=None,
+        num_threads: int | None = None,
     ):
         """Run a local evaluation of the dpsy model over the given X dataset.
 
@@ -329,66 +739,48 @@ generically from dictionnary expansion
 
         To fit the sklearn Classifier interface, this method return a reduced
         floating metric value for the model.
+
+        Arguments:
+            X: the input dataframe with the required fields for the FieldExtractor
+            y: the Magoh evaluation dataset
+            sample_weight: unused
+            num_threads: if given, override the eval_num_threads parameter \
+for this run only
         """
         sample_weight = sample_weight  # unused
 
         _, devset = self._compute_devset(X, y)
 
-        with dspy.settings.context(lm=self._infer_language_model()):
-            evaluator = dspy.Evaluate(
-                devset=list(devset[1]),
-                metric=self._dspy_metric,
-                return_outputs=False,
-                provide_traceback=True,  # TODO: remove it for traceback
-                num_threads=1,  # TODO: set it
-                display_progress=True,
-                display_table=5,
-            )
-            score = cast(float, evaluator(self.prompt_model_))
+        score, _ = self._evaluate(devset, num_threads)
         return score
 
     @override
-    def score_and_transform(self, X, y):
+    def score_and_transform(self, X, y, num_threads=None):
         kept_ids, devset = self._compute_devset(X, y)
-        with dspy.settings.context(lm=self._infer_language_model()):
-            evaluator = dspy.Evaluate(
-                devset=list(devset),
-                metric=self._dspy_metric,
-                return_outputs=True,
-                provide_traceback=True,  # TODO: remove it for traceback
-                num_threads=1,  # TODO: set it
-                display_progress=True,
-                display_table=5,
-            )
-            score, score_table = cast(
-                tuple[float, EvalDetailedResult],
-                evaluator(self.prompt_model_),
-            )
-            return score, ResultSchema.validate(
-                pd.DataFrame(
-                    [
-                        {
-                            "id": id_,
-                            "field_name": self.field_to_be_extracted(),
-                            "metric_value": score,
-                            # TODO: specify the evaluation method
-                            "evaluation_method": "not specified yet",
-                            "expected_value": {
-                                k: ex_dict[k] for k in pred_dict
-                            },
-                            "predicted_value": pred_dict,
-                        }
-                        for id_, (ex_dict, pred_dict, score) in zip(
-                            kept_ids,
-                            (
-                                (ex.toDict(), pred.toDict(), score)
-                                for ex, pred, score in score_table
-                            ),
-                        )
-                    ]
-                ),
-                lazy=True,
-            )
+        score, score_table = self._evaluate(devset, num_threads)
+        return score, ResultSchema.validate(
+            pd.DataFrame(
+                [
+                    {
+                        "id": id_,
+                        "field_name": self.field_to_be_extracted(),
+                        "metric_value": score,
+                        # TODO: specify the evaluation method
+                        "evaluation_method": "not specified yet",
+                        "expected_value": {k: ex_dict[k] for k in pred_dict},
+                        "predicted_value": pred_dict,
+                    }
+                    for id_, (ex_dict, pred_dict, score) in zip(
+                        kept_ids,
+                        (
+                            (ex.toDict(), pred.toDict(), score)
+                            for ex, pred, score in score_table
+                        ),
+                    )
+                ]
+            ),
+            lazy=True,
+        )
 
     @staticmethod
     @abstractmethod
@@ -0,0 +1,236 @@
+"""Hedging of the llm requests against their tail latency.
+
+A request still running after a high percentile of the recent latencies of
+its llm (e.g. because of a preemption in vLLM or of a long queue) is
+duplicated, and the first answer of the two wins. The other request is then
+cancelled: the requests are coroutines run by a background event loop, so the
+cancellation closes the connection to the server, which stops generating, and
+releases the endpoint slot of the request at once.
+
+As the cancelled request never completes, the time saved by a winning
+duplicate is estimated from the tracked latencies of the llm: the original
+request would have lasted as long as the mean of the recorded latencies
+which exceed its elapsed time at the win.
+
+The duplicate does not wait for a slot of the endpoint of the original
+request, behind which it would be queued: it is sent to another endpoint if
+the llm is served by several ones, and outside the bound of in-flight
+requests otherwise.
+
+The hedging is enabled by setting the LLM_HEDGING_PERCENTILE environment
+variable (e.g. to 95). The latencies are tracked per llm client over a
+sliding window, and no request is hedged until this window has enough
+samples.
+
+The hedged requests are counted for the whole process (see the get_stats
+function), and for the requests sent in a dspy context with a recorder (see
+the recording function), e.g. the requests of one extractor while several
+extractors run concurrently.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Coroutine, Hashable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import AbstractContextManager
+from functools import cache
+from typing import Any, NamedTuple
+
+import dspy
+import numpy as np
+
+from ...config.env import getenv
+
+_LATENCY_WINDOW = 200
+_MIN_LATENCY_SAMPLES = 20
+
+
+class HedgingStats(NamedTuple):
+    """Counters of the hedged requests.
+
+    Arguments:
+        requests: the number of requests which could have been hedged
+        hedged: the number of requests duplicated after the threshold
+        hedge_wins: the number of hedged requests answered by the duplicate
+        cancelled: the number of losing requests cancelled before their \
+answer
+        saved_seconds: the estimated total duration saved by the winning \
+duplicates
+    """
+
+    requests: int
+    hedged: int
+    hedge_wins: int
+    cancelled: int
+    saved_seconds: float
+
+
+__lock = threading.Lock()
+__stats = HedgingStats(0, 0, 0, 0, 0.0)
+__latencies: dict[Hashable, deque[float]] = {}
+
+
+# the key of the recorder in the dspy settings, which are passed to the
+# threads of the evaluations
+_RECORDER_SETTING = "hedging_recorder"
+
+
+def _add(
+    stats: HedgingStats, increments: dict[str, int | float]
+) -> HedgingStats:
+    return HedgingStats._make(
+        value + increments.get(field, 0)
+        for field, value in zip(HedgingStats._fields, stats)
+    )
+
+
+class HedgingRecorder:
+    """Thread-safe counters of the hedged requests sent in a context."""
+
+    def __init__(self):
+        """Start the counters at zero."""
+        self._lock = threading.Lock()
+        self._stats = HedgingStats(0, 0, 0, 0, 0.0)
+
+    def count(self, **increments: int | float):
+        """Increment the counters."""
+        with self._lock:
+            self._stats = _add(self._stats, increments)
+
+    def stats(self) -> HedgingStats:
+        """Return the counters of the requests recorded so far."""
+        with self._lock:
+            return self._stats
+
+
+def recording(recorder: HedgingRecorder) -> AbstractContextManager[None]:
+    """Count in the recorder the requests sent in the dspy context block."""
+    return dspy.settings.context(**{_RECORDER_SETTING: recorder})
+
+
+def _count(recorder: HedgingRecorder | None, **increments: int | float):
+    global __stats
+    with __lock:
+        __stats = _add(__stats, increments)
+    if recorder is not None:
+        recorder.count(**increments)
+
+
+def get_hedging_percentile() -> float | None:
+    """Return the latency percentile after which a request is hedged.
+
+    None if the hedging is disabled.
+    """
+    percentile = getenv("LLM_HEDGING_PERCENTILE")
+    return float(percentile) if percentile else None
+
+
+@cache
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    # the requests of all the evaluation threads, with their duplicates
+    loop = asyncio.new_event_loop()
+    threading.Thread(
+        target=loop.run_forever, name="llm-hedging", daemon=True
+    ).start()
+    return loop
+
+
+def run_in_background[T](coroutine: Coroutine[Any, Any, T]) -> Future[T]:
+    """Run the coroutine in the event loop of the hedged requests.
+
+    Cancelling the returned future cancels the coroutine. The coroutine
+    does not see the dspy context of the caller.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_event_loop())
+
+
+def record_latency(client_key: Hashable, seconds: float):
+    """Add the latency of a request answered by the llm to its window."""
+    with __lock:
+        __latencies.setdefault(
+            client_key, deque(maxlen=_LATENCY_WINDOW)
+        ).append(seconds)
+
+
+def get_threshold(client_key: Hashable, percentile: float) -> float | None:
+    """Return the hedging delay of the llm, None if it is not known yet."""
+    with __lock:
+        latencies = list(__latencies.get(client_key, ()))
+    if len(latencies) < _MIN_LATENCY_SAMPLES:
+        return None
+    return float(np.percentile(latencies, percentile))
+
+
+def estimate_latency(client_key: Hashable, elapsed: float) -> float:
+    """Estimate the latency of a request still running after elapsed seconds.
+
+    It is the mean of the tracked latencies of the llm exceeding the elapsed
+    time, else the elapsed time itself.
+    """
+    with __lock:
+        slower = [
+            seconds
+            for seconds in __latencies.get(client_key, ())
+            if seconds > elapsed
+        ]
+    return float(np.mean(slower)) if slower else elapsed
+
+
+def hedged_call[T](
+    send: Callable[[str | None], tuple[str, Future[T]]],
+    client_key: Hashable,
+    percentile: float,
+) -> T:
+    """Send the request and duplicate it if it is slower than the threshold.
+
+    The latencies are not recorded here but by the sent requests, which know
+    if their answer comes from a cache.
+
+    Arguments:
+        send: the function sending the request in the background (see the \
+run_in_background function), given the endpoint to be avoided (the one of \
+the original request, for its duplicate), and returning the endpoint to \
+which the request is sent with the future of its answer
+        client_key: the identifier of the llm client, whose latencies are \
+tracked
+        percentile: the percentile of the latencies after which the request \
+is duplicated
+    """
+    # the recorder of the caller, as the futures complete in other threads
+    recorder = dspy.settings.get(_RECORDER_SETTING)
+    threshold = get_threshold(client_key, percentile)
+    _count(recorder, requests=1)
+    endpoint, primary = send(None)
+    # the latencies are measured once the request holds its slot
+    start = time.perf_counter()
+    if threshold is None:
+        return primary.result()
+    done, _ = wait([primary], timeout=threshold)
+    if done:
+        return primary.result()
+    _count(recorder, hedged=1)
+    _, hedge = send(endpoint)
+    done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+    first = primary if primary in done else hedge
+    other = hedge if first is primary else primary
+    if first.exception() is not None:
+        # the other request may still succeed
+        return other.result()
+    if other.cancel():
+        _count(recorder, cancelled=1)
+    if first is hedge:
+        elapsed = time.perf_counter() - start
+        _count(
+            recorder,
+            hedge_wins=1,
+            saved_seconds=estimate_latency(client_key, elapsed) - elapsed,
+        )
+    return first.result()
+
+
+def get_stats() -> HedgingStats:
+    """Return the counters of the hedged requests of the process."""
+    with __lock:
+        return __stats
@@ -1,8 +1,390 @@
-"""Module to load the language model provider."""
+"""Module to load the language model provider.
+
+The clients are shared in the process through a registry, so the extractors
+do not build a new client each time they query a llm (see the
+get_language_model function). As these clients live as long as the process,
+the history of their calls kept by dspy is bounded.
+
+The tokens consumed by the requests are counted for the whole process (see
+the get_total_token_usage function), and for the requests sent in a dspy
+context with a recorder (see the recording_token_usage function), e.g. the
+requests of one optimization while other extractors run concurrently.
+"""
+
+import copy
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Literal
 
 import dspy
 
 from ...config.env import getenv_or_throw, getenv
+from . import endpoint_router, hedging, request_ordering
+
+
+LLMProvider = Literal["vllm", "ollama", "openai"]
+
+_DEFAULT_MAX_IN_FLIGHT_REQUESTS = 8
+# the number of calls kept in the history of a client, for its inspection
+_HISTORY_SIZE = 100
+
+_endpoint_semaphores: dict[str, request_ordering.PrefixOrderedSemaphore] = {}
+_endpoint_semaphores_lock = threading.Lock()
+
+# the tokens consumed by the requests which are not answered from a cache,
+# per model identifier
+_token_usage: dict[str, int] = {}
+_token_usage_lock = threading.Lock()
+
+# the key of the token recorder in the dspy settings, which are passed to the
+# threads of the evaluations
+_TOKEN_RECORDER_SETTING = "token_usage_recorder"
+
+
+class TokenUsageRecorder:
+    """Thread-safe counter of the tokens consumed in a context."""
+
+    def __init__(self):
+        """Start the counter at zero."""
+        self._lock = threading.Lock()
+        self._tokens = 0
+
+    def count(self, tokens: int):
+        """Add the tokens of a request."""
+        with self._lock:
+            self._tokens += tokens
+
+    def total(self) -> int:
+        """Return the number of tokens recorded so far."""
+        with self._lock:
+            return self._tokens
+
+
+def recording_token_usage(
+    recorder: TokenUsageRecorder,
+) -> AbstractContextManager[None]:
+    """Count in the recorder the tokens of the requests sent in the block.
+
+    Only the requests which are not answered from a cache are counted.
+    """
+    return dspy.settings.context(**{_TOKEN_RECORDER_SETTING: recorder})
+
+
+def get_max_in_flight_requests() -> int:
+    """Return the maximum number of concurrent requests to one llm endpoint.
+
+    It is the capacity to be used as a number of threads by the evaluations.
+    """
+    return int(
+        getenv(
+            "LLM_MAX_IN_FLIGHT_REQUESTS", str(_DEFAULT_MAX_IN_FLIGHT_REQUESTS)
+        )
+    )
+
+
+def _get_endpoint_semaphore(
+    endpoint: str,
+) -> request_ordering.PrefixOrderedSemaphore:
+    """Return the process-wide semaphore bounding the requests to an endpoint.
+
+    The semaphores are kept at the module level and not in the LM clients, so
+    these clients stay picklable and all the clients bound to the same server
+    share the same bound. The waiting requests get the free slots in the
+    order of their prompts (see the request_ordering module).
+    """
+    with _endpoint_semaphores_lock:
+        if endpoint not in _endpoint_semaphores:
+            _endpoint_semaphores[endpoint] = (
+                request_ordering.PrefixOrderedSemaphore(
+                    get_max_in_flight_requests()
+                )
+            )
+        return _endpoint_semaphores[endpoint]
+
+
+class EndpointBoundedLM(dspy.LM):
+    """A dspy language model whose in-flight requests are bounded per endpoint.
+
+    Several evaluations can then run concurrently in threads without
+    overloading the llm server. The maximum number of in-flight requests per
+    endpoint is set with the LLM_MAX_IN_FLIGHT_REQUESTS environment variable
+    (default to 8).
+    """
+
+    def __init__(
+        self,
+        provider_name: LLMProvider,
+        model_id: str,
+        model: str,
+        endpoint: str,
+        **kwargs,
+    ):
+        """Initialize the dspy LM with the endpoint on which it is bound.
+
+        Arguments:
+            provider_name: the service from which the llm is fetched
+            model_id: the identifier of the llm in this service
+            model: the litellm model identifier
+            endpoint: the base url of the server answering the requests
+            kwargs: the other arguments of the dspy.LM constructor
+        """
+        super().__init__(model, **kwargs)
+        self.provider_name: LLMProvider = provider_name
+        self.model_id = model_id
+        self.endpoint = endpoint
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        """Send the request once a slot is free on the endpoint.
+
+        If the hedging is enabled (see the hedging module), a slow request is
+        duplicated, the first answer wins and the other request is cancelled.
+        """
+        # dspy appends each call to the history without limit, and the shared
+        # clients would otherwise keep all the prompts of the process
+        if len(self.history) > _HISTORY_SIZE:
+            del self.history[:-_HISTORY_SIZE]
+        percentile = hedging.get_hedging_percentile()
+        if percentile is None:
+            results = self._send(prompt, messages, kwargs)
+        else:
+            results = hedging.hedged_call(
+                lambda avoided: self._send_in_background(
+                    prompt, messages, kwargs, avoided
+                ),
+                (self.endpoint, self.model_id),
+                percentile,
+            )
+        usage = getattr(results, "usage", None)
+        if not getattr(results, "cache_hit", False) and usage is not None:
+            tokens = getattr(usage, "total_tokens", 0) or 0
+            with _token_usage_lock:
+                _token_usage[self.model_id] = (
+                    _token_usage.get(self.model_id, 0) + tokens
+                )
+            recorder = dspy.settings.get(_TOKEN_RECORDER_SETTING)
+            if recorder is not None:
+                recorder.count(tokens)
+        return results
+
+    def _acquire_endpoint(
+        self, prompt, messages, avoided: str | None = None
+    ) -> tuple[str, Callable[[bool], None]]:
+        """Wait for a slot on the endpoint of the request.
+
+        Arguments:
+            prompt: the prompt of the request
+            messages: the messages of the request
+            avoided: if given, the endpoint of the original request which \
+is duplicated; the duplicate is then sent without waiting for a slot
+
+        Returns:
+            The endpoint of the request and the function releasing its slot, \
+given whether the endpoint has answered
+        """
+        if avoided is not None:
+            return self.endpoint, lambda answered: None
+        semaphore = _get_endpoint_semaphore(self.endpoint)
+        semaphore.acquire(request_ordering.format_prompt(prompt, messages))
+        return self.endpoint, lambda answered: semaphore.release()
+
+    def _request_kwargs(self, endpoint: str, kwargs: dict) -> dict:
+        """Return the arguments of the request sent to the endpoint."""
+        endpoint = endpoint  # unused
+        return kwargs
+
+    def _send(self, prompt, messages, kwargs):
+        """Send one request to the endpoint."""
+        endpoint, release = self._acquire_endpoint(prompt, messages)
+        answered = True
+        try:
+            return dspy.LM.forward(
+                self,
+                prompt=prompt,
+                messages=messages,
+                **self._request_kwargs(endpoint, kwargs),
+            )
+        except Exception as e:
+            answered = not endpoint_router.is_endpoint_failure(e)
+            raise
+        finally:
+            release(answered)
+
+    def _send_in_background(
+        self, prompt, messages, kwargs, avoided: str | None
+    ) -> tuple[str, Future]:
+        """Send one request with the event loop of the hedged requests.
+
+        The latency of the request is recorded if it is answered by the llm.
+        The slot of the request is released as soon as it ends, even if it
+        is cancelled.
+
+        Arguments:
+            prompt: the prompt of the request
+            messages: the messages of the request
+            kwargs: the other arguments of the request
+            avoided: if given, the endpoint of the original request which \
+is duplicated
+        """
+        endpoint, release = self._acquire_endpoint(prompt, messages, avoided)
+        client_key = (self.endpoint, self.model_id)
+
+        async def send():
+            start = time.perf_counter()
+            answered = True
+            try:
+                results = await dspy.LM.aforward(
+                    self,
+                    prompt=prompt,
+                    messages=messages,
+                    **self._request_kwargs(endpoint, kwargs),
+                )
+            except Exception as e:
+                answered = not endpoint_router.is_endpoint_failure(e)
+                raise
+            finally:
+                release(answered)
+            if not getattr(results, "cache_hit", False):
+                hedging.record_latency(client_key, time.perf_counter() - start)
+            return results
+
+        return endpoint, hedging.run_in_background(send())
+
+    def __reduce__(self):
+        """Unpickle the client from the registry of the loading process.
+
+        Then, the clients of the estimators loaded by joblib are shared as the
+        others and the api keys are not saved with the pickled estimators.
+        """
+        return (
+            get_language_model,
+            (
+                self.provider_name,
+                self.model_id,
+                self.kwargs["temperature"],
+            ),
+        )
+
+    def __deepcopy__(self, memo):
+        """Copy all the attributes, as dspy.LM.copy and sklearn.clone expect it."""
+        new_instance = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new_instance
+        for k, v in self.__dict__.items():
+            setattr(new_instance, k, copy.deepcopy(v, memo))
+        return new_instance
+
+
+class RoutingLM(EndpointBoundedLM):
+    """A dspy language model whose requests are balanced over several servers.
+
+    Each request is sent to the least loaded healthy server, and the failing
+    servers are ejected for a while (see the endpoint_router module). The
+    in-flight requests are still bounded per server.
+    """
+
+    def __init__(
+        self,
+        provider_name: LLMProvider,
+        model_id: str,
+        model: str,
+        endpoints: Sequence[str],
+        prefix_affinity: bool = False,
+        **kwargs,
+    ):
+        """Initialize the dspy LM with the pool of servers.
+
+        Arguments:
+            provider_name: the service from which the llm is fetched
+            model_id: the identifier of the llm in this service
+            model: the litellm model identifier
+            endpoints: the base urls of the OpenAI-compatible servers \
+serving the same llm
+            prefix_affinity: if True, the requests sharing a prefix are \
+preferably sent to the same server, to reuse its KV-cache
+            kwargs: the other arguments of the dspy.LM constructor
+        """
+        super().__init__(
+            provider_name, model_id, model, ",".join(endpoints), **kwargs
+        )
+        self.endpoints = tuple(endpoints)
+        self.prefix_affinity = prefix_affinity
+
+    def _acquire_endpoint(
+        self, prompt, messages, avoided: str | None = None
+    ) -> tuple[str, Callable[[bool], None]]:
+        """Wait for a slot on the server chosen by the router.
+
+        The duplicate of a request is sent to another server if any, without
+        waiting for a slot.
+        """
+        router = endpoint_router.get_router(self.endpoints)
+        endpoint = router.acquire(
+            endpoint_router.affinity_key(prompt, messages)
+            if self.prefix_affinity
+            else None,
+            exclude=() if avoided is None else (avoided,),
+        )
+        if avoided is not None:
+            return endpoint, lambda answered: router.release(
+                endpoint, answered
+            )
+        semaphore = _get_endpoint_semaphore(endpoint)
+        try:
+            semaphore.acquire(
+                request_ordering.format_prompt(prompt, messages)
+            )
+        except BaseException:
+            router.release(endpoint, True)
+            raise
+
+        def release(answered: bool):
+            semaphore.release()
+            router.release(endpoint, answered)
+
+        return endpoint, release
+
+    def _request_kwargs(self, endpoint: str, kwargs: dict) -> dict:
+        """Return the arguments of the request sent to the server."""
+        return {**kwargs, "api_base": endpoint}
+
+
+def get_total_token_usage(model_id: str | None = None) -> int:
+    """Return the number of tokens consumed by all the clients of the process.
+
+    The requests answered from the cache of dspy are not counted.
+
+    Arguments:
+        model_id: if given, only the tokens consumed by this llm are counted
+    """
+    with _token_usage_lock:
+        if model_id is not None:
+            return _token_usage.get(model_id, 0)
+        return sum(_token_usage.values())
+
+
+_OPENAI_API_BASE_URL = "https://api.openai.com/v1"
+
+
+def _get_ollama_base_url():
+    return getenv("OLLAMA_SERVER_BASE_URL", "http://localhost:11434")
+
+
+def _get_vllm_base_urls() -> list[str]:
+    urls = getenv("VLLM_SERVER_BASE_URLS")
+    if urls:
+        return [url.strip() for url in urls.split(",") if url.strip()]
+    return [getenv("VLLM_SERVER_BASE_URL", "http://localhost:8006/v1")]
+
+
+def get_vllm_base_url() -> str:
+    """Return the base url of the (first) vllm server.
+
+    Environment requirements:
+        See the get_vllm_model function
+    """
+    return _get_vllm_base_urls()[0]
 
 
 def get_openai_model(model_id="gpt-4.1", temperature=0.0):
@@ -17,8 +399,11 @@ def get_openai_model(model_id="gpt-4.1", temperature=0.0):
     """
     api_key = getenv_or_throw("OPENAI_API_KEY")
 
-    return dspy.LM(
+    return EndpointBoundedLM(
+        "openai",
+        model_id,
         f"openai/{model_id}",
+        _OPENAI_API_BASE_URL,
         api_key=api_key,
         temperature=temperature
     )
@@ -35,11 +420,12 @@ def get_ollama_model(model_id="gemma3:27b", temperature=0.0):
         The OLLAMA_SERVER_BASE_URL envrionment variable can be defined to
         override the default ollama api's base url, served on http://localhost:11434
     """
-    ollama_server_base_url = getenv(
-        "OLLAMA_SERVER_BASE_URL", "http://localhost:11434"
-    )
-    return dspy.LM(
+    ollama_server_base_url = _get_ollama_base_url()
+    return EndpointBoundedLM(
+        "ollama",
+        model_id,
         f"ollama_chat/{model_id}",
+        ollama_server_base_url,
         api_base=ollama_server_base_url,
         api_key="",
         temperature=temperature,
@@ -56,13 +442,68 @@ def get_vllm_model(model_id="google/gemma-3-27b-it", temperature=0.0):
     Environment requirements:
         The VLLM_SERVER_BASE_URL envrionment variable can be defined to
         override the default ollama api's base url, served on http://localhost:8006/v1
+        The VLLM_SERVER_BASE_URLS environment variable can list several
+        comma-separated base urls of servers serving the same llm, over
+        which the requests are then balanced (see the RoutingLM class). The
+        LLM_ROUTING_PREFIX_AFFINITY environment variable set to 1 enables the
+        prefix affinity of the routing.
     """
-    vllm_server_base_url = getenv(
-        "VLLM_SERVER_BASE_URL", "http://localhost:8006/v1"
-    )
-    return dspy.LM(
+    vllm_server_base_urls = _get_vllm_base_urls()
+    if len(vllm_server_base_urls) > 1:
+        return RoutingLM(
+            "vllm",
+            model_id,
+            f"openai/{model_id}",
+            vllm_server_base_urls,
+            prefix_affinity=getenv("LLM_ROUTING_PREFIX_AFFINITY") == "1",
+            api_base=vllm_server_base_urls[0],
+            api_key="",
+            temperature=temperature,
+        )
+    vllm_server_base_url = vllm_server_base_urls[0]
+    return EndpointBoundedLM(
+        "vllm",
+        model_id,
         f"openai/{model_id}",
+        vllm_server_base_url,
         api_base=vllm_server_base_url,
         api_key="",
         temperature=temperature,
     )
+
+
+_registry: dict[tuple[LLMProvider, str, float, str], EndpointBoundedLM] = {}
+_registry_lock = threading.Lock()
+
+
+def get_language_model(
+    provider: LLMProvider, model_id: str, temperature: float
+) -> EndpointBoundedLM:
+    """Return the shared dspy language model client for the given llm.
+
+    The clients are built once per process and per (provider, model
+    identifier, temperature, base url of the server) and then reused. Only
+    the last calls are kept in their history.
+
+    Arguments:
+        provider: the service from which the llm must be fetched
+        model_id: the identifier of the llm in this service
+        temperature: the temperature of the model during its usage
+
+    Environment requirements:
+        See the get_openai_model, get_ollama_model and get_vllm_model functions
+    """
+    endpoint = {
+        "openai": lambda: _OPENAI_API_BASE_URL,
+        "ollama": _get_ollama_base_url,
+        "vllm": lambda: ",".join(_get_vllm_base_urls()),
+    }[provider]()
+    key = (provider, model_id, temperature, endpoint)
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = {
+                "openai": get_openai_model,
+                "ollama": get_ollama_model,
+                "vllm": get_vllm_model,
+            }[provider](model_id, temperature)
+        return _registry[key]
@@ -0,0 +1,133 @@
+"""Precomputed contexts given to the legacy extraction model.
+
+The legacy model prompts its llm with several views of the chunks of an
+intervention: all its chunks, those of the first pages (the incipit), those
+of the last pages, and those of both. They are rendered here once for all
+the interventions of a batch, with column-wise operations on the whole
+chunk dataset, and kept in the input of the model, so the forward calls of
+the evaluations and of the optimizations do not render them again.
+"""
+
+from typing import NamedTuple, cast
+
+import pandas
+
+from ....types.intervention_id import InterventionId
+from ....types.pdfchunks import (
+    PDFChunkDataset,
+    PDFChunkPerInterventionDataset,
+)
+from ....types.text_for_extractor import PDFChunkEnumeration
+from ...chunk_selector import max_selected_page_number
+
+_CHUNK_SEPARATOR = "`" + "-" * 60 + "`\n\n"
+
+
+class ContextViews(NamedTuple):
+    """The rendered chunks of an intervention, for each selection of pages.
+
+    Arguments:
+        full: all the chunks
+        incipit: the chunks of the first pages
+        end_pages: the chunks of the last pages
+        incipit_and_end_pages: the chunks of the first and the last pages
+    """
+
+    full: PDFChunkEnumeration
+    incipit: PDFChunkEnumeration
+    end_pages: PDFChunkEnumeration
+    incipit_and_end_pages: PDFChunkEnumeration
+
+
+def _render_chunks(chunks: pandas.DataFrame) -> "pandas.Series[str]":
+    """Render each chunk as in PDFChunkPerInterventionDataset."""
+    # the columns are typed as strings for the concatenation operators
+    return (
+        "`%% "
+        + cast("pandas.Series[str]", chunks["filename"].astype(str))
+        + " | Page "
+        + cast("pandas.Series[str]", chunks["chunk_page_position"].map(str))
+        + " ("
+        + cast(
+            "pandas.Series[str]",
+            chunks["chunk_type"].map(
+                lambda labels: str([str(label) for label in labels])
+            ),
+        )
+        + ") %%`\n\n"
+        + cast("pandas.Series[str]", chunks["chunk_content"])
+        + "\n\n"
+        + _CHUNK_SEPARATOR
+    )
+
+
+def compute_context_views(
+    chunks: PDFChunkDataset,
+) -> dict[InterventionId, ContextViews]:
+    """Render the context views of all the interventions of the dataset.
+
+    The chunks of each view keep their order in the dataset.
+    """
+    chunks_df = cast(pandas.DataFrame, chunks).reset_index(drop=True)
+    ids = chunks_df["id"]
+    rendered = _render_chunks(chunks_df)
+    pages = chunks_df["chunk_page_position"].explode().astype(int)
+    first_pages = pages.groupby(level=0).min()
+    last_pages = pages.groupby(level=0).max()
+    page_numbers_per_intervention = last_pages.groupby(ids).max()
+    total_page_numbers = ids.map(page_numbers_per_intervention)
+    selected_page_numbers = ids.map(
+        page_numbers_per_intervention.map(max_selected_page_number)
+    )
+    in_incipit = first_pages < selected_page_numbers
+    in_end_pages = last_pages > total_page_numbers - selected_page_numbers
+
+    def join_per_intervention(
+        selection: "pandas.Series[bool]",
+    ) -> "pandas.Series[str]":
+        return cast(
+            "pandas.Series[str]",
+            rendered[selection]
+            .groupby(ids[selection])
+            .agg("".join)
+            .reindex(ids.unique(), fill_value=""),
+        )
+
+    views = zip(
+        *(
+            join_per_intervention(selection)
+            for selection in (
+                pandas.Series(True, index=chunks_df.index),
+                in_incipit,
+                in_end_pages,
+                in_incipit | in_end_pages,
+            )
+        )
+    )
+    return {
+        InterventionId(int(id_)): ContextViews(*intervention_views)
+        for id_, intervention_views in zip(ids.unique(), views)
+    }
+
+
+class InterventionReport(PDFChunkPerInterventionDataset):
+    """Chunks of an intervention with their precomputed context views."""
+
+    def __init__(self, data, views: ContextViews) -> None:
+        """Wrap the chunks of the intervention with their views."""
+        super().__init__(data)
+        self.views = views
+
+    def to_readable_context_string(self) -> PDFChunkEnumeration:
+        """Return the precomputed rendering of all the chunks."""
+        return self.views.full
+
+
+def get_context_views(dataset: PDFChunkPerInterventionDataset) -> ContextViews:
+    """Return the precomputed views of the chunks, else compute them."""
+    if isinstance(dataset, InterventionReport):
+        return dataset.views
+    (views,) = compute_context_views(
+        cast(PDFChunkDataset, dataset.data.assign(id=0))
+    ).values()
+    return views
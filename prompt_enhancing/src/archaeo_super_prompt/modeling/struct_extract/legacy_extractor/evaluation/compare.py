@@ -13,12 +13,24 @@ from dspy.evaluate.metrics import answer_exact_match
 
 from .similarity_match import soft_accuracy
 
-from .smart_match_checking import check_date_with_LLM
+from .date_match import check_same_date
 
 
 MIN_VALUE = 0
 MAX_VALUE = 1
 
+SOFT_MATCH_THRESHOLD = 0.75
+# the fields compared with complex_match below, whose similarities can be
+# computed for all the records at once
+SOFT_MATCH_FIELDS = (
+    "university__Comune",
+    "university__Ubicazione",
+    "university__Indirizzo",
+    "university__Località",
+    "university__Estensione",
+    "building__Istituzione",
+)
+
 U, V = TypeVar("U"), TypeVar("V")
 
 
@@ -26,6 +38,7 @@ def _validate_magoh_data(
     answer: ExtractedStructuredDataSeries,
     pred: ExtractedStructuredDataSeries,
     trace=None,
+    soft_matches: dict[str, bool] | None = None,
 ) -> dict[str, float] | dict[str, bool]:
     def check_null[U, V](func: Callable[[U, V], bool]):
         def inner(e: U | None, p: V | None):
@@ -71,10 +84,11 @@ def _validate_magoh_data(
 
     @validate_type
     def complex_match(e: str, p: str):
-        TRESHOLD = 0.75
         # llm_check = check_with_LLM(TRESHOLD)
         # return llm_check(e, p, trace) == 1
-        similarity_check = soft_accuracy([e], [p], TRESHOLD)["matches"].item()
+        similarity_check = soft_accuracy([e], [p], SOFT_MATCH_THRESHOLD)[
+            "matches"
+        ].item()
         return similarity_check
 
     # unused
@@ -87,9 +101,10 @@ def _validate_magoh_data(
     neutral = neutral
 
     @validate_type
-    def date_compare(e: str, p: str):
-        # TODO: avoid LLM when the typing will be better
-        return check_date_with_LLM(e, p, trace) == 1
+    def date_compare(p: str, e: str):
+        # validate_type passes the prediction first; the llm only judges the
+        # dates which cannot be parsed
+        return check_same_date(e, p, trace) == 1
 
     pred_to_compare = pred
     metrics: dict[str, dict[str, Callable[[Any, Any], bool]]] = {
@@ -123,8 +138,11 @@ def _validate_magoh_data(
 
     f_metrics = flatten_dict(metrics)
 
+    soft_matches = soft_matches or {}
     metric_values: dict[str, bool] = {
-        key: f_metrics[key](answer[key], pred_to_compare[key])
+        key: soft_matches[key]
+        if key in soft_matches
+        else f_metrics[key](answer[key], pred_to_compare[key])
         for key in f_metrics
     }
 
@@ -192,6 +210,57 @@ def _is_prediction_valid(pred: Prediction) -> bool:
     return is_valid
 
 
+def _soft_matches_of_devset(
+    answers: list[dict[str, Any]], preds: list[dict[str, Any]]
+) -> list[dict[str, bool]]:
+    """Compute the soft matches of all the records, field per field.
+
+    The pairs with a null or a non-string value are not computed here but by
+    complex_match, which handles them.
+    """
+    soft_matches: list[dict[str, bool]] = [{} for _ in answers]
+    for field in SOFT_MATCH_FIELDS:
+        pairs = [
+            (i, answer[field], pred[field])
+            for i, (answer, pred) in enumerate(zip(answers, preds))
+            if isinstance(answer.get(field), str)
+            and isinstance(pred.get(field), str)
+        ]
+        if not pairs:
+            continue
+        positions, expected, predicted = zip(*pairs)
+        matches = soft_accuracy(
+            list(predicted), list(expected), SOFT_MATCH_THRESHOLD
+        )["matches"]
+        for i, match in zip(positions, matches):
+            soft_matches[i][field] = bool(match)
+    return soft_matches
+
+
+def validate_magoh_devset(
+    examples: list[Example], preds: list[Prediction], trace=None
+):
+    """Validate all the predictions of a devset at once.
+
+    Return the same metric values as validate_magoh_data for each record,
+    with the textual similarities computed in one pass per field.
+    """
+    valid = [_is_prediction_valid(pred) for pred in preds]
+    answers = [example.toDict() for example in examples]
+    pred_dicts = [pred.toDict() for pred in preds]
+    soft_matches = _soft_matches_of_devset(
+        [a for a, v in zip(answers, valid) if v],
+        [p for p, v in zip(pred_dicts, valid) if v],
+    )
+    valid_soft_matches = iter(soft_matches)
+    return [
+        _validate_magoh_data(answer, pred, trace, next(valid_soft_matches))
+        if is_valid
+        else _worst_metric_values(trace)
+        for answer, pred, is_valid in zip(answers, pred_dicts, valid)
+    ]
+
+
 def validate_magoh_data(example: Example, pred: Prediction, trace=None):
     """If the prediction is not valid, then return the dict with all metric values at MIN_VALUE or False."""
     if not _is_prediction_valid(pred):
@@ -0,0 +1,181 @@
+"""Deterministic comparison of the dates in the legacy evaluation.
+
+The expected and the predicted dates are parsed into the periods of days they
+cover, with the patterns of the normalization of the Magoh's intervention
+dates (e.g. "marzo 1985", "27 febbraio - 29 settembre 1981") and the numeric
+formats (e.g. "1985-03-18", "18/03/1985"). The predicted date matches if its
+period is included in the expected one: a prediction at least as precise as
+the expected value (e.g. "1985-03-18" for "1985") is correct, but a less
+precise one (e.g. "1985" for "1985-03-18") is not.
+
+Only the pairs of which a date cannot be parsed are judged by the llm, and
+its verdict is saved in the persistent response cache, so an evaluation
+never queries the llm twice for the same pair.
+"""
+
+import calendar
+import datetime
+import re
+import threading
+from typing import NamedTuple, cast
+
+import dspy
+
+from .....dataset.normalization.intervention_date import transforms
+from .....dataset.normalization.intervention_date.month_normalization import (
+    to_int_month,
+)
+from .....dataset.normalization.intervention_date.utils import (
+    Date,
+    DateProcessor,
+    InterventionDataForDateNormalizationRowSchema,
+)
+from ... import response_cache
+from .smart_match_checking import DateAssess, check_date_with_LLM
+
+type Period = tuple[datetime.date, datetime.date]
+
+# as in the normalization of the dataset
+_TRANSFORMS: tuple[DateProcessor, ...] = (
+    transforms.generic_period,
+    transforms.generic_single_period,
+    transforms.precised_numeric_start_date,
+)
+_ISO_PATTERN = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T].*)?")
+_NUMERIC_PATTERN = re.compile(r"(\d{1,2})[-.](\d{1,2})[-.](\d{4})")
+
+
+class DateMatchStats(NamedTuple):
+    """Counters of the date comparisons since the start of the process.
+
+    Arguments:
+        parsed: the number of pairs compared without the llm
+        llm_cached: the number of verdicts of the llm read from the cache
+        llm_calls: the number of pairs judged by the llm
+    """
+
+    parsed: int
+    llm_cached: int
+    llm_calls: int
+
+
+__lock = threading.Lock()
+__stats = DateMatchStats(0, 0, 0)
+
+
+def _count(**increments):
+    global __stats
+    with __lock:
+        __stats = DateMatchStats(
+            *(
+                value + increments.get(field, 0)
+                for field, value in zip(DateMatchStats._fields, __stats)
+            )
+        )
+
+
+def _to_date(d_m_y: str, last_day_of_month: bool) -> datetime.date:
+    day, month, year = d_m_y.split("/")
+    int_month, int_year = to_int_month(month), int(year)
+    # the normalization ends a month on its 28th day
+    int_day = (
+        calendar.monthrange(int_year, int_month)[1]
+        if last_day_of_month
+        else int(day)
+    )
+    return datetime.date(int_year, int_month, int_day)
+
+
+def parse_period(representation: str) -> Period | None:
+    """Return the first and the last days of the written date or period.
+
+    Return None if the representation does not match any supported pattern,
+    has no year or is not a valid date.
+    """
+    text = representation.strip().lower()
+    m = _ISO_PATTERN.fullmatch(text)
+    if m is None:
+        m = _NUMERIC_PATTERN.fullmatch(text)
+        groups = None if m is None else tuple(reversed(m.groups()))
+    else:
+        groups = m.groups()
+    if groups is not None:
+        year, month, day = map(int, groups)
+        try:
+            single_day = datetime.date(year, month, day)
+        except ValueError:
+            return None
+        return single_day, single_day
+    # the year of the record is unknown here, so it must be written
+    row = InterventionDataForDateNormalizationRowSchema(
+        idscheda=0,
+        data_protocollo="",
+        data_intervento=text,
+        anno=cast(int, None),
+        norm_duration=None,
+        norm_date=None,
+    )
+    for transform in _TRANSFORMS:
+        date = cast(Date | None, transform(row))
+        if date is None:
+            continue
+        try:
+            return (
+                _to_date(date.start_date, False),
+                _to_date(date.end_date, date.precision == "month"),
+            )
+        except Exception:
+            # e.g. a missing year ("None") or a wrong month
+            return None
+    return None
+
+
+def _includes(outer: Period, inner: Period):
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+
+def _llm_verdict(gold: str, pred: str) -> bool:
+    """Ask the llm if both dates are the same, with a persistent memo."""
+    lm = cast(dspy.LM, dspy.settings.lm)
+    key = response_cache.response_key(
+        response_cache.program_fingerprint(dspy.Predict(DateAssess)),
+        lm.model,
+        cast(float, lm.kwargs.get("temperature")),
+        (gold, pred),
+    )
+    cached_verdict = response_cache.load_response(key)
+    if cached_verdict is not None:
+        _count(llm_cached=1)
+        return cached_verdict["same_date"]
+    _count(llm_calls=1)
+    verdict = bool(check_date_with_LLM(gold, pred, trace=True))
+    response_cache.save_response(key, {"same_date": verdict})
+    return verdict
+
+
+def check_same_date(gold: str, pred: str, trace=None):
+    """Check if both representations define the same real date.
+
+    The predicted date must be at least as precise as the expected one. The
+    llm is queried only if one of the dates cannot be parsed.
+    """
+    gold_period, pred_period = parse_period(gold), parse_period(pred)
+    if gold_period is not None and pred_period is not None:
+        _count(parsed=1)
+        correct = _includes(gold_period, pred_period)
+    else:
+        correct = _llm_verdict(gold, pred)
+    return correct if trace is not None else int(correct)
+
+
+def get_stats() -> DateMatchStats:
+    """Return the counters of the date comparisons."""
+    with __lock:
+        return __stats
+
+
+def get_stats_since(before: DateMatchStats) -> DateMatchStats:
+    """Return the counters increments since a previous get_stats call."""
+    return DateMatchStats(
+        *(now - then for now, then in zip(get_stats(), before))
+    )
@@ -1,10 +1,15 @@
+from collections.abc import Callable
 import dspy
 
 import mlflow
 from pandas import DataFrame
 
 
-from .compare import validate_magoh_data, reduce_magoh_data_eval
+from .compare import (
+    reduce_magoh_data_eval,
+    validate_magoh_data,
+    validate_magoh_devset,
+)
 
 from .load_examples import DevSet
 
@@ -42,20 +47,52 @@ def measure_and_plot(active_run: mlflow.ActiveRun | None):
     return metric, run
 
 
-def get_evaluator(devset: DevSet, return_outputs=False):
+def get_evaluator(devset: DevSet, return_outputs=False, num_threads=1):
     # TODO: parametrize some settings
     evaluator = dspy.Evaluate(
         devset=devset,
         return_outputs=return_outputs,
         provide_traceback=True,  # TODO: remove it for traceback
-        num_threads=1,
+        num_threads=num_threads,
         display_progress=True,
         display_table=5,
     )
 
-    def evaluate(program: dspy.Module):
+    def evaluate(program: dspy.Module | Callable[..., dspy.Prediction]):
         metric, _ = measure_and_plot(None)
         results = evaluator(program, metric=metric)
         return results
 
     return evaluate
+
+
+def get_batch_evaluator(devset: DevSet, num_threads=1):
+    """Return an evaluation validating the predictions of the devset at once.
+
+    The programs are run as with the evaluator above, but the predictions are
+    validated after all the runs, with the textual similarities of a field
+    computed for all the records in one pass. The evaluation returns the
+    score in percent, as dspy, and the per-field metric values of each
+    record.
+    """
+    evaluator = dspy.Evaluate(
+        devset=devset,
+        return_outputs=True,
+        provide_traceback=True,  # TODO: remove it for traceback
+        num_threads=num_threads,
+        display_progress=True,
+        display_table=False,
+    )
+
+    def evaluate(program: dspy.Module | Callable[..., dspy.Prediction]):
+        # the metric is computed afterwards for the whole devset
+        _, results = evaluator(program, metric=lambda *_: 0.0)
+        examples = [example for example, _, _ in results]
+        preds = [pred for _, pred, _ in results]
+        metric_values = validate_magoh_devset(examples, preds)
+        score = sum(
+            reduce_magoh_data_eval(values) for values in metric_values
+        ) / max(len(metric_values), 1)
+        return round(100 * score, 2), list(zip(examples, preds, metric_values))
+
+    return evaluate
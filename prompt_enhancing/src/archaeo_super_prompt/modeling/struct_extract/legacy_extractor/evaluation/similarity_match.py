@@ -1,9 +1,23 @@
+"""Soft matching of textual fields by their TF-IDF cosine similarity.
+
+The TF-IDF vectorizer of a pair of texts is fitted on these two texts only,
+so the idf of a word is 1 if it is in both texts and 1 + ln(3/2) if it is in
+one of them. The cosine similarity of the two vectors then only depends on
+the counts of the words of both texts, which are computed for a whole batch
+of pairs with one vectorizer, instead of fitting one vectorizer per pair.
+"""
+
+import math
 from typing import TypedDict, cast
 import numpy as np
 import numpy.typing as npt
 import string
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+
+# the smoothed idf of a word in one of the 2 texts of a pair, as in the
+# default TfidfVectorizer; it is 1 for a word in both texts
+_SINGLE_TEXT_IDF = 1 + math.log(3 / 2)
 
 
 def preprocess(text: str):
@@ -18,23 +32,57 @@ class SoftAccuracyResult(TypedDict):
     matches: npt.NDArray[np.bool]
 
 
-def soft_accuracy(
-    predictions: list[str], references: list[str], threshold=0.75
-) -> SoftAccuracyResult:
-    assert len(predictions) == len(references), "Liste di lunghezza diversa!"
+def pair_similarities(
+    predictions: list[str], references: list[str]
+) -> npt.NDArray[np.floating]:
+    """Return the TF-IDF cosine similarity of each pair of texts.
 
+    The vectorizer of each pair is fitted on the two texts of the pair only.
+    The similarity is 0 if a text has no word.
+    """
+    if not predictions:
+        return np.zeros(0)
     preproc_preds = [preprocess(p) for p in predictions]
     preproc_refs = [preprocess(r) for r in references]
+    # the default tokenization of the TfidfVectorizer
+    vectorizer = CountVectorizer(dtype=np.float64)
+    try:
+        vectorizer.fit(preproc_preds + preproc_refs)
+    except ValueError:
+        # no word in any text
+        return np.zeros(len(predictions))
+    pred_counts = cast(csr_matrix, vectorizer.transform(preproc_preds))
+    ref_counts = cast(csr_matrix, vectorizer.transform(preproc_refs))
 
-    all_texts = preproc_preds + preproc_refs
-    vectorizer = TfidfVectorizer().fit(all_texts)
+    def squared_norms(counts: csr_matrix, other_counts: csr_matrix):
+        squared_counts = counts.multiply(counts)
+        shared = np.asarray(
+            squared_counts.multiply(other_counts > 0).sum(axis=1)
+        ).ravel()
+        total = np.asarray(squared_counts.sum(axis=1)).ravel()
+        return shared + _SINGLE_TEXT_IDF**2 * (total - shared)
 
-    pred_vecs = vectorizer.transform(preproc_preds)
-    ref_vecs = vectorizer.transform(preproc_refs)
+    dot_products = np.asarray(
+        pred_counts.multiply(ref_counts).sum(axis=1)
+    ).ravel()
+    norms = np.sqrt(
+        squared_norms(pred_counts, ref_counts)
+        * squared_norms(ref_counts, pred_counts)
+    )
+    return np.divide(
+        dot_products,
+        norms,
+        out=np.zeros(len(predictions)),
+        where=norms > 0,
+    )
+
+
+def soft_accuracy(
+    predictions: list[str], references: list[str], threshold=0.75
+) -> SoftAccuracyResult:
+    assert len(predictions) == len(references), "Liste di lunghezza diversa!"
 
-    similarities = cast(
-        np.ndarray, cosine_similarity(pred_vecs, ref_vecs)
-    ).diagonal()
+    similarities = pair_similarities(predictions, references)
     correct = similarities >= threshold
     return {
         "accuracy": np.mean(correct),
@@ -1,7 +1,14 @@
-"""DSPy module for the prompt-engineering extraction model."""
+"""DSPy module for the prompt-engineering extraction model.
 
-from typing import Any, TypedDict, cast
-from ...chunk_selector import select_end_pages, select_incipit
+The four sub-predictions of the model do not depend on each other, so they
+are requested concurrently, in the dspy context of the caller. Their
+durations are accumulated per sub-prediction for the whole process.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, TypedDict, cast
 from ....types.pdfchunks import (
     PDFChunkPerInterventionDataset,
 )
@@ -16,6 +23,8 @@ from ....types.target_types import (
     MagohDocumentBuildingData,
     MagohUniversityData,
 )
+from ..dspy_threads import in_dspy_context
+from .context_views import get_context_views
 from .signatures.arch_dictionnaries import (
     to_magoh_build_data,
     to_magoh_university_data,
@@ -28,6 +37,59 @@ from .signatures.arch_extract_type import (
 )
 
 
+class SubPredictionTiming(NamedTuple):
+    """Durations of one sub-prediction since the start of the process.
+
+    Arguments:
+        calls: the number of completed calls of the sub-prediction
+        total_seconds: the total duration of these calls
+        max_seconds: the duration of the slowest call
+    """
+
+    calls: int
+    total_seconds: float
+    max_seconds: float
+
+
+__lock = threading.Lock()
+__timings: dict[str, SubPredictionTiming] = {}
+
+
+def _record_timing(name: str, seconds: float):
+    with __lock:
+        calls, total, slowest = __timings.get(
+            name, SubPredictionTiming(0, 0.0, 0.0)
+        )
+        __timings[name] = SubPredictionTiming(
+            calls + 1, total + seconds, max(slowest, seconds)
+        )
+
+
+def get_timings() -> dict[str, SubPredictionTiming]:
+    """Return the durations of each sub-prediction."""
+    with __lock:
+        return dict(__timings)
+
+
+def get_timings_since(
+    before: dict[str, SubPredictionTiming],
+) -> dict[str, SubPredictionTiming]:
+    """Return the durations of the calls since a previous get_timings call.
+
+    The max_seconds field is the slowest call since the start of the process.
+    """
+    return {
+        name: SubPredictionTiming(
+            now.calls - then.calls,
+            now.total_seconds - then.total_seconds,
+            now.max_seconds,
+        )
+        for name, now in get_timings().items()
+        for then in (before.get(name, SubPredictionTiming(0, 0.0, 0.0)),)
+        if now.calls > then.calls
+    }
+
+
 class ExtractedInterventionData(TypedDict):
     """Intervention metadata as in the dataset."""
     university: MagohUniversityData
@@ -51,57 +113,68 @@ class ExtractDataFromInterventionReport(dspy.Module):
             ArchivalInformation
         )
 
+    def _timed_call(self, name: str, predictor: dspy.Module, **kwargs):
+        print_debug_log(f"Requesting {name}...")
+        start = time.perf_counter()
+        result = predictor(**kwargs)
+        _record_timing(name, time.perf_counter() - start)
+        return result
+
     def forward(self, document_ocr_scans__df: PDFChunkPerInterventionDataset):
         """Extract from the documents' text chunks the metadata."""
-        document_ocr_scans = (
-            document_ocr_scans__df.to_readable_context_string()
-        )
-        document_incipits = select_incipit(document_ocr_scans__df)
-        document_end_pages = select_end_pages(document_ocr_scans__df)
-        document_incipits_content = (
-            document_incipits.to_readable_context_string()
-        )
-        document_full_contextual_content = (
-            document_incipits + document_end_pages
-        ).to_readable_context_string()
+        views = get_context_views(document_ocr_scans__df)
+        document_ocr_scans = views.full
+        document_incipits_content = views.incipit
+        document_full_contextual_content = views.incipit_and_end_pages
 
         CONTEXT = """You are analysing a Italian official documents about an archaeological intervention and you are going to extract in Italian some information as the archivists in archaeology do."""
 
         ASSURANCE_CONTEXT = """I have mentionned some information as optional as a document can forget to mention it, then try to think if you can figure it out or if you have to answer nothing for these given fields. For the non optional field, you must answer something as the information is directly written in the content I'll give you."""
 
-        print_debug_log("Requesting document sources...")
-        document_source_data = cast(
-            SourceOfInformationInReport,
-            self.extract_report_sources(
-                context=CONTEXT + ASSURANCE_CONTEXT,
-                documents_contextual_content=document_full_contextual_content,
+        context = CONTEXT + ASSURANCE_CONTEXT
+        sub_predictions = {
+            "document sources": (
+                self.extract_report_sources,
+                dict(
+                    documents_contextual_content=document_full_contextual_content
+                ),
             ),
-        )
-        print_debug_log("Requesting archaeological intervention context...")
-        intervention_context = cast(
-            ArchaeologicalInterventionContext,
-            self.extract_intervention_context_data(
-                context=CONTEXT + ASSURANCE_CONTEXT,
-                documents_contextual_content=document_full_contextual_content,
+            "archaeological intervention context": (
+                self.extract_intervention_context_data,
+                dict(
+                    documents_contextual_content=document_full_contextual_content
+                ),
             ),
-        )
-        print_debug_log("Requesting archaeological intervention details...")
-        techinal_achievements = cast(
-            TechnicalInformation,
-            self.extract_intervention_technical_achievements(
-                context=CONTEXT + ASSURANCE_CONTEXT,
-                documents_full_content=document_ocr_scans,
+            "archaeological intervention details": (
+                self.extract_intervention_technical_achievements,
+                dict(documents_full_content=document_ocr_scans),
             ),
-        )
-
-        print_debug_log("Requesting document archival metadata...")
-        report_archival_metadata = cast(
-            ArchivalInformation,
-            self.extract_archival_metadata(
-                context=CONTEXT + ASSURANCE_CONTEXT,
-                documents_incipit=document_incipits_content,
+            "document archival metadata": (
+                self.extract_archival_metadata,
+                dict(documents_incipit=document_incipits_content),
             ),
-        )
+        }
+        with ThreadPoolExecutor(
+            max_workers=len(sub_predictions),
+            thread_name_prefix="legacy-sub-prediction",
+        ) as executor:
+            # each request is sent in the dspy context of the caller
+            futures = [
+                executor.submit(
+                    in_dspy_context(self._timed_call),
+                    name,
+                    predictor,
+                    context=context,
+                    **inputs,
+                )
+                for name, (predictor, inputs) in sub_predictions.items()
+            ]
+        (
+            document_source_data,
+            intervention_context,
+            techinal_achievements,
+            report_archival_metadata,
+        ) = (future.result() for future in futures)
 
         final_prediction: ExtractedInterventionData = {
             "university": to_magoh_university_data(
@@ -1,8 +1,16 @@
 """SKLearn Transformer for the first polyvalent extraction model."""
 
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 from typing import cast, override
 
-from dspy import Example, Prediction, dspy
+from dspy import Prediction, dspy
 
 import pandas
 from pandera.typing.pandas import DataFrame
@@ -11,13 +19,15 @@ from archaeo_super_prompt.modeling.types.detailed_evaluator import (
     DetailedEvaluatorMixin,
 )
 
-from .evaluation.compare import validate_magoh_data
+from .evaluation import date_match
 from ....types.results import ResultSchema
 
 from ....dataset.load import MagohDataset
-from ....config.debug_log import print_log
-from .evaluation.evaluate import get_evaluator
+from ....config.debug_log import forward_warning, print_log, print_warning
+from .evaluation.evaluate import get_batch_evaluator
 from .evaluation.load_examples import DevSet
+from . import extractor_module
+from .context_views import InterventionReport, compute_context_views
 from .extractor_module import (
     ExtractDataFromInterventionReport,
 )
@@ -26,10 +36,17 @@ from ....types.intervention_id import InterventionId
 
 from ....types.pdfchunks import (
     PDFChunkDataset,
+    PDFChunkDatasetSchema,
     PDFChunkPerInterventionDataset,
     PDFChunkSetPerInterventionSchema,
 )
-from ....types.structured_data import OutputStructuredDataSchema
+from ....types.structured_data import (
+    ExtractedStructuredDataSeries,
+    OutputStructuredDataSchema,
+)
+from .. import hedging, response_cache
+from ..dspy_threads import in_dspy_context
+from ..prediction_checkpoint import PredictionCheckpoint
 
 
 class MagohDataExtractor(
@@ -42,11 +59,40 @@ class MagohDataExtractor(
     It is a dspy model that can be trained and scored.
     """
 
-    def __init__(self, llm: dspy.LM) -> None:
-        """The main hyperparametre is the temperature of the llm model."""
+    def __init__(
+        self,
+        llm: dspy.LM,
+        eval_num_threads: int = 1,
+        bypass_response_cache: bool = False,
+        checkpoint_run: str | None = None,
+        predict_num_threads: int = 4,
+        prediction_timeout: float | None = None,
+    ) -> None:
+        """The main hyperparametre is the temperature of the llm model.
+
+        Arguments:
+            llm: the dspy language model client used for the extraction
+            eval_num_threads: the number of threads with which the \
+evaluations are run (can be overriden per run)
+            bypass_response_cache: if True, the llm is always queried, \
+without reading or writing in the persistent cache of the outputs
+            checkpoint_run: if given, the name of the run under which the \
+predictions are checkpointed on the disk; an interrupted predict call is \
+resumed with the same name
+            predict_num_threads: the number of interventions whose data are \
+extracted at the same time in a predict call
+            prediction_timeout: if given, the duration in seconds after which \
+the extraction of an intervention is given up in a predict call; its thread \
+is not interrupted but its answer is discarded
+        """
         super().__init__()
         self._module = ExtractDataFromInterventionReport()
         self.llm = llm
+        self.eval_num_threads = eval_num_threads
+        self.bypass_response_cache = bypass_response_cache
+        self.checkpoint_run = checkpoint_run
+        self.predict_num_threads = predict_num_threads
+        self.prediction_timeout = prediction_timeout
 
     @property
     def dspy_model(self):
@@ -54,14 +100,19 @@ class MagohDataExtractor(
         return self._module
 
     def compute_model_input(self, X: PDFChunkDataset):
-        """Transform the dataframe into an Iterable of input for the dspy module."""
+        """Transform the dataframe into an Iterable of input for the dspy module.
+
+        The context views of the interventions are rendered once for all the
+        batch (see the context_views module).
+        """
+        X = PDFChunkDataset(PDFChunkDatasetSchema.validate(X, lazy=True))
+        views = compute_context_views(X)
         return [
             (
                 id_,
-                PDFChunkPerInterventionDataset(
-                    PDFChunkSetPerInterventionSchema.validate(
-                        source, lazy=True
-                    ),
+                InterventionReport(
+                    cast(DataFrame[PDFChunkSetPerInterventionSchema], source),
+                    views[InterventionId(cast(int, id_))],
                 ),
             )
             for id_, source in X.groupby("id")
@@ -79,26 +130,226 @@ class MagohDataExtractor(
             for id_, model_input in self.compute_model_input(X)
         ]
 
+    def _model_key(self):
+        return (
+            self.llm.model,
+            self.llm.kwargs.get("temperature"),
+            response_cache.program_fingerprint(self._module),
+        )
+
+    def _checkpointed_forward_and_type(
+        self,
+        checkpoint: PredictionCheckpoint | None,
+        id_: InterventionId,
+        document_ocr_scans__df: PDFChunkPerInterventionDataset,
+    ):
+        """Load the saved prediction, or compute and checkpoint it."""
+        if checkpoint is None:
+            return self._forward_and_type(document_ocr_scans__df)
+        key = self._model_key()
+        saved = checkpoint.load(id_, key, document_ocr_scans__df.data)
+        if saved is not None:
+            return cast(ExtractedStructuredDataSeries, saved)
+        answer = self._forward_and_type(document_ocr_scans__df)
+        # the failed predictions are not saved, to be retried on a restart
+        if answer is not None:
+            checkpoint.save(id_, key, document_ocr_scans__df.data, answer)
+        return answer
+
+    def _cached_forward(
+        self, document_ocr_scans__df: PDFChunkPerInterventionDataset
+    ) -> Prediction:
+        """Forward on the dspy module, without querying the llm if the output is cached."""
+        if self.bypass_response_cache:
+            response_cache.count_bypass()
+            return cast(
+                Prediction,
+                self._module(document_ocr_scans__df=document_ocr_scans__df),
+            )
+        key = response_cache.response_key(
+            response_cache.program_fingerprint(self._module),
+            self.llm.model,
+            cast(float, self.llm.kwargs.get("temperature")),
+            document_ocr_scans__df.data,
+        )
+        cached_output = response_cache.load_response(key)
+        if cached_output is not None:
+            return Prediction(**cached_output)
+        prediction = cast(
+            Prediction,
+            self._module(document_ocr_scans__df=document_ocr_scans__df),
+        )
+        response_cache.save_response(key, prediction.toDict())
+        return prediction
+
+    def _forward_and_type(
+        self, document_ocr_scans__df: PDFChunkPerInterventionDataset
+    ):
+        """Cached forward wrapper for type safety."""
+        try:
+            result = self._cached_forward(document_ocr_scans__df)
+        except Exception as e:
+            forward_warning(e)
+            return None
+        return cast(ExtractedStructuredDataSeries, result.toDict())
+
+    @staticmethod
+    def _log_sub_prediction_timings(
+        before: dict[str, extractor_module.SubPredictionTiming],
+    ):
+        """Log the mean duration of each sub-prediction since before."""
+        for name, timing in extractor_module.get_timings_since(before).items():
+            print_log(
+                f"Sub-prediction '{name}': {timing.calls} calls, "
+                f"{timing.total_seconds / timing.calls:.2f}s on average"
+            )
+
+    def _time_before_next_timeout(self, start_times: list[float | None]):
+        """Return the delay before an extraction times out, if there is one."""
+        if self.prediction_timeout is None:
+            return None
+        now = time.monotonic()
+        # the extractions not started yet cannot time out before the
+        # timeout duration
+        return max(
+            0.0,
+            min(
+                (
+                    start + self.prediction_timeout - now
+                    for start in start_times
+                    if start is not None
+                ),
+                default=self.prediction_timeout,
+            ),
+        )
+
+    def _predict_all(
+        self,
+        checkpoint: PredictionCheckpoint | None,
+        model_inputs: list[
+            tuple[InterventionId, PDFChunkPerInterventionDataset]
+        ],
+    ) -> list[ExtractedStructuredDataSeries | None]:
+        """Extract the data of the interventions in parallel, in their order.
+
+        The answer of an intervention is None if its extraction has failed or
+        has timed out.
+        """
+        start_times: dict[int, float] = {}
+        lock = threading.Lock()
+
+        def forward(position: int, id_, model_input):
+            with lock:
+                start_times[position] = time.monotonic()
+            return self._checkpointed_forward_and_type(
+                checkpoint, id_, model_input
+            )
+
+        answers: list[ExtractedStructuredDataSeries | None] = [None] * len(
+            model_inputs
+        )
+        executor = ThreadPoolExecutor(
+            max_workers=self.predict_num_threads,
+            thread_name_prefix="legacy-predict",
+        )
+        pending: dict[Future, int] = {
+            executor.submit(
+                in_dspy_context(forward), position, id_, model_input
+            ): position
+            for position, (id_, model_input) in enumerate(model_inputs)
+        }
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=self._time_before_next_timeout(
+                    [start_times.get(p) for p in pending.values()]
+                ),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                position = pending.pop(future)
+                try:
+                    answers[position] = future.result()
+                except Exception as e:
+                    forward_warning(e)
+            if self.prediction_timeout is None:
+                continue
+            now = time.monotonic()
+            with lock:
+                timed_out = [
+                    (future, position)
+                    for future, position in pending.items()
+                    if position in start_times
+                    and now - start_times[position] >= self.prediction_timeout
+                ]
+            for future, position in timed_out:
+                del pending[future]
+                print_warning(
+                    f"The extraction of the intervention "
+                    f"{model_inputs[position][0]} has timed out"
+                )
+        # the threads of the timed out extractions are not waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+        return answers
+
     # TODO: code an optimization in overriding the fit method
 
     @override
     def predict(
         self, X: PDFChunkDataset
     ) -> DataFrame[OutputStructuredDataSchema]:
-        with dspy.settings.context(lm=self.llm):
-            answers = {
-                id_: answer
-                for id_, answer in {
-                    id_: self._module.forward_and_type(model_input)
-                    for id_, model_input in self.compute_model_input(X)
-                }.items()
+        """Extract the structured data of each intervention.
+
+        The interventions are extracted in parallel by a pool of
+        predict_num_threads threads. The interventions whose extraction has
+        failed or timed out have no row in the output, which keeps its
+        columns even when all the extractions have failed.
+
+        If a checkpoint run is set, each prediction is saved as soon as it is
+        computed, and the ones already saved by a previous interrupted run
+        are restored instead of being predicted again.
+        """
+        checkpoint = (
+            PredictionCheckpoint("legacy", self.checkpoint_run)
+            if self.checkpoint_run is not None
+            else None
+        )
+        hedging_recorder = hedging.HedgingRecorder()
+        timings_before = extractor_module.get_timings()
+        model_inputs = [
+            (InterventionId(cast(int, id_)), model_input)
+            for id_, model_input in self.compute_model_input(X)
+        ]
+        with (
+            dspy.settings.context(lm=self.llm),
+            hedging.recording(hedging_recorder),
+        ):
+            answers = [
+                (id_, answer)
+                for (id_, _), answer in zip(
+                    model_inputs, self._predict_all(checkpoint, model_inputs)
+                )
                 if answer is not None
-            }
-            ids, output_structured_data = zip(*answers.items())
+            ]
+            if hedging.get_hedging_percentile() is not None:
+                print_log(str(hedging_recorder.stats()))
+            self._log_sub_prediction_timings(timings_before)
+            if len(answers) < len(model_inputs):
+                print_warning(
+                    f"The extraction has failed for "
+                    f"{len(model_inputs) - len(answers)} of the "
+                    f"{len(model_inputs)} interventions"
+                )
             answer_df = pandas.DataFrame(
-                cast(list[dict], list(output_structured_data))
+                cast(list[dict], [answer for _, answer in answers]),
+                # the columns are kept when all the extractions have failed
+                columns=None
+                if answers
+                else list(OutputStructuredDataSchema.to_schema().columns),
+            )
+            answer_df["id"] = pandas.Series(
+                [id_ for id_, _ in answers], dtype=int
             )
-            answer_df["id"] = cast(list[InterventionId], list(ids))
             return OutputStructuredDataSchema.validate(
                 answer_df.astype(
                     {
@@ -111,7 +362,12 @@ class MagohDataExtractor(
             )
 
     @override
-    def score_and_transform(self, X: PDFChunkDataset, y: MagohDataset):
+    def score_and_transform(
+        self,
+        X: PDFChunkDataset,
+        y: MagohDataset,
+        num_threads: int | None = None,
+    ):
         """Run an evaluation of the dpsy model over the given X dataset.
 
         Return the per-field results for each test record in a dataframe.
@@ -123,37 +379,37 @@ class MagohDataExtractor(
 
         # The evaluator only enable to automate the standard workflow of dspy
         # for running evaluation inferences but this workflow is not suitable
-        # for a per-field evaluation
-        evaluate = get_evaluator(devset, return_outputs=True)
+        # for a per-field evaluation, so the predictions are validated
+        # afterwards for the whole devset
+        evaluate = get_batch_evaluator(
+            devset,
+            num_threads=num_threads
+            if num_threads is not None
+            else self.eval_num_threads,
+        )
         print_log("Tracing ready!\n")
+        timings_before = extractor_module.get_timings()
+        date_match_before = date_match.get_stats()
         with dspy.settings.context(lm=self.llm):
-            results = cast(
-                tuple[float, list[tuple[Example, Prediction, float]]],
-                evaluate(self._module),
-            )
+            score, results = evaluate(self._cached_forward)
+            self._log_sub_prediction_timings(timings_before)
+            print_log(str(date_match.get_stats_since(date_match_before)))
             return (
-                results[0],
+                score,
                 ResultSchema.validate(
                     pandas.DataFrame(
-                        sum(
-                            [
-                                [
-                                    {
-                                        "id": ex.get("id"),
-                                        "field_name": field,
-                                        "predicted_value": pred.get(field),
-                                        "expected_value": ex.get(field),
-                                        "evaluation_method": "not specified yet",  # TODO:
-                                        "metric_value": float(metric_value),
-                                    }
-                                    for field, metric_value in validate_magoh_data(
-                                        ex, pred
-                                    ).items()
-                                ]
-                                for ex, pred, _ in results[1]
-                            ],
-                            [],
-                        )
+                        [
+                            {
+                                "id": ex.get("id"),
+                                "field_name": field,
+                                "predicted_value": pred.get(field),
+                                "expected_value": ex.get(field),
+                                "evaluation_method": "not specified yet",  # TODO:
+                                "metric_value": float(metric_value),
+                            }
+                            for ex, pred, metric_values in results
+                            for field, metric_value in metric_values.items()
+                        ]
                     ),
                 ),
             )
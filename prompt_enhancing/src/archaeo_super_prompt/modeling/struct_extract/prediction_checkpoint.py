@@ -0,0 +1,74 @@
+"""Crash-safe checkpointing of the predictions of a long extraction run.
+
+Each prediction is saved on the disk as soon as it is computed, in its own
+file, written under a temporary name and then renamed, so a crash never
+leaves a partial prediction. Restarting the run with the same checkpoint
+name skips the interventions whose prediction is already saved, whatever
+the state of the response cache (e.g. for the runs bypassing it).
+
+A prediction is identified by the intervention, its input and the model
+(the llm and the state of the dspy program), so a checkpoint is not reused
+if the model or the input of an intervention has changed since.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, cast
+
+import joblib
+
+from ...utils.cache import get_cache_dir_for
+
+_CHECKPOINT_SUBDIR = "prediction_checkpoints"
+
+
+class PredictionCheckpoint:
+    """On-disk store of the predictions of a named run."""
+
+    def __init__(self, extractor_name: str, run_name: str):
+        """Open the store of the run, creating it if it does not exist.
+
+        Arguments:
+            extractor_name: the name of the extractor whose predictions are \
+saved, to separate the stores of the extractors of a same run
+            run_name: the name of the run, to be given again to resume it
+        """
+        self.directory = get_cache_dir_for(
+            "interim", f"{_CHECKPOINT_SUBDIR}/{extractor_name}/{run_name}"
+        )
+
+    def _path_of(self, intervention_id: int, model_key: Any, inpt: Any):
+        input_hash = cast(str, joblib.hash((model_key, inpt)))
+        return self.directory / f"{intervention_id}-{input_hash}.pkl"
+
+    def load(self, intervention_id: int, model_key: Any, inpt: Any):
+        """Return the saved prediction for this input, None if there is none.
+
+        Arguments:
+            intervention_id: the identifier of the intervention
+            model_key: any object hashable by joblib identifying the model
+            inpt: any object hashable by joblib with the input of the model
+        """
+        path = self._path_of(intervention_id, model_key, inpt)
+        if not path.exists():
+            return None
+        return joblib.load(path)
+
+    def save(
+        self, intervention_id: int, model_key: Any, inpt: Any, output: Any
+    ):
+        """Save atomically the prediction for this input.
+
+        See the load method for the arguments.
+        """
+        path = self._path_of(intervention_id, model_key, inpt)
+        tmp_path = path.with_suffix(
+            f".{os.getpid()}-{threading.get_ident()}.tmp"
+        )
+        joblib.dump(output, tmp_path)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        """Return the number of saved predictions."""
+        return sum(1 for _ in Path(self.directory).glob("*.pkl"))
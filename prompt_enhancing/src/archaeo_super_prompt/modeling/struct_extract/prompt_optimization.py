@@ -0,0 +1,284 @@
+"""Budgeted and resumable optimization of the prompts with MIPROv2.
+
+An optimization can be stopped by a wall-clock or a token budget. It is
+resumed by running it again with the same seed: the optimizer then replays
+the same trials, whose candidate-program evaluations are read from the
+persistent cache of the outputs (see response_cache.CachedProgram) and whose
+bootstrapping and instruction proposals are read from the cache of dspy. Only
+the trials which had not been evaluated yet query the llm.
+
+The budget is enforced by overriding private methods of MIPROv2, whose
+parameters are checked against the ones of the supported dspy version when
+the optimizer is built. Its tokens are those of the requests sent by the
+optimization only, even if other extractors query the llm at the same time.
+"""
+
+import inspect
+import random
+import time
+from collections import defaultdict
+from collections.abc import Hashable, Sequence
+from typing import NamedTuple
+
+import dspy
+from dspy.teleprompt.mipro_optimizer_v2 import AUTO_RUN_SETTINGS
+
+from ...config.debug_log import print_log
+from . import language_model as lm_provider_mod
+
+# the private methods of MIPROv2 overridden by BudgetedMIPROv2, with their
+# parameters in dspy 2.6
+_OVERRIDDEN_METHODS = {
+    "_bootstrap_fewshot_examples": (
+        "self",
+        "program",
+        "trainset",
+        "seed",
+        "teacher",
+    ),
+    "_propose_instructions": (
+        "self",
+        "program",
+        "trainset",
+        "demo_candidates",
+        "view_data_batch_size",
+        "program_aware_proposer",
+        "data_aware_proposer",
+        "tip_aware_proposer",
+        "fewshot_aware_proposer",
+    ),
+    "_optimize_prompt_parameters": (
+        "self",
+        "program",
+        "instruction_candidates",
+        "demo_candidates",
+        "evaluate",
+        "valset",
+        "num_trials",
+        "minibatch",
+        "minibatch_size",
+        "minibatch_full_eval_steps",
+        "seed",
+    ),
+    "_select_and_insert_instructions_and_demos": (
+        "self",
+        "candidate_program",
+        "instruction_candidates",
+        "demo_candidates",
+        "trial",
+        "trial_logs",
+        "trial_num",
+    ),
+}
+
+
+def _check_overridden_methods():
+    """Raise an error if the installed dspy changed the overridden methods."""
+    for name, parameters in _OVERRIDDEN_METHODS.items():
+        method = getattr(dspy.MIPROv2, name, None)
+        if (
+            method is None
+            or tuple(inspect.signature(method).parameters) != parameters
+        ):
+            raise RuntimeError(
+                f"MIPROv2.{name} of dspy {dspy.__version__} is not the one "
+                "overridden to enforce the optimization budget"
+            )
+
+
+class OptimizationBudget(NamedTuple):
+    """Limits after which no new optimization trial is started.
+
+    Arguments:
+        max_seconds: the maximum wall-clock duration of the optimization
+        max_tokens: the maximum number of tokens consumed by the llm \
+requests which are not answered from a cache
+    """
+
+    max_seconds: float | None = None
+    max_tokens: int | None = None
+
+
+class BudgetedMIPROv2(dspy.MIPROv2):
+    """MIPROv2 optimizer stopping its search once the budget is exhausted.
+
+    The budget is checked before the bootstrapping of the demos, before the
+    proposal of the instructions and at the start of each trial. Once it is
+    exhausted, the remaining steps are skipped and the best program found so
+    far is returned (the student itself if no trial has been run).
+    """
+
+    def __init__(self, *args, budget: OptimizationBudget, **kwargs):
+        """Initialize the MIPROv2 optimizer with a budget.
+
+        Arguments:
+            args: the positional arguments of MIPROv2
+            budget: the limits of the optimization
+            kwargs: the keyword arguments of MIPROv2
+        """
+        _check_overridden_methods()
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+        self._start_time = time.monotonic()
+        self._token_recorder = lm_provider_mod.TokenUsageRecorder()
+
+    def compile(self, student, **kwargs):
+        """Optimize the student program within the budget."""
+        self._start_time = time.monotonic()
+        self._token_recorder = lm_provider_mod.TokenUsageRecorder()
+        with lm_provider_mod.recording_token_usage(self._token_recorder):
+            return super().compile(student, **kwargs)
+
+    def is_budget_exhausted(self) -> bool:
+        """Return True if a limit of the budget has been reached."""
+        elapsed = time.monotonic() - self._start_time
+        used_tokens = self._token_recorder.total()
+        return (
+            self.budget.max_seconds is not None
+            and elapsed >= self.budget.max_seconds
+        ) or (
+            self.budget.max_tokens is not None
+            and used_tokens >= self.budget.max_tokens
+        )
+
+    def _bootstrap_fewshot_examples(self, program, trainset, seed, teacher):
+        if self.is_budget_exhausted():
+            print_log(
+                "Optimization budget exhausted, the demos are not bootstrapped"
+            )
+            return None
+        return super()._bootstrap_fewshot_examples(
+            program, trainset, seed, teacher
+        )
+
+    def _propose_instructions(
+        self,
+        program,
+        trainset,
+        demo_candidates,
+        view_data_batch_size,
+        program_aware_proposer,
+        data_aware_proposer,
+        tip_aware_proposer,
+        fewshot_aware_proposer,
+    ):
+        if self.is_budget_exhausted():
+            print_log(
+                "Optimization budget exhausted, the current instructions are "
+                "kept"
+            )
+            return {
+                i: [predictor.signature.instructions]
+                for i, predictor in enumerate(program.predictors())
+            }
+        return super()._propose_instructions(
+            program,
+            trainset,
+            demo_candidates,
+            view_data_batch_size,
+            program_aware_proposer,
+            data_aware_proposer,
+            tip_aware_proposer,
+            fewshot_aware_proposer,
+        )
+
+    def _optimize_prompt_parameters(
+        self,
+        program,
+        instruction_candidates,
+        demo_candidates,
+        evaluate,
+        valset,
+        num_trials,
+        minibatch,
+        minibatch_size,
+        minibatch_full_eval_steps,
+        seed,
+    ):
+        if self.is_budget_exhausted():
+            print_log(
+                "Optimization budget exhausted, the program is not optimized"
+            )
+            return program.deepcopy()
+        return super()._optimize_prompt_parameters(
+            program,
+            instruction_candidates,
+            demo_candidates,
+            evaluate,
+            valset,
+            num_trials,
+            minibatch,
+            minibatch_size,
+            minibatch_full_eval_steps,
+            seed,
+        )
+
+    def _select_and_insert_instructions_and_demos(
+        self,
+        candidate_program,
+        instruction_candidates,
+        demo_candidates,
+        trial,
+        trial_logs,
+        trial_num,
+    ):
+        if self.is_budget_exhausted():
+            print_log(
+                f"Optimization budget exhausted at the trial {trial_num}, "
+                "stopping after this one"
+            )
+            trial.study.stop()
+        return super()._select_and_insert_instructions_and_demos(
+            candidate_program,
+            instruction_candidates,
+            demo_candidates,
+            trial,
+            trial_logs,
+            trial_num,
+        )
+
+
+def get_valset_size(auto: str) -> int:
+    """Return the size of the validation set used by MIPROv2 in a run mode."""
+    return AUTO_RUN_SETTINGS[auto]["val_size"]
+
+
+def stratified_split[T](
+    examples: Sequence[T],
+    strata: Sequence[Hashable],
+    valset_size: int,
+    seed: int,
+) -> tuple[list[T], list[T]]:
+    """Split the examples into a training and a validation set.
+
+    Each stratum is represented in the validation set in the same proportion
+    as in the examples. The minibatches of the trials are still drawn at
+    random from this set by MIPROv2, without stratification.
+
+    Arguments:
+        examples: the examples to be split
+        strata: the stratum of each example (e.g. the class of its answer)
+        valset_size: the maximum size of the validation set; at least one \
+example is kept in the training set
+        seed: the seed of the shuffling
+    """
+    rng = random.Random(seed)
+    positions_per_stratum: dict[Hashable, list[int]] = defaultdict(list)
+    for position, stratum in enumerate(strata):
+        positions_per_stratum[stratum].append(position)
+    # systematic sampling: the examples of each stratum are spread over [0, 1)
+    ranks: list[tuple[float, int]] = []
+    for positions in positions_per_stratum.values():
+        rng.shuffle(positions)
+        offset = rng.random()
+        ranks.extend(
+            ((i + offset) / len(positions), position)
+            for i, position in enumerate(positions)
+        )
+    ranks.sort()
+    valset_size = min(valset_size, len(examples) - 1)
+    val_positions = {position for _, position in ranks[:valset_size]}
+    return (
+        [ex for i, ex in enumerate(examples) if i not in val_positions],
+        [ex for i, ex in enumerate(examples) if i in val_positions],
+    )
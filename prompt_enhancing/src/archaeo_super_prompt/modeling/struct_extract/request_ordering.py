@@ -0,0 +1,152 @@
+"""Ordering of the llm requests to take advantage of the prefix caching.
+
+vLLM reuses the KV-cache computed for the first tokens of a prompt if the same
+tokens start another prompt received soon after. The prompts are compared
+here as the adapter of dspy formats them: the instructions and the demos of a
+predictor come first, then the inputs of each intervention, in the order of
+the fields of the signature. When the prompts are sent in the lexicographic
+order, those sharing the longest prefixes (e.g. the same instructions and the
+same report fragments) are sent one after another, so the prefix is still in
+the cache of the server when it is reused.
+
+The requests are ordered at two levels:
+- an extractor sorts its inputs before querying the llm (see the
+  prompt_content and prefix_order functions)
+- the free slots of an endpoint are given to the waiting requests in the
+  order of their prompts (see the PrefixOrderedSemaphore class), whichever
+  extractor or sub-prediction (e.g. the four ones of the legacy model) sends
+  them, as the extractors are evaluated concurrently
+
+A request cannot be overtaken indefinitely by those with lower prompts: after
+a bounded number of slots given to others, it is served before them, so an
+extractor whose prompts sort first does not hold back the other ones.
+"""
+
+import heapq
+import itertools
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import cast
+
+import dspy
+from pydantic import BaseModel
+
+# the number of slots given to other requests after which the oldest waiting
+# request gets the next one, whatever its prompt
+_MAX_OVERTAKES = 32
+
+
+def format_prompt(prompt: str | None, messages: list[dict] | None) -> str:
+    """Return the text of a request to the llm, as sent to the server."""
+    if messages is None:
+        return prompt or ""
+    return "\n".join(str(message.get("content", "")) for message in messages)
+
+
+def prompt_content(
+    program: dspy.Module,
+    program_input: BaseModel,
+    adapter: dspy.Adapter | None = None,
+) -> str:
+    """Return the text of the first prompt sent by the program for the input.
+
+    Arguments:
+        program: the dspy program, whose first predictor gets the input
+        program_input: the input of the program
+        adapter: the adapter formatting the prompts, default to the one of \
+the dspy context
+    """
+    predictors = program.predictors()
+    if not predictors:
+        return program_input.model_dump_json()
+    predictor = cast(dspy.Predict, predictors[0])
+    adapter = adapter or dspy.settings.adapter or dspy.ChatAdapter()
+    try:
+        messages = adapter.format(
+            predictor.signature, predictor.demos, program_input.model_dump()
+        )
+    except Exception:
+        # the program transforms its input before its first predictor
+        return program_input.model_dump_json()
+    return format_prompt(None, messages)
+
+
+def prefix_order(prompt_contents: Sequence[str]) -> list[int]:
+    """Return the positions of the prompts in the order they must be sent.
+
+    The prompts sharing a prefix become contiguous in this order.
+    """
+    return sorted(
+        range(len(prompt_contents)), key=prompt_contents.__getitem__
+    )
+
+
+class PrefixOrderedSemaphore:
+    """Bounded slots given to the waiting requests in the order of prompts.
+
+    When a slot is released, the waiting request with the lowest prompt in
+    the lexicographic order gets it, instead of the oldest one. The requests
+    waiting at the same time are then sent grouped by prefix. Yet the oldest
+    waiting request gets the slot once it has been overtaken by max_overtakes
+    other requests.
+    """
+
+    def __init__(self, value: int, max_overtakes: int = _MAX_OVERTAKES):
+        """Initialize the semaphore.
+
+        Arguments:
+            value: the number of slots
+            max_overtakes: the number of slots given to other requests \
+after which a waiting request is served first
+        """
+        self._free = value
+        self._max_overtakes = max_overtakes
+        # the prompts of the waiting requests, the served ones being removed
+        # when they reach the top
+        self._prompts: list[tuple[str, int]] = []
+        # the number of grants at the arrival of each waiting request, in the
+        # order of the arrivals
+        self._waiting: dict[int, int] = {}
+        self._grants = 0
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    def _first(self) -> int:
+        """Return the ticket of the waiting request to be served next."""
+        oldest, grants_at_arrival = next(iter(self._waiting.items()))
+        if self._grants - grants_at_arrival >= self._max_overtakes:
+            return oldest
+        while self._prompts[0][1] not in self._waiting:
+            heapq.heappop(self._prompts)
+        return self._prompts[0][1]
+
+    def acquire(self, prompt: str):
+        """Wait for a slot, taken in the order of the prompts."""
+        with self._condition:
+            ticket = next(self._tickets)
+            heapq.heappush(self._prompts, (prompt, ticket))
+            self._waiting[ticket] = self._grants
+            self._condition.wait_for(
+                lambda: self._free > 0 and self._first() == ticket
+            )
+            del self._waiting[ticket]
+            self._grants += 1
+            self._free -= 1
+            # the next waiting request may take another free slot
+            self._condition.notify_all()
+
+    def release(self):
+        """Free a slot."""
+        with self._condition:
+            self._free += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, prompt: str) -> Iterator[None]:
+        """Hold a slot during the block."""
+        self.acquire(prompt)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,249 @@
+"""Persistent cache of the outputs of the llm-based dspy programs.
+
+An output is identified by a fingerprint of the state of the dspy program
+(its instructions and its demos, so a compiled prompt), the language model
+with its temperature, the input of the program and the version of the cache
+(see CACHE_VERSION). Then, re-running an inference or an evaluation with the
+same compiled prompt over the same inputs does not query again the llm.
+
+The cache is saved in the interim data directory and its size is bounded. The
+least recently accessed outputs are evicted first when the limit is exceeded.
+
+Environment variable:
+    LLM_RESPONSE_CACHE_BYTES_LIMIT can be set to override the maximum size of
+    the cache on the disk (default to 2G)
+"""
+
+import threading
+from typing import Any, NamedTuple, cast
+
+import dspy
+import joblib
+from joblib import Memory
+from joblib.memory import MemorizedFunc
+
+from ...config.env import getenv
+from ...utils.cache import (
+    get_cache_dir_for,
+    identity_function,
+    manually_cache_result,
+)
+
+_CACHE_SUBDIR = "llm_responses"
+# to be incremented when the saved outputs become wrong (e.g. after a fix of
+# the conversion of the outputs), so the previous ones are not read anymore
+# 2: the months of the intervention dates were shifted by one
+CACHE_VERSION = 2
+_DEFAULT_BYTES_LIMIT = "2G"
+# number of saved outputs between two checks of the size of the cache
+_EVICTION_PERIOD = 200
+
+type ResponseKey = str
+type CachedOutput = dict[str, Any]
+
+
+class ResponseCacheStats(NamedTuple):
+    """Counters of the cache lookups since the start of the process."""
+
+    hits: int
+    misses: int
+    bypassed: int
+
+
+# per cache directory, so the cache can be moved (e.g. by the tests)
+__memories: dict[str, tuple[Memory, MemorizedFunc]] = {}
+__lock = threading.Lock()
+__hits = 0
+__misses = 0
+__bypassed = 0
+__saves_since_eviction = 0
+
+
+def _llm_response(key: ResponseKey, output: CachedOutput | None = None):
+    return identity_function(key, output)
+
+
+def _get_memory() -> tuple[Memory, MemorizedFunc]:
+    location = str(get_cache_dir_for("interim", _CACHE_SUBDIR))
+    with __lock:
+        if location not in __memories:
+            memory = Memory(location, verbose=0)
+            __memories[location] = memory, cast(
+                MemorizedFunc, memory.cache(_llm_response, ignore=["output"])
+            )
+        return __memories[location]
+
+
+def _get_identity_function() -> MemorizedFunc:
+    return _get_memory()[1]
+
+
+def program_fingerprint(program: dspy.Module) -> str:
+    """Return a hash of the state of the dspy program (prompts and demos)."""
+    return cast(str, joblib.hash(program.dump_state()))
+
+
+def response_key(
+    program_fingerprint: str,
+    model_id: str,
+    temperature: float,
+    program_input: Any,
+) -> ResponseKey:
+    """Compute the identifier of an output in the cache.
+
+    Arguments:
+        program_fingerprint: the fingerprint of the dspy program, from the \
+program_fingerprint function
+        model_id: the identifier of the llm
+        temperature: the temperature of the llm
+        program_input: any object hashable by joblib with the input of the \
+dspy program (e.g. the dict of its keyword arguments)
+    """
+    return cast(
+        str,
+        joblib.hash(
+            (
+                CACHE_VERSION,
+                program_fingerprint,
+                model_id,
+                temperature,
+                program_input,
+            )
+        ),
+    )
+
+
+def load_response(key: ResponseKey) -> CachedOutput | None:
+    """Return the cached output related to the key, None if there is none."""
+    global __hits, __misses
+    identity = _get_identity_function()
+    output = (
+        cast(CachedOutput | None, identity(key))
+        if identity.check_call_in_cache(key)
+        else None
+    )
+    with __lock:
+        if output is None:
+            __misses += 1
+        else:
+            __hits += 1
+    return output
+
+
+def save_response(key: ResponseKey, output: CachedOutput):
+    """Save in the cache the output of the dspy program."""
+    global __saves_since_eviction
+    manually_cache_result(_get_identity_function(), key, output)
+    with __lock:
+        __saves_since_eviction += 1
+        must_evict = __saves_since_eviction >= _EVICTION_PERIOD
+        if must_evict:
+            __saves_since_eviction = 0
+    if must_evict:
+        reduce_size()
+
+
+def cached_call(
+    program: dspy.Module,
+    model_id: str,
+    temperature: float,
+    program_input: dict[str, Any],
+) -> dspy.Prediction:
+    """Forward on the dspy program, without querying the llm if cached.
+
+    Arguments:
+        program: the dspy program, whose state identifies the prompt
+        model_id: the identifier of the llm
+        temperature: the temperature of the llm
+        program_input: the keyword arguments of the forward of the program
+    """
+    key = response_key(
+        program_fingerprint(program), model_id, temperature, program_input
+    )
+    cached_output = load_response(key)
+    if cached_output is not None:
+        return dspy.Prediction(**cached_output)
+    prediction = cast(dspy.Prediction, program(**program_input))
+    save_response(key, prediction.toDict())
+    return prediction
+
+
+class CachedProgram(dspy.Module):
+    """Wrapper of a dspy program whose outputs are read from the cache.
+
+    The predictors of the wrapped program are exposed, so an optimizer can
+    tune them as usual, and each candidate program evaluated by it is cached
+    under its own fingerprint. Then, a resumed optimization does not query
+    the llm again for the evaluations it has already made.
+
+    The trace of the predictors is cached with the output and replayed on a
+    cache hit, so the few-shot bootstrapping still collects its demos. The
+    temperature of the key is the one of the current lm, as the
+    bootstrapping rounds use copies of the lm with other temperatures.
+    """
+
+    def __init__(self, program: dspy.Module, model_id: str):
+        """Wrap the program evaluated with the given llm."""
+        super().__init__()
+        self.program = program
+        self.model_id = model_id
+
+    def forward(self, **program_input) -> dspy.Prediction:
+        """Forward on the wrapped program through the cache."""
+        key = response_key(
+            f"{program_fingerprint(self.program)}/traced",
+            self.model_id,
+            cast(dspy.LM, dspy.settings.lm).kwargs["temperature"],
+            program_input,
+        )
+        predictors = dict(self.program.named_predictors())
+        cached_output = load_response(key)
+        if cached_output is None:
+            with dspy.settings.context(trace=[]):
+                prediction = cast(
+                    dspy.Prediction, self.program(**program_input)
+                )
+                names = {id(p): name for name, p in predictors.items()}
+                cached_output = {
+                    "output": prediction.toDict(),
+                    "trace": [
+                        (names[id(predictor)], inputs, pred.toDict())
+                        for predictor, inputs, pred in dspy.settings.trace
+                    ],
+                }
+            save_response(key, cached_output)
+        if dspy.settings.trace is not None:
+            dspy.settings.trace.extend(
+                (predictors[name], inputs, dspy.Prediction(**outputs))
+                for name, inputs, outputs in cached_output["trace"]
+            )
+        return dspy.Prediction(**cached_output["output"])
+
+
+def count_bypass():
+    """Record that the cache has been deliberately skipped for a prediction."""
+    global __bypassed
+    with __lock:
+        __bypassed += 1
+
+
+def reduce_size():
+    """Evict the least recently accessed outputs over the size limit."""
+    _get_memory()[0].reduce_size(
+        bytes_limit=getenv(
+            "LLM_RESPONSE_CACHE_BYTES_LIMIT", _DEFAULT_BYTES_LIMIT
+        )
+    )
+
+
+def get_stats() -> ResponseCacheStats:
+    """Return the hit/miss counters of the cache."""
+    with __lock:
+        return ResponseCacheStats(__hits, __misses, __bypassed)
+
+
+def reset_stats():
+    """Reset the hit/miss counters of the cache, e.g. before a new run."""
+    global __hits, __misses, __bypassed
+    with __lock:
+        __hits, __misses, __bypassed = 0, 0, 0
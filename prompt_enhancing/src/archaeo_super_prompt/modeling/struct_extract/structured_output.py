@@ -0,0 +1,187 @@
+"""Fast mode of the dspy programs, with a schema-constrained decoding.
+
+In the fast mode, the programs predict their outputs directly, without the
+free-text reasoning of a chain of thought, and the llm is asked to answer a
+JSON object whose schema is built from the pydantic models of the output
+fields. This schema is sent as the response_format of the OpenAI-compatible
+API, so a vLLM server generates only outputs that match it (guided
+decoding).
+
+The parse failures and the retries of the requests are counted for the whole
+process (see the get_stats function), and for the requests sent in a dspy
+context with a recorder (see the recording function), e.g. the requests of one
+extractor while several extractors run concurrently.
+"""
+
+import threading
+from contextlib import AbstractContextManager
+from typing import Any, NamedTuple
+
+import dspy
+import litellm
+from dspy.adapters.json_adapter import _get_structured_outputs_response_format
+from dspy.utils.exceptions import AdapterParseError
+
+
+class StructuredOutputStats(NamedTuple):
+    """Counters of the constrained requests."""
+
+    requests: int
+    parse_failures: int
+    retries: int
+
+
+__lock = threading.Lock()
+__requests = 0
+__parse_failures = 0
+__retries = 0
+
+
+# the key of the recorder in the dspy settings, which are passed to the
+# threads of the evaluations
+_RECORDER_SETTING = "structured_output_recorder"
+
+
+class StructuredOutputRecorder:
+    """Thread-safe counters of the constrained requests sent in a context."""
+
+    def __init__(self):
+        """Start the counters at zero."""
+        self._lock = threading.Lock()
+        self._stats = StructuredOutputStats(0, 0, 0)
+
+    def count(self, requests=0, parse_failures=0, retries=0):
+        """Increment the counters."""
+        with self._lock:
+            self._stats = StructuredOutputStats(
+                self._stats.requests + requests,
+                self._stats.parse_failures + parse_failures,
+                self._stats.retries + retries,
+            )
+
+    def stats(self) -> StructuredOutputStats:
+        """Return the counters of the requests recorded so far."""
+        with self._lock:
+            return self._stats
+
+
+def recording(
+    recorder: StructuredOutputRecorder,
+) -> AbstractContextManager[None]:
+    """Count in the recorder the requests sent in the dspy context block."""
+    return dspy.settings.context(**{_RECORDER_SETTING: recorder})
+
+
+def _count(requests=0, parse_failures=0, retries=0):
+    global __requests, __parse_failures, __retries
+    with __lock:
+        __requests += requests
+        __parse_failures += parse_failures
+        __retries += retries
+    recorder = dspy.settings.get(_RECORDER_SETTING)
+    if recorder is not None:
+        recorder.count(requests, parse_failures, retries)
+
+
+def make_predictor(
+    signature: type[dspy.Signature], fast_mode: bool
+) -> dspy.Module:
+    """Return the dspy predictor of the signature for the given mode.
+
+    Arguments:
+        signature: the signature of the predictor
+        fast_mode: if True, the outputs are predicted directly, else with a \
+chain of thought
+    """
+    if fast_mode:
+        return dspy.Predict(signature)
+    return dspy.ChainOfThought(signature)
+
+
+def supports_response_schema(lm: dspy.LM) -> bool:
+    """Return True if the api of the llm accepts a response_format."""
+    provider = lm.model.split("/", 1)[0] or "openai"
+    params = (
+        litellm.get_supported_openai_params(
+            model=lm.model, custom_llm_provider=provider
+        )
+        or []
+    )
+    return "response_format" in params
+
+
+class ConstrainedJSONAdapter(dspy.JSONAdapter):
+    """JSON adapter constraining the decoding with the schema of the outputs.
+
+    If the answer of the llm cannot be parsed (e.g. if it has been truncated
+    by the maximum number of tokens), the request is retried with the plain
+    JSON object mode, up to max_retries times. The original parse error is
+    raised if all the retries fail.
+    """
+
+    def __init__(self, max_retries: int = 1):
+        """Initialize the adapter.
+
+        Arguments:
+            max_retries: the maximum number of retries of a request whose \
+answer cannot be parsed
+        """
+        super().__init__()
+        self.max_retries = max_retries
+
+    def __call__(
+        self,
+        lm: dspy.LM,
+        lm_kwargs: dict[str, Any],
+        signature: type[dspy.Signature],
+        demos: list[dict[str, Any]],
+        inputs: dict[str, Any],
+    ) -> list[dict[str, Any]]:
+        """Send the request with the output schema and parse the answer."""
+        _count(requests=1)
+        response_formats: list[Any] = (
+            [_get_structured_outputs_response_format(signature)]
+            if supports_response_schema(lm)
+            else [{"type": "json_object"}]
+        )
+        response_formats += [{"type": "json_object"}] * self.max_retries
+        first_error: AdapterParseError | None = None
+        for attempt, response_format in enumerate(response_formats):
+            if attempt > 0:
+                _count(retries=1)
+            try:
+                # the base adapter, as the chat adapter falls back to the
+                # json one on any error
+                return dspy.Adapter.__call__(
+                    self,
+                    lm,
+                    {**lm_kwargs, "response_format": response_format},
+                    signature,
+                    demos,
+                    inputs,
+                )
+            except AdapterParseError as e:
+                _count(parse_failures=1)
+                first_error = first_error or e
+        assert first_error is not None
+        raise first_error
+
+
+def get_stats() -> StructuredOutputStats:
+    """Return the counters of the constrained requests."""
+    with __lock:
+        return StructuredOutputStats(__requests, __parse_failures, __retries)
+
+
+def get_stats_since(before: StructuredOutputStats) -> StructuredOutputStats:
+    """Return the counters increments since a previous get_stats call."""
+    return StructuredOutputStats(
+        *(now - then for now, then in zip(get_stats(), before))
+    )
+
+
+def reset_stats():
+    """Reset the counters, e.g. before a new run."""
+    global __requests, __parse_failures, __retries
+    with __lock:
+        __requests, __parse_failures, __retries = 0, 0, 0
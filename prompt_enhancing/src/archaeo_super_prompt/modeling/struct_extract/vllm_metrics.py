@@ -0,0 +1,115 @@
+"""Read the serving metrics of the vllm server to measure the prefix caching.
+
+vllm exposes its Prometheus metrics on the /metrics route of the server. Take
+a snapshot before and after a run, then compare them to get the prefix cache
+hit rate and the mean time to first token of the requests sent in between:
+
+    before = vllm_metrics.scrape_metrics()
+    extractor.predict(X)
+    print(vllm_metrics.compare(before, vllm_metrics.scrape_metrics()))
+"""
+
+import urllib.request
+from collections import defaultdict
+from typing import NamedTuple
+
+from .language_model import get_vllm_base_url
+
+# the counters have been renamed across the versions of vllm
+_PREFIX_CACHE_QUERIES_METRICS = (
+    "vllm:prefix_cache_queries_total",
+    "vllm:gpu_prefix_cache_queries_total",
+)
+_PREFIX_CACHE_HITS_METRICS = (
+    "vllm:prefix_cache_hits_total",
+    "vllm:gpu_prefix_cache_hits_total",
+)
+_TTFT_SUM_METRIC = "vllm:time_to_first_token_seconds_sum"
+_TTFT_COUNT_METRIC = "vllm:time_to_first_token_seconds_count"
+
+
+class VllmMetricsSnapshot(NamedTuple):
+    """Values of the cumulative vllm counters at one time."""
+
+    prefix_cache_queries: float
+    prefix_cache_hits: float
+    time_to_first_token_sum: float
+    request_count: float
+
+
+class VllmMetricsReport(NamedTuple):
+    """Prefix caching and latency of the requests between two snapshots."""
+
+    request_count: int
+    prefix_cache_hit_rate: float | None
+    mean_time_to_first_token: float | None
+
+
+def get_metrics_url(base_url: str | None = None) -> str:
+    """Return the url of the metrics of the vllm server.
+
+    Arguments:
+        base_url: the base url of the openai-compatible api of the server \
+(default to the VLLM_SERVER_BASE_URL env var)
+    """
+    base_url = (base_url or get_vllm_base_url()).rstrip("/")
+    base_url = base_url.removesuffix("/v1")
+    return f"{base_url}/metrics"
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """Sum the samples of each metric of a Prometheus text exposition."""
+    values: dict[str, float] = defaultdict(float)
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        name_and_labels, _, value = line.rpartition(" ")
+        name = name_and_labels.split("{", 1)[0]
+        try:
+            values[name] += float(value)
+        except ValueError:
+            continue
+    return dict(values)
+
+
+def _first_of(values: dict[str, float], names: tuple[str, ...]) -> float:
+    return next((values[name] for name in names if name in values), 0.0)
+
+
+def scrape_metrics(
+    base_url: str | None = None, timeout: float = 5.0
+) -> VllmMetricsSnapshot:
+    """Fetch the current values of the prefix cache and latency counters."""
+    with urllib.request.urlopen(
+        get_metrics_url(base_url), timeout=timeout
+    ) as response:
+        values = parse_metrics(response.read().decode())
+    return VllmMetricsSnapshot(
+        prefix_cache_queries=_first_of(values, _PREFIX_CACHE_QUERIES_METRICS),
+        prefix_cache_hits=_first_of(values, _PREFIX_CACHE_HITS_METRICS),
+        time_to_first_token_sum=values.get(_TTFT_SUM_METRIC, 0.0),
+        request_count=values.get(_TTFT_COUNT_METRIC, 0.0),
+    )
+
+
+def compare(
+    before: VllmMetricsSnapshot, after: VllmMetricsSnapshot
+) -> VllmMetricsReport:
+    """Compute the metrics of the requests between the two snapshots."""
+    queries = after.prefix_cache_queries - before.prefix_cache_queries
+    requests = after.request_count - before.request_count
+    return VllmMetricsReport(
+        request_count=int(requests),
+        prefix_cache_hit_rate=(
+            (after.prefix_cache_hits - before.prefix_cache_hits) / queries
+            if queries > 0
+            else None
+        ),
+        mean_time_to_first_token=(
+            (after.time_to_first_token_sum - before.time_to_first_token_sum)
+            / requests
+            if requests > 0
+            else None
+        ),
+    )
@@ -8,6 +8,7 @@ from archaeo_super_prompt.modeling.struct_extract.field_extractor import (
 )
 from .struct_extract.legacy_extractor.main_transformer import MagohDataExtractor
 from .struct_extract import language_model as lm_provider_mod
+from .struct_extract.prompt_optimization import OptimizationBudget
 
 from ..dataset.thesauri import load_comune
 from ..types.pdfpaths import PDFPathDataset
@@ -29,12 +30,26 @@ class ExtractionDAGParts(NamedTuple):
     final_component: tuple[DAGComponent, list[DAGComponent]]
 
 
-def get_training_dag(include_legacy: bool = False) -> ExtractionDAGParts:
+def get_training_dag(
+    include_legacy: bool = False,
+    eval_num_threads: int = 1,
+    fast_mode: bool = False,
+    small_llm_model_id: str | None = None,
+) -> ExtractionDAGParts:
     """Return the most advanced pre-processing DAG for the model.
 
     All its estimators and transformers are initialized with particular
     parametres.
 
+    Arguments:
+        include_legacy: if True, the legacy extractor is added to the extractors
+        eval_num_threads: the default number of evaluation threads of each \
+extractor
+        fast_mode: if True, the field extractors predict their outputs \
+directly with a schema-constrained decoding, for a higher throughput
+        small_llm_model_id: if given, the field extractors query first this \
+smaller llm and only escalate their doubtful answers to the main llm
+
     Return:
         A part of the complete DAG for getting the pre-processed data.
         The field extractors related to their parent node, to apply on these extractors special training or evaluation operations or to bind them to the preprocessing dag
@@ -42,7 +57,7 @@ def get_training_dag(include_legacy: bool = False) -> ExtractionDAGParts:
         in inference mode.
     """
     llm_model_id = "google/gemma-3-27b-it"
-    llm_provider = "vllm"
+    llm_provider: lm_provider_mod.LLMProvider = "vllm"
     llm_model_temp = 0.05
 
     vllm = DAGComponent(
@@ -85,11 +100,25 @@ def get_training_dag(include_legacy: bool = False) -> ExtractionDAGParts:
     )
     intervention_date_extractor = DAGComponent(
         "interv-start-Extractor",
-        InterventionStartExtractor(llm_provider, llm_model_id, llm_model_temp),
+        InterventionStartExtractor(
+            llm_provider,
+            llm_model_id,
+            llm_model_temp,
+            eval_num_threads,
+            fast_mode=fast_mode,
+            small_llm_model_id=small_llm_model_id,
+        ),
     )
     comune_extractor = DAGComponent(
         "comune-Extractor",
-        ComuneExtractor(llm_provider, llm_model_id, llm_model_temp),
+        ComuneExtractor(
+            llm_provider,
+            llm_model_id,
+            llm_model_temp,
+            eval_num_threads,
+            fast_mode=fast_mode,
+            small_llm_model_id=small_llm_model_id,
+        ),
     )
     comune_chunk_filter = DAGComponent(
         "comune-CF",
@@ -144,14 +173,14 @@ def get_training_dag(include_legacy: bool = False) -> ExtractionDAGParts:
     ]
 
     if include_legacy:
-        lm_getter = {
-            "vllm": lm_provider_mod.get_vllm_model,
-            "ollama": lm_provider_mod.get_ollama_model,
-            "openai": lm_provider_mod.get_openai_model,
-        }[llm_provider]
         legacy_extractor = DAGComponent(
             "legacy-Extractor",
-            MagohDataExtractor(lm_getter(llm_model_id, llm_model_temp)),
+            MagohDataExtractor(
+                lm_provider_mod.get_language_model(
+                    llm_provider, llm_model_id, llm_model_temp
+                ),
+                eval_num_threads,
+            ),
         )
         extraction_part.append((legacy_extractor, vllm))
         final_dependencies.append(legacy_extractor)
@@ -161,17 +190,36 @@ def get_training_dag(include_legacy: bool = False) -> ExtractionDAGParts:
     return ExtractionDAGParts(preprocessing_part, extraction_part, final_part)
 
 
+def _get_model_store_path(component_id: str, fast_mode: bool):
+    # the programs of the fast mode do not have the same predictors
+    suffix = "-fast" if fast_mode else ""
+    return get_model_store_dir() / f"{component_id}{suffix}.json"
+
+
 def train_from_scratch(
     training_input: PDFPathDataset,
     ds: MagohDataset,
     include_legacy: bool = False,
+    optimization_budget: OptimizationBudget | None = None,
+    fast_mode: bool = False,
 ) -> ExtractionDAGParts:
     """Return the most advanced DAG model, fitted from the data.
 
     Apply a training for each FieldExtractor model.
+
+    Arguments:
+        training_input: the pdf files of the training records
+        ds: the Magoh training dataset
+        include_legacy: if True, the legacy extractor is also in the DAG
+        optimization_budget: the wall-clock or token limits of the prompt \
+optimization of each FieldExtractor; an interrupted training is resumed by \
+calling this function again
+        fast_mode: if True, the field extractors are built and trained in \
+fast mode (see get_training_dag); their programs are saved apart from the \
+ones of the normal mode
     """
     preprocessing_part, extraction_part, final_part = get_training_dag(
-        include_legacy=include_legacy
+        include_legacy=include_legacy, fast_mode=fast_mode
     )
     preprocess_pipeline = preprocessing_part.make_dag()
     preprocessed_inputs = preprocess_pipeline.fit_transform(training_input, ds)
@@ -180,9 +228,14 @@ def train_from_scratch(
         if isinstance(field_extractor, str):
             # impossible
             continue
-        field_extractor.fit(preprocessed_inputs[dep.component_id], ds)
+        # the models without prompt optimization ignore the budget
+        field_extractor.fit(
+            preprocessed_inputs[dep.component_id],
+            ds,
+            optimization_budget=optimization_budget,
+        )
         field_extractor.prompt_model_.save(
-            get_model_store_dir() / f"{fe_component.component_id}.json"
+            _get_model_store_path(fe_component.component_id, fast_mode)
         )
     return ExtractionDAGParts(preprocessing_part, extraction_part, final_part)
 
@@ -191,14 +244,15 @@ def get_fitted_model(
     training_input: PDFPathDataset,
     ds: MagohDataset,
     include_legacy: bool = False,
+    fast_mode: bool = False,
 ):
     """Return the most advanced DAG model, mockly fitted from the data.
 
     The FieldExtractor model are supposed already fitted from saved dspy
-    models in get_model_store_dir() path.
+    models in get_model_store_dir() path, in the same mode as fast_mode.
     """
     preprocessing_part, extraction_part, final_part = get_training_dag(
-        include_legacy=include_legacy
+        include_legacy=include_legacy, fast_mode=fast_mode
     )
     preprocess_pipeline = preprocessing_part.make_dag()
     preprocessed_inputs = preprocess_pipeline.fit_transform(training_input, ds)
@@ -210,8 +264,9 @@ def get_fitted_model(
         field_extractor.fit(
             preprocessed_inputs[dep.component_id],
             ds,
-            compiled_dspy_model_path=get_model_store_dir()
-            / f"{fe_component.component_id}.json",
+            compiled_dspy_model_path=_get_model_store_path(
+                fe_component.component_id, fast_mode
+            ),
         )
     return ExtractionDAGParts(preprocessing_part, extraction_part, final_part)
 
@@ -20,7 +20,10 @@ class DetailedEvaluatorMixin[InputBatch, TargetDataSet, EvaluationDetail](
     def fit(self, X: InputBatch, y: TargetDataSet, **kwargs):
         """Train the model with the given targey data.
 
-        Override it to implement a training.
+        Override it to implement a training. The keyword arguments are the
+        options of the trainings of all the models (e.g. the
+        optimization_budget of the FieldExtractor models); a model ignores
+        those it does not use.
         """
         kwargs = kwargs  # unused
         X = X  # unused
@@ -45,7 +48,7 @@ class DetailedEvaluatorMixin[InputBatch, TargetDataSet, EvaluationDetail](
 
     @abstractmethod
     def score_and_transform(
-        self, X: InputBatch, y: TargetDataSet
+        self, X: InputBatch, y: TargetDataSet, num_threads: int | None = None
     ) -> tuple[float, EvaluationDetail]:
         """Run an evaluation and return the score with the detailed results.
 
@@ -55,6 +58,8 @@ class DetailedEvaluatorMixin[InputBatch, TargetDataSet, EvaluationDetail](
         Arguments:
             X: the input batch
             y: the dataset with the target data related to the inputs 
+            num_threads: if given, the number of threads for running the \
+evaluation, else the default one of the model
 
         Return:
             a floating global score
@@ -15,12 +15,8 @@ _CACHE_DIR = (Path(__file__).parent / "../../../data/").resolve()
 
 CacheSubpart = Literal["external", "interim", "processed", "raw"]
 
-_memories: dict[CacheSubpart, Memory] = {
-    k: Memory(str(_CACHE_DIR / k), verbose=0)
-    for k in cast(
-        tuple[CacheSubpart, ...], ("external", "interim", "processed")
-    )
-}
+# per cache directory, so the data directory can be moved (e.g. by the tests)
+_memories: dict[Path, Memory] = {}
 
 
 def get_cache_dir_for(cache_subpart: CacheSubpart, subpart: str):
@@ -33,7 +29,10 @@ def get_cache_dir_for(cache_subpart: CacheSubpart, subpart: str):
 
 def get_memory_for(cache_subpart: CacheSubpart):
     """Get the joblib cache memory related to a subpath of the "/data" directory."""
-    return _memories[cache_subpart]
+    location = _CACHE_DIR / cache_subpart
+    if location not in _memories:
+        _memories[location] = Memory(str(location), verbose=0)
+    return _memories[location]
 
 
 ## Manual caching
@@ -65,6 +64,9 @@ by the module. The funtion must ignore the output argument in the caching
         output: the value to be saved in the cache
     """
     identity_function.call(input, output)
+    # joblib records the code of the function at the first check of a new
+    # cache only, without which the saved call is not found
+    identity_function.check_call_in_cache(input)
 
 
 HashedT = TypeVar("HashedT")
@@ -0,0 +1,13 @@
+"""Shared fixtures of the tests."""
+
+import pytest
+
+from archaeo_super_prompt.utils import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Redirect the data directory of the caches to a temporary one."""
+    data_dir = tmp_path / "data"
+    monkeypatch.setattr(cache, "_CACHE_DIR", data_dir)
+    return data_dir
@@ -16,14 +16,18 @@ from archaeo_super_prompt.utils.cache import (
 )
 
 
-@get_memory_for("external").cache(ignore=["output"])
-def dummy_id_func(input: str, output: int | None = None):
+def _dummy_id_func(input: str, output: int | None = None):
     """Identity function for caching the outputs for each element of the batch."""
     return identity_function(input, output)
 
 
 def test_cache():
     """Test the manual cache mechanism."""
+    # cached in the data directory of the test
+    dummy_id_func = cast(
+        MemorizedFunc,
+        get_memory_for("external").cache(_dummy_id_func, ignore=["output"]),
+    )
     already_processed_input_set = set()
 
     def expensive_function(input: str):
@@ -36,8 +40,8 @@ def test_cache():
     inpts = ("hello", "bonsoir", "foo", "bar")
     for inpt in inpts:
         otpt = expensive_function(inpt)
-        manually_cache_result(cast(MemorizedFunc, dummy_id_func), inpt, otpt)
-        assert is_input_in_the_cache(cast(MemorizedFunc, dummy_id_func), inpt)
+        manually_cache_result(dummy_id_func, inpt, otpt)
+        assert is_input_in_the_cache(dummy_id_func, inpt)
         cached_opt = dummy_id_func(inpt)
         assert cached_opt == otpt
 
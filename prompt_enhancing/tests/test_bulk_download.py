@@ -0,0 +1,196 @@
+"""Test the bulk download of the PDF files from the bucket."""
+
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from archaeo_super_prompt.dataset import minio_engine
+
+
+class _FakeResponse:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def stream(self, chunk_size):
+        for start in range(0, len(self._data), chunk_size):
+            yield self._data[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class _FakeClient:
+    """In-memory bucket counting the listings and the read bytes."""
+
+    def __init__(self, objects: dict[str, bytes], etags=None):
+        self.objects = objects
+        self.etags = etags or {}
+        self.listings = 0
+        self.read_bytes = 0
+        self._lock = threading.Lock()
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False):
+        self.listings += 1
+        return [
+            SimpleNamespace(
+                object_name=name,
+                size=len(data),
+                etag=f'"{self._etag(name)}"',
+            )
+            for name, data in self.objects.items()
+            if name.startswith(prefix or "")
+        ]
+
+    def get_object(self, bucket_name, object_name, offset=0, **kwargs):
+        data = self.objects[object_name][offset:]
+        with self._lock:
+            self.read_bytes += len(data)
+        return _FakeResponse(data)
+
+    def _etag(self, name):
+        return (
+            self.etags.get(name) or hashlib.md5(self.objects[name]).hexdigest()
+        )
+
+
+OBJECTS = {
+    f"{id_}/report {i}.pdf": bytes([id_ % 256, i]) * 1000
+    for id_ in (1, 2, 12)
+    for i in range(3)
+}
+
+
+def test_download_in_one_listing(tmp_path):
+    """Test all the files are downloaded after a single listing."""
+    client = _FakeClient(OBJECTS)
+    files = minio_engine.download_interventions(
+        [12, 1],
+        num_threads=4,
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    assert client.listings == 1
+    assert list(files) == [12, 1]
+    assert sorted(p.name for p in files[1]) == [
+        "report_0.pdf",
+        "report_1.pdf",
+        "report_2.pdf",
+    ]
+    for path in files[12]:
+        assert (
+            path.read_bytes() == OBJECTS[f"12/{path.name.replace('_', ' ')}"]
+        )
+    assert not (tmp_path / "2").exists()
+    assert (tmp_path / minio_engine.MANIFEST_FILENAME).exists()
+    # all the files are there
+    minio_engine.download_interventions(
+        [1, 12],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    assert client.listings == 1
+
+
+def test_partial_transfer_resumed(tmp_path):
+    """Test a partial transfer of the same version is resumed."""
+    client = _FakeClient(OBJECTS)
+    name = "2/report 0.pdf"
+    obj = minio_engine.RemoteObject(name, 2000, client._etag(name))
+    path = minio_engine._local_path(tmp_path, name)
+    path.parent.mkdir()
+    part_path = minio_engine._part_path(path, obj)
+    part_path.write_bytes(OBJECTS[name][:1500])
+    files = minio_engine.download_interventions(
+        [2],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    assert path in files[2]
+    assert path.read_bytes() == OBJECTS[name]
+    assert not part_path.exists()
+    assert client.read_bytes == 3 * 2000 - 1500
+
+
+def test_corrupted_download_rejected(tmp_path):
+    """Test a file not matching its ETag never gets its final name."""
+    client = _FakeClient(OBJECTS, {"1/report 0.pdf": "0" * 32})
+    with pytest.raises(Exception, match="md5"):
+        minio_engine.download_interventions(
+            [1],
+            client=client,
+            store_dir=tmp_path,  # type: ignore
+        )
+    assert not (tmp_path / "1" / "report_0.pdf").exists()
+    assert not list((tmp_path / "1").glob("*.part"))
+
+
+def test_incomplete_intervention_synced_again(tmp_path):
+    """Test only the missing file of an interrupted sync is downloaded."""
+    client = _FakeClient(OBJECTS)
+    files = minio_engine.download_interventions(
+        [1, 2, 12],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    # e.g. the process was killed before the download of this file
+    files[2][1].unlink()
+    client.read_bytes = 0
+    assert (
+        minio_engine.download_interventions(
+            [1, 2, 12],
+            client=client,
+            store_dir=tmp_path,  # type: ignore
+        )
+        == files
+    )
+    assert client.listings == 2
+    assert client.read_bytes == 2000
+
+
+def test_refresh_syncs_the_differences(tmp_path):
+    """Test a refresh downloads the new objects and removes the deleted."""
+    client = _FakeClient(dict(OBJECTS))
+    files = minio_engine.download_interventions(
+        [1, 2],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    deleted = files[1][0]
+    del client.objects["1/report 0.pdf"]
+    client.objects["1/report 3.pdf"] = b"new" * 10
+    client.objects["2/report 1.pdf"] = b"replaced" * 10
+    client.read_bytes = 0
+    files = minio_engine.download_interventions(
+        [1, 2],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+        refresh=True,
+    )
+    assert client.read_bytes == 30 + 80
+    assert not deleted.exists()
+    assert sorted(p.name for p in files[1]) == [
+        "report_1.pdf",
+        "report_2.pdf",
+        "report_3.pdf",
+    ]
+    assert (tmp_path / "2" / "report_1.pdf").read_bytes() == b"replaced" * 10
+
+
+def test_files_without_manifest_adopted(tmp_path):
+    """Test the files downloaded before the manifest are not transferred."""
+    for name, data in OBJECTS.items():
+        path = minio_engine._local_path(tmp_path, name)
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+    client = _FakeClient(OBJECTS)
+    minio_engine.download_interventions(
+        [1, 2, 12],
+        client=client,
+        store_dir=tmp_path,  # type: ignore
+    )
+    assert client.read_bytes == 0
@@ -0,0 +1,58 @@
+"""Test the small-model-first cascade of the field extractors."""
+
+from archaeo_super_prompt.modeling.struct_extract import cascade
+from archaeo_super_prompt.modeling.struct_extract.extractors.intervention_date import (
+    DataInterventoInputData,
+    DataInterventoOutputData,
+    InterventionStartExtractor,
+)
+from archaeo_super_prompt.modeling.struct_extract.extractors.intervention_date.type_models import (
+    Data,
+)
+
+
+def _window(start_year: int | None, end_year: int, end_month: int = 3):
+    return DataInterventoOutputData(
+        start_day=None if start_year is None else 1,
+        start_month=None if start_year is None else 1,
+        start_year=start_year,
+        end_day=31,
+        end_month=end_month,
+        end_year=end_year,
+        precision="year",
+    )
+
+
+def test_date_confidence():
+    """Test the doubtful windows of dates are escalated."""
+    extractor = InterventionStartExtractor(
+        "vllm", "large", 0.0, small_llm_model_id="small"
+    )
+    inpt = DataInterventoInputData(
+        fragmenti_relazione="",
+        data_di_archiviazone=Data(giorno=5, mese="Maggio", anno=1985),
+    )
+    assert extractor._is_confident(inpt, _window(1984, 1985))
+    assert extractor._is_confident(inpt, _window(None, 1985))
+    # after the archiving
+    assert not extractor._is_confident(inpt, _window(1984, 1986))
+    # min > max
+    assert not extractor._is_confident(inpt, _window(1986, 1985))
+    # invalid date
+    assert not extractor._is_confident(inpt, _window(1984, 1985, 13))
+
+
+def test_tier_stats():
+    """Test the answers and the scores are counted per tier."""
+    recorder = cascade.CascadeRecorder({"llm": "large", "small llm": "small"})
+    recorder.record_answer("a", "resolver")
+    recorder.record_processing("small llm", 1.0)
+    recorder.record_answer("b", "small llm")
+    recorder.record_processing("small llm", 3.0)
+    recorder.record_processing("llm", 4.0)
+    recorder.record_answer("c", "llm")
+    assert recorder.stats({"a": 1.0, "b": 0.5, "c": 0.0}) == [
+        cascade.TierStats("resolver", 1, 1, 1.0, 0, None),
+        cascade.TierStats("small llm", 2, 1, 0.5, 0, 2.0),
+        cascade.TierStats("llm", 1, 1, 0.0, 0, 4.0),
+    ]
@@ -0,0 +1,94 @@
+"""Test the merge of the filtered chunks into a prompt context."""
+
+import pandas as pd
+
+from archaeo_super_prompt.modeling.struct_extract import chunks_to_text
+from archaeo_super_prompt.modeling.struct_extract.chunks_to_text import (
+    ChunksToText,
+    PackingStats,
+    pack_chunks,
+    pack_contexts,
+)
+
+
+def _chunks():
+    return pd.DataFrame(
+        [
+            {
+                "id": 1,
+                "filename": "report.pdf",
+                "chunk_type": ["text"],
+                "chunk_page_position": [page],
+                "chunk_index": index,
+                "chunk_embedding_content": content,
+                "chunk_content": content,
+                "identified_thesaurus": thesaurus,
+            }
+            for index, (page, content, thesaurus) in enumerate(
+                [
+                    (1, "intro without hits", []),
+                    (2, "scavo a Firenze nel 2010", [3]),
+                    (5, "Firenze e Prato", [3, 4]),
+                    (9, "bibliografia finale lunga lunga", []),
+                ]
+            )
+        ]
+    )
+
+
+def _count_words(texts: list[str]) -> list[int]:
+    return [len(text.split()) for text in texts]
+
+
+def test_pack_chunks():
+    """Test the chunks with thesaurus hits are kept first, in reading order."""
+    text, stats = pack_chunks(_chunks(), 17, _count_words)  # type: ignore
+    assert text == (
+        "[report.pdf p.1]\nintro without hits\n\n"
+        "[report.pdf p.2]\nscavo a Firenze nel 2010\n\n"
+        "[report.pdf p.5]\nFirenze e Prato\n\n"
+    )
+    assert stats == PackingStats(
+        kept_chunks=3, dropped_chunks=1, kept_tokens=17, dropped_tokens=6
+    )
+    _, stats = pack_chunks(_chunks(), 12, _count_words)  # type: ignore
+    assert stats.kept_chunks == 2
+
+
+def test_chunks_to_text(cache_dir):
+    """Test all the chunks are rendered per intervention in reading order."""
+    chunks = pd.concat([_chunks(), _chunks().assign(id=2)]).iloc[::-1]
+    result = ChunksToText().transform(chunks)
+    assert (cache_dir / "interim").exists()
+    assert result.index.to_list() == [1, 2]
+    assert result.loc[1, "identified_thesaurus"] == [3, 4]
+    context = result.loc[1, "merged_chunks"]
+    assert context.startswith(
+        "`%% report.pdf | Page [1] (['text']) %%`\n\n"
+        "intro without hits\n\n`" + "-" * 60 + "`\n\n"
+    )
+    assert context.index("scavo") < context.index("Prato")
+    assert context == result.loc[2, "merged_chunks"]
+
+
+def test_pack_contexts():
+    """Test the budget is applied per intervention."""
+    chunks = pd.concat([_chunks(), _chunks().assign(id=2)])
+    contexts, stats = pack_contexts(chunks, 12, _count_words)  # type: ignore
+    assert contexts.index.to_list() == [1, 2]
+    assert stats["kept_chunks"].to_list() == [2, 2]
+
+
+def test_packing_stats_saved(monkeypatch):
+    """Test the transformer keeps the truncation statistics of a run."""
+    monkeypatch.setattr(
+        chunks_to_text, "get_token_counter", lambda _: _count_words
+    )
+    transformer = ChunksToText(token_budget=12)
+    result = transformer.transform(
+        pd.concat([_chunks(), _chunks().assign(id=2)])
+    )
+    assert result.index.to_list() == [1, 2]
+    assert transformer.packing_stats_.loc[2].to_list() == list(
+        PackingStats(2, 2, 12, 11)
+    )
@@ -0,0 +1,32 @@
+"""Test the lookup over the comune and province thesauri."""
+
+import pandas as pd
+
+from archaeo_super_prompt.dataset.thesauri import ComuneProvinciaLookup
+
+
+def _lookup():
+    comuni = pd.DataFrame(
+        {"name": ["Lucca", "Capannori", "Prato"], "province_id": [1, 1, 2]},
+        index=pd.Index([10, 42, 7], name="comune_id"),
+    )
+    province = pd.DataFrame(
+        {"name": ["Lucca", "Prato"], "sigla": ["LU", "PO"]},
+        index=pd.Index([1, 2], name="province_id"),
+    )
+    return ComuneProvinciaLookup(comuni, province)  # type: ignore
+
+
+def test_candidates():
+    """Test the candidates are fetched by thesaurus identifier."""
+    assert _lookup().candidates([42, 7, 999]) == [
+        ("Capannori", "Lucca", "LU"),
+        ("Prato", "Prato", "PO"),
+    ]
+    assert _lookup().candidates([]) == []
+
+
+def test_find_ids():
+    """Test the names are mapped back to identifiers, normalized."""
+    assert _lookup().find_ids("capannori ", "LUCCA") == (42, 1)
+    assert _lookup().find_ids("Capannori", "Prato") is None
@@ -0,0 +1,64 @@
+"""Test the precomputed contexts of the legacy extraction model."""
+
+import pandas
+
+from archaeo_super_prompt.modeling.chunk_selector import (
+    select_end_pages,
+    select_incipit,
+)
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.context_views import (
+    compute_context_views,
+)
+from archaeo_super_prompt.types.pdfchunks import (
+    PDFChunkDataset,
+    PDFChunkPerInterventionDataset,
+)
+
+
+def _chunks():
+    rows = [
+        (id_, f"{id_}-{file}.pdf", page, index)
+        for id_, page_number in ((1, 40), (2, 12))
+        for file in ("a", "b")
+        for index, page in enumerate(range(1, page_number + 1))
+    ]
+    return pandas.DataFrame(
+        {
+            "id": [id_ for id_, *_ in rows],
+            "filename": [filename for _, filename, *_ in rows],
+            "chunk_type": [["text", "title"] for _ in rows],
+            "chunk_page_position": [
+                [page, page + 1] if page % 5 == 0 else [page]
+                for _, _, page, _ in rows
+            ],
+            "chunk_index": [index for *_, index in rows],
+            "chunk_embedding_content": ["" for _ in rows],
+            "chunk_content": [
+                f"content of page {page}" for _, _, page, _ in rows
+            ],
+        }
+    )
+
+
+def test_views_equal_chunk_selections():
+    """Test the views render the chunks as the selections of pages do."""
+    chunks = _chunks()
+    views = compute_context_views(PDFChunkDataset(chunks))  # type: ignore
+    assert list(views) == [1, 2]
+    for id_, source in chunks.groupby("id"):
+        dataset = PDFChunkPerInterventionDataset(source)  # type: ignore
+        incipit = select_incipit(dataset)
+        end_pages = select_end_pages(dataset)
+        intervention_views = views[id_]  # type: ignore
+        assert intervention_views.full == dataset.to_readable_context_string()
+        assert (
+            intervention_views.incipit == incipit.to_readable_context_string()
+        )
+        assert (
+            intervention_views.end_pages
+            == end_pages.to_readable_context_string()
+        )
+        assert (
+            intervention_views.incipit_and_end_pages
+            == (incipit + end_pages).to_readable_context_string()
+        )
@@ -0,0 +1,58 @@
+"""Test the lookups of the records of the dataset by their id."""
+
+import pandas as pd
+import pytest
+
+from archaeo_super_prompt.dataset import MagohDataset
+from archaeo_super_prompt.types.intervention_id import InterventionId
+
+
+def _dataset():
+    dataset = MagohDataset.__new__(MagohDataset)
+    dataset._intervention_data = pd.DataFrame(  # type: ignore
+        {
+            "id": [31, 7, 12, 5],
+            "university__Comune": ["Lucca (LU)", None, "Pisa (PI)", "Roma"],
+            "university__Profondità_massima": [1.5, None, 2.0, 3.0],
+        }
+    )
+    dataset._files = pd.DataFrame(  # type: ignore
+        {
+            "id": [12, 31, 12, 99],
+            "filepath": ["12/a.pdf", "31/a.pdf", "12/b.pdf", "99/a.pdf"],
+        }
+    )
+    dataset._index_records()
+    return dataset
+
+
+def test_lookups_as_full_scans():
+    """Test the indexed lookups equal the scans of the whole frames."""
+    dataset = _dataset()
+    records = dataset.intervention_data
+    files = dataset.files
+    ids = {InterventionId(12), InterventionId(31), InterventionId(5)}
+    for id_ in records["id"]:
+        # compared as series, as NaN is not equal to itself
+        assert pd.Series(dataset.get_answer(id_), dtype=object).equals(
+            records[records["id"] == id_].iloc[0]
+        )
+    assert list(dataset.get_answers(ids)) == list(
+        records[records["id"].isin(ids)].itertuples()
+    )
+    assert dataset.get_files_for_batch(ids | {InterventionId(8)}).equals(
+        files[files["id"].isin(ids)]
+    )
+    assert dataset.filter_good_records_for_training(
+        ids | {InterventionId(7), InterventionId(8)},
+        lambda df: df["university__Comune"].notnull(),  # type: ignore
+    ) == {12, 31, 5}
+
+
+def test_unknown_ids_rejected():
+    """Test the answers of the ids missing from the dataset are refused."""
+    dataset = _dataset()
+    with pytest.raises(Exception, match="8"):
+        dataset.get_answer(InterventionId(8))
+    with pytest.raises(Exception, match="answers"):
+        dataset.get_answers({InterventionId(7), InterventionId(8)})
@@ -0,0 +1,63 @@
+"""Test the comparison of the dates in the legacy evaluation."""
+
+import datetime
+
+import dspy
+from dspy.utils.dummies import DummyLM
+
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.evaluation import (
+    date_match,
+)
+
+
+def test_parse_period():
+    """Test the supported formats are parsed into their periods of days."""
+    d = datetime.date
+    assert date_match.parse_period("1985-03-18") == (d(1985, 3, 18),) * 2
+    assert date_match.parse_period("18/03/1985") == (d(1985, 3, 18),) * 2
+    assert date_match.parse_period("Marzo 1985") == (
+        d(1985, 3, 1),
+        d(1985, 3, 31),
+    )
+    assert date_match.parse_period("27 febbraio - 29 settembre 1981") == (
+        d(1981, 2, 27),
+        d(1981, 9, 29),
+    )
+    assert date_match.parse_period("1985") == (d(1985, 1, 1), d(1985, 12, 31))
+    # no year or not a date
+    assert date_match.parse_period("27 febbraio") is None
+    assert date_match.parse_period("31/02/1985") is None
+    assert date_match.parse_period("ante 1990") is None
+
+
+def test_parsed_dates_compared_without_llm():
+    """Test the parsable dates are compared by the inclusion of periods."""
+    before = date_match.get_stats()
+    assert date_match.check_same_date("marzo 1985", "1985-03-30") == 1
+    assert date_match.check_same_date("marzo 1985", "1985-04-01") == 0
+    assert date_match.check_same_date("1985-03-18", "18/03/1985", trace=[])
+    assert date_match.get_stats_since(before) == date_match.DateMatchStats(
+        3, 0, 0
+    )
+
+
+def test_less_precise_prediction_rejected():
+    """Test a prediction must be at least as precise as the expected date."""
+    assert date_match.check_same_date("1985", "1985-03-18") == 1
+    assert date_match.check_same_date("1985-03-18", "1985") == 0
+    assert not date_match.check_same_date(
+        "18/03/1985", "marzo 1985", trace=[]
+    )
+
+
+def test_llm_verdict_memoized():
+    """Test an unparsable pair is judged once by the llm."""
+    gold = "prima del 1990"
+    lm = DummyLM([{"are_they_talking_about_the_same_date": "True"}])
+    before = date_match.get_stats()
+    with dspy.settings.context(lm=lm):
+        assert date_match.check_same_date(gold, "1985") == 1
+        assert date_match.check_same_date(gold, "1985") == 1
+    assert date_match.get_stats_since(before) == date_match.DateMatchStats(
+        0, 1, 1
+    )
@@ -0,0 +1,46 @@
+"""Test the load balancing of the llm requests over several servers."""
+
+from types import SimpleNamespace
+
+from archaeo_super_prompt.modeling.struct_extract import endpoint_router
+from archaeo_super_prompt.modeling.struct_extract.endpoint_router import (
+    EndpointRouter,
+)
+
+
+def test_least_outstanding_requests():
+    """Test the requests are spread over the least loaded servers."""
+    router = EndpointRouter(["a", "b"], probe=lambda _: True)
+    assert [router.acquire() for _ in range(4)] == ["a", "b", "a", "b"]
+    router.release("b", True)
+    assert router.acquire() == "b"
+
+
+def test_failing_endpoint_ejection(monkeypatch):
+    """Test a failing server is ejected, then readmitted once probed."""
+    probed = []
+    router = EndpointRouter(
+        ["a", "b"], probe=lambda e: probed.append(e) or True
+    )
+    for _ in range(3):
+        assert router.acquire() == "a"
+        router.release("a", False)
+    assert router.states()["a"].ejected_until is not None
+    assert [router.acquire() for _ in range(3)] == ["b", "b", "b"]
+    assert probed == []
+
+    # after the cooldown
+    monkeypatch.setattr(
+        endpoint_router, "time", SimpleNamespace(monotonic=lambda: 1e12)
+    )
+    assert router.acquire() == "a"
+    assert probed == ["a"]
+    assert router.states()["a"] == endpoint_router.EndpointState(1, 0, None)
+
+
+def test_prefix_affinity():
+    """Test the requests sharing a prefix go to the same server."""
+    router = EndpointRouter(["a", "b", "c"], probe=lambda _: True)
+    chosen = router.acquire("report 36187")
+    router.release(chosen, True)
+    assert router.acquire("report 36187") == chosen
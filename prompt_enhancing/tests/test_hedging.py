@@ -0,0 +1,100 @@
+"""Test the hedging of the slow llm requests."""
+
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+import dspy
+
+from archaeo_super_prompt.modeling.struct_extract import (
+    hedging,
+    language_model,
+)
+
+
+def _record_latencies(client_key, seconds: float):
+    for _ in range(20):
+        hedging.record_latency(client_key, seconds)
+
+
+def test_slow_request_is_hedged():
+    """Test a request slower than the threshold is answered by its duplicate."""
+    client_key = str(uuid.uuid4())
+    assert hedging.get_threshold(client_key, 95) is None
+    _record_latencies(client_key, 0.2)
+    assert hedging.get_threshold(client_key, 95) == 0.2
+    # a request of the window has been much slower
+    hedging.record_latency(client_key, 2.0)
+    assert hedging.get_threshold(client_key, 95) == 0.2
+
+    cancelled = []
+
+    async def answer(text: str, seconds: float):
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(text)
+            raise
+        return text
+
+    def send(avoided):
+        if avoided is None:
+            return "a", hedging.run_in_background(answer("original", 10.0))
+        assert avoided == "a"
+        return "b", hedging.run_in_background(answer("duplicate", 0.0))
+
+    recorder = hedging.HedgingRecorder()
+    with hedging.recording(recorder):
+        assert hedging.hedged_call(send, client_key, 95) == "duplicate"
+    stats = recorder.stats()
+    assert stats[:4] == (1, 1, 1, 1)
+    # the original request would have lasted as long as the slow one
+    assert 1.5 < stats.saved_seconds < 1.8
+    deadline = time.monotonic() + 1.0
+    while not cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cancelled == ["original"]
+
+    # a fast request is not duplicated
+    with hedging.recording(recorder):
+        assert (
+            hedging.hedged_call(
+                lambda avoided: (
+                    "a",
+                    hedging.run_in_background(answer("fast", 0.0)),
+                ),
+                client_key,
+                95,
+            )
+            == "fast"
+        )
+    assert recorder.stats() == stats._replace(requests=2)
+
+
+def test_loser_slot_released(monkeypatch):
+    """Test the cancelled original request frees its endpoint slot."""
+    monkeypatch.setenv("LLM_HEDGING_PERCENTILE", "95")
+    endpoint = f"http://{uuid.uuid4()}"
+    lm = language_model.EndpointBoundedLM(
+        "vllm", "test", "openai/test", endpoint, api_key=""
+    )
+    _record_latencies((endpoint, "test"), 0.1)
+    semaphore = language_model._get_endpoint_semaphore(endpoint)
+    slots = language_model.get_max_in_flight_requests()
+    held_slots = []
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        held_slots.append(slots - semaphore._free)
+        if len(held_slots) == 1:
+            await asyncio.sleep(10.0)
+        return SimpleNamespace(choices=[], usage=None, answer=len(held_slots))
+
+    monkeypatch.setattr(dspy.LM, "aforward", aforward)
+    assert lm.forward(prompt="slow").answer == 2
+    # the duplicate has not waited for a slot of the endpoint
+    assert held_slots == [1, 1]
+    deadline = time.monotonic() + 1.0
+    while semaphore._free < slots and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert semaphore._free == slots
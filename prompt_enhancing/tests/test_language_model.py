@@ -0,0 +1,73 @@
+"""Test the shared dspy language model clients."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import dspy
+
+from archaeo_super_prompt.modeling.struct_extract import language_model
+
+
+def _response(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage={},
+        model="test",
+    )
+
+
+def test_history_bounded(monkeypatch):
+    """Test a long-lived client does not keep all its calls."""
+    monkeypatch.setattr(
+        dspy.LM,
+        "forward",
+        lambda self, prompt=None, messages=None, **kwargs: _response(prompt),
+    )
+    lm = language_model.EndpointBoundedLM(
+        "vllm", "test", "openai/test", "http://test", api_key=""
+    )
+    for i in range(3 * language_model._HISTORY_SIZE):
+        assert lm(str(i)) == [str(i)]
+    assert len(lm.history) <= language_model._HISTORY_SIZE + 1
+    assert lm.history[-1]["prompt"] == str(
+        3 * language_model._HISTORY_SIZE - 1
+    )
+
+
+def test_in_flight_requests_bounded_per_endpoint(monkeypatch):
+    """Test the concurrent requests of all the threads respect the bound."""
+    monkeypatch.setenv("LLM_MAX_IN_FLIGHT_REQUESTS", "2")
+    monkeypatch.delenv("LLM_HEDGING_PERCENTILE", raising=False)
+    monkeypatch.setattr(language_model, "_endpoint_semaphores", {})
+    lock = threading.Lock()
+    in_flight = {"http://a": 0, "http://b": 0}
+    peaks = dict(in_flight)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        with lock:
+            in_flight[self.endpoint] += 1
+            peaks[self.endpoint] = max(
+                peaks[self.endpoint], in_flight[self.endpoint]
+            )
+        time.sleep(0.05)
+        with lock:
+            in_flight[self.endpoint] -= 1
+        return _response(prompt)
+
+    monkeypatch.setattr(dspy.LM, "forward", forward)
+    lms = [
+        language_model.EndpointBoundedLM(
+            "vllm", "test", "openai/test", endpoint, api_key=""
+        )
+        for endpoint in in_flight
+    ]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for future in [
+            executor.submit(lm.forward, prompt=str(i))
+            for i in range(8)
+            for lm in lms
+        ]:
+            future.result()
+    assert peaks == {"http://a": 2, "http://b": 2}
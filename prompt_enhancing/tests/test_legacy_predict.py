@@ -0,0 +1,67 @@
+"""Test the parallel predict of the legacy extraction model."""
+
+import time
+
+import pandas
+from dspy.utils.dummies import DummyLM
+
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.main_transformer import (
+    MagohDataExtractor,
+)
+
+
+def _chunks(ids: list[int]):
+    return pandas.DataFrame(
+        {
+            "id": ids,
+            "filename": [f"{id_}.pdf" for id_ in ids],
+            "chunk_type": [["text"] for _ in ids],
+            "chunk_page_position": [[1] for _ in ids],
+            "chunk_index": [0 for _ in ids],
+            "chunk_embedding_content": ["content" for _ in ids],
+            "chunk_content": ["content" for _ in ids],
+        }
+    )
+
+
+def _answer(comune: str):
+    return {
+        "university__Comune": comune,
+        "university__Numero_di_saggi": 1,
+        "university__Geologico": None,
+        "university__Profondità_falda": None,
+        "university__Profondità_massima": -1.5,
+    }
+
+
+def test_failed_and_timed_out_interventions_dropped(monkeypatch):
+    """Test the output follows the interventions, without the failed ones."""
+    extractor = MagohDataExtractor(
+        DummyLM([]), predict_num_threads=4, prediction_timeout=0.5
+    )
+
+    def forward(document_ocr_scans__df):
+        filename = document_ocr_scans__df.data["filename"].iloc[0]
+        if filename == "2.pdf":
+            return None
+        if filename == "3.pdf":
+            time.sleep(2)
+        if filename == "4.pdf":
+            time.sleep(0.2)
+        return _answer(filename)
+
+    monkeypatch.setattr(extractor, "_forward_and_type", forward)
+    start = time.perf_counter()
+    output = extractor.predict(_chunks([4, 2, 3, 1]))  # type: ignore
+    assert time.perf_counter() - start < 1.5
+    assert output["id"].tolist() == [1, 4]
+    assert output["university__Comune"].tolist() == ["1.pdf", "4.pdf"]
+
+
+def test_all_interventions_failed(monkeypatch):
+    """Test the output is empty but well-formed when all extractions fail."""
+    extractor = MagohDataExtractor(DummyLM([]))
+    monkeypatch.setattr(extractor, "_forward_and_type", lambda _: None)
+    output = extractor.predict(_chunks([1, 2]))  # type: ignore
+    assert len(output) == 0
+    assert "university__Comune" in output.columns
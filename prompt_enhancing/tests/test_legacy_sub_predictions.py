@@ -0,0 +1,64 @@
+"""Test the concurrent sub-predictions of the legacy extraction model."""
+
+import time
+
+import dspy
+
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor import (
+    extractor_module,
+)
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.context_views import (
+    ContextViews,
+)
+
+
+def test_sub_predictions_run_concurrently(monkeypatch):
+    """Test the sub-predictions overlap, in the dspy context of the caller."""
+    monkeypatch.setattr(
+        extractor_module,
+        "get_context_views",
+        lambda _: ContextViews("report", "incipit", "end", "incipit and end"),
+    )
+    monkeypatch.setattr(
+        extractor_module,
+        "to_magoh_university_data",
+        lambda context, details, sources: {"a": context, "b": details},
+    )
+    monkeypatch.setattr(
+        extractor_module,
+        "to_magoh_build_data",
+        lambda context, sources, archival: {"c": sources, "d": archival},
+    )
+    module = extractor_module.ExtractDataFromInterventionReport()
+
+    def fake_predictor(answer: str):
+        def predict(**kwargs):
+            kwargs = kwargs  # unused
+            time.sleep(0.3)
+            return f"{answer} with {dspy.settings.lm}"
+
+        return predict
+
+    module.extract_intervention_context_data = fake_predictor("context")
+    module.extract_report_sources = fake_predictor("sources")
+    module.extract_intervention_technical_achievements = fake_predictor(
+        "details"
+    )
+    module.extract_archival_metadata = fake_predictor("archival")
+
+    before = extractor_module.get_timings()
+    start = time.perf_counter()
+    with dspy.settings.context(lm="the llm"):
+        prediction = module.forward(None)  # type: ignore
+    assert time.perf_counter() - start < 0.9
+    assert prediction.toDict() == {
+        "university__a": "context with the llm",
+        "university__b": "details with the llm",
+        "building__c": "sources with the llm",
+        "building__d": "archival with the llm",
+    }
+    timings = extractor_module.get_timings_since(before)
+    assert len(timings) == 4
+    assert all(
+        t.calls == 1 and t.total_seconds >= 0.3 for t in timings.values()
+    )
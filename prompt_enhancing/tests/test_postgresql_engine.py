@@ -0,0 +1,68 @@
+"""Test the selection of the requested interventions in the database."""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pandas as pd
+
+from archaeo_super_prompt.dataset import postgresql_engine
+
+
+class _FakeConnection:
+    """Connection recording the statements sent to the database."""
+
+    def __init__(self):
+        """Start without any statement."""
+        self.statements: list[tuple[str, dict | None]] = []
+
+    def exec_driver_sql(self, statement: str, parameters=None):
+        """Record the statement with its parameters."""
+        self.statements.append((statement, parameters))
+
+
+def _request(name: str) -> str:
+    return getattr(postgresql_engine, f"__{name}")
+
+
+def test_ids_inserted_in_batches(monkeypatch):
+    """Test the ids are stored in batches before the streamed requests."""
+    connection = _FakeConnection()
+
+    @contextmanager
+    def connect():
+        yield connection
+
+    def stream_request(connection, request, params, chunk_size):
+        connection.statements.append((request, params))
+        yield pd.DataFrame({"chunk_size": [chunk_size]})
+
+    monkeypatch.setattr(
+        postgresql_engine,
+        "_get_engine",
+        lambda: SimpleNamespace(connect=connect),
+    )
+    monkeypatch.setattr(postgresql_engine, "_stream_request", stream_request)
+    monkeypatch.setattr(postgresql_engine, "ID_BATCH_SIZE", 2)
+
+    with postgresql_engine.open_entries_with_ids({5, 1, 4, 2, 3}, 7) as (
+        intervention_chunks,
+        findings_chunks,
+    ):
+        assert [parameters for _, parameters in connection.statements] == [
+            None,
+            {"intervention_ids": [1, 2]},
+            {"intervention_ids": [3, 4]},
+            {"intervention_ids": [5]},
+            None,
+        ]
+        assert [statement for statement, _ in connection.statements] == [
+            _request("create_selection_request"),
+            *[_request("insert_ids_request")] * 3,
+            _request("analyze_selection_request"),
+        ]
+        assert list(intervention_chunks)[0]["chunk_size"][0] == 7
+        assert list(findings_chunks)
+    assert [statement for statement, _ in connection.statements[-2:]] == [
+        _request("get_selected_interventions"),
+        _request("get_selected_findings"),
+    ]
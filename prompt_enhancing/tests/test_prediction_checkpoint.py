@@ -0,0 +1,21 @@
+"""Test the crash-safe checkpointing of the predictions."""
+
+from archaeo_super_prompt.modeling.struct_extract.prediction_checkpoint import (
+    PredictionCheckpoint,
+)
+
+
+def test_save_and_restore(cache_dir):
+    """Test a prediction is restored only for the same model and input."""
+    checkpoint = PredictionCheckpoint("test", "run")
+    assert checkpoint.directory.is_relative_to(cache_dir)
+    inpt = {"fragmenti_relazione": "Lucca"}
+    assert checkpoint.load(36187, "model", inpt) is None
+    checkpoint.save(36187, "model", inpt, {"comune": "Lucca"})
+    assert checkpoint.load(36187, "model", inpt) == {"comune": "Lucca"}
+    assert checkpoint.load(36187, "other model", inpt) is None
+    assert checkpoint.load(31977, "model", inpt) is None
+    assert len(checkpoint) == 1
+    # a run resumed with the same name finds the prediction
+    resumed = PredictionCheckpoint("test", "run")
+    assert resumed.load(36187, "model", inpt) == {"comune": "Lucca"}
@@ -0,0 +1,109 @@
+"""Test the helpers of the budgeted and resumable prompt optimization."""
+
+from types import SimpleNamespace
+
+import dspy
+from dspy.utils import DummyLM
+
+from archaeo_super_prompt.modeling.struct_extract import (
+    language_model,
+    prompt_optimization,
+    response_cache,
+)
+
+
+def test_stratified_split():
+    """Test each stratum keeps its proportion in the validation set."""
+    examples = list(range(100))
+    strata = ["a" if i < 80 else "b" for i in examples]
+    trainset, valset = prompt_optimization.stratified_split(
+        examples, strata, 10, seed=0
+    )
+    assert len(valset) == 10 and len(trainset) == 90
+    assert sorted(trainset + valset) == examples
+    assert sum(1 for i in valset if strata[i] == "b") == 2
+    assert prompt_optimization.stratified_split(
+        examples, strata, 10, seed=0
+    ) == (trainset, valset)
+
+
+def test_budget():
+    """Test the budget is exhausted once its duration is over."""
+    optimizer = prompt_optimization.BudgetedMIPROv2(
+        metric=lambda *_: 1.0,
+        budget=prompt_optimization.OptimizationBudget(max_seconds=0),
+    )
+    assert optimizer.is_budget_exhausted()
+    optimizer.budget = prompt_optimization.OptimizationBudget(max_tokens=10)
+    assert not optimizer.is_budget_exhausted()
+
+
+def test_token_budget_of_the_optimization_only(monkeypatch):
+    """Test the tokens consumed by other work do not exhaust the budget."""
+    monkeypatch.delenv("LLM_HEDGING_PERCENTILE", raising=False)
+    monkeypatch.setattr(
+        dspy.LM,
+        "forward",
+        lambda self, prompt=None, messages=None, **kwargs: SimpleNamespace(
+            choices=[], usage=SimpleNamespace(total_tokens=20)
+        ),
+    )
+    lm = language_model.EndpointBoundedLM(
+        "vllm", "test", "openai/test", "http://test", api_key=""
+    )
+    optimizer = prompt_optimization.BudgetedMIPROv2(
+        metric=lambda *_: 1.0,
+        budget=prompt_optimization.OptimizationBudget(max_tokens=10),
+    )
+    lm.forward(prompt="another extractor")
+    assert not optimizer.is_budget_exhausted()
+    with language_model.recording_token_usage(optimizer._token_recorder):
+        lm.forward(prompt="the optimization")
+    assert optimizer.is_budget_exhausted()
+
+
+class _Signature(dspy.Signature):
+    """Dummy task."""
+
+    question: str = dspy.InputField()
+    answer: str = dspy.OutputField()
+
+
+def test_exhausted_budget_skips_the_steps():
+    """Test no llm request is sent once the budget is exhausted."""
+    optimizer = prompt_optimization.BudgetedMIPROv2(
+        metric=lambda *_: 1.0,
+        auto="light",
+        budget=prompt_optimization.OptimizationBudget(max_seconds=0),
+    )
+    student = dspy.Predict(_Signature)
+    examples = [
+        dspy.Example(question=str(i), answer=str(i)).with_inputs("question")
+        for i in range(4)
+    ]
+    # the llm has no answer to give
+    with dspy.settings.context(lm=DummyLM([])):
+        optimized = optimizer.compile(
+            student,
+            trainset=examples[:2],
+            valset=examples[2:],
+            requires_permission_to_run=False,
+        )
+    assert optimized.signature.instructions == student.signature.instructions
+    assert optimized.demos == []
+
+
+def test_cached_program_replays_its_trace():
+    """Test a cached output still records the trace of the predictors."""
+    program = response_cache.CachedProgram(
+        dspy.Predict(_Signature), "dummy-model"
+    )
+    question = "What is the answer?"
+    with dspy.settings.context(lm=DummyLM([{"answer": "42"}])):
+        for _ in range(2):
+            with dspy.settings.context(trace=[]):
+                assert program(question=question).answer == "42"
+                ((predictor, inputs, prediction),) = dspy.settings.trace
+                assert predictor is program.program
+                assert inputs == {"question": question}
+                assert prediction.answer == "42"
@@ -0,0 +1,110 @@
+"""Test the prefix-cache-aware ordering of the llm requests."""
+
+import threading
+import time
+
+import dspy
+from pydantic import BaseModel
+
+from archaeo_super_prompt.modeling.struct_extract import (
+    request_ordering,
+    vllm_metrics,
+)
+
+
+def test_prefix_order():
+    """Test the prompts sharing a prefix become contiguous."""
+    prompts = ["report A, q1", "report B, q1", "report A, q2", "report B, q2"]
+    order = request_ordering.prefix_order(prompts)
+    assert [prompts[i] for i in order] == [
+        "report A, q1",
+        "report A, q2",
+        "report B, q1",
+        "report B, q2",
+    ]
+
+
+def test_metrics_comparison():
+    """Test the hit rate and the mean ttft are computed from the counters."""
+    exposition = """# HELP vllm:prefix_cache_queries_total Prefix cache queries
+vllm:prefix_cache_queries_total{model_name="m"} 1000.0
+vllm:prefix_cache_hits_total{model_name="m"} 250.0
+vllm:time_to_first_token_seconds_sum{model_name="m"} 4.0
+vllm:time_to_first_token_seconds_count{model_name="m"} 10.0
+"""
+    values = vllm_metrics.parse_metrics(exposition)
+    assert values["vllm:prefix_cache_hits_total"] == 250.0
+    before = vllm_metrics.VllmMetricsSnapshot(1000.0, 250.0, 4.0, 10.0)
+    after = vllm_metrics.VllmMetricsSnapshot(3000.0, 1750.0, 6.0, 20.0)
+    assert vllm_metrics.compare(before, after) == (
+        vllm_metrics.VllmMetricsReport(10, 0.75, 0.2)
+    )
+    assert (
+        vllm_metrics.get_metrics_url("http://localhost:8006/v1")
+        == "http://localhost:8006/metrics"
+    )
+
+
+def test_prompt_content_formatted_by_the_adapter():
+    """Test the prompts are compared with their instructions first."""
+
+    class Input(BaseModel):
+        question: str
+
+    program = dspy.Predict("question -> answer")
+    content = request_ordering.prompt_content(
+        program, Input(question="report A"), dspy.ChatAdapter()
+    )
+    assert content.index("answer") < content.index("report A")
+
+
+def test_waiting_requests_sent_in_prompt_order():
+    """Test a free slot goes to the waiting request with the lowest prompt."""
+    semaphore = request_ordering.PrefixOrderedSemaphore(1)
+    semaphore.acquire("first")
+    sent = []
+
+    def send(prompt):
+        with semaphore.slot(prompt):
+            sent.append(prompt)
+
+    threads = [
+        threading.Thread(target=send, args=(prompt,))
+        for prompt in ["report B", "report A, q2", "report A, q1"]
+    ]
+    for thread in threads:
+        thread.start()
+    while len(semaphore._waiting) < len(threads):
+        time.sleep(0.01)
+    semaphore.release()
+    for thread in threads:
+        thread.join()
+    assert sent == ["report A, q1", "report A, q2", "report B"]
+
+
+def test_overtaken_request_served():
+    """Test a request is not overtaken more than the bound of the semaphore."""
+    semaphore = request_ordering.PrefixOrderedSemaphore(1, max_overtakes=3)
+    semaphore.acquire("first")
+    sent = []
+
+    def send(prompt):
+        with semaphore.slot(prompt):
+            sent.append(prompt)
+
+    # the request arrives first, and the others keep sorting before it
+    threads = [threading.Thread(target=send, args=("report Z",))] + [
+        threading.Thread(target=send, args=(f"report A, q{i}",))
+        for i in range(6)
+    ]
+    for i, thread in enumerate(threads):
+        thread.start()
+        while len(semaphore._waiting) <= i:
+            time.sleep(0.01)
+    semaphore.release()
+    for thread in threads:
+        thread.join()
+    assert sent.index("report Z") == 3
+    assert [prompt for prompt in sent if prompt != "report Z"] == sorted(
+        f"report A, q{i}" for i in range(6)
+    )
@@ -0,0 +1,53 @@
+"""Test the persistent cache of the llm-based predictions."""
+
+import dspy
+
+from archaeo_super_prompt.modeling.struct_extract import response_cache
+
+
+class _Signature(dspy.Signature):
+    """Dummy task."""
+
+    question: str = dspy.InputField()
+    answer: str = dspy.OutputField()
+
+
+def test_program_fingerprint():
+    """Test the fingerprint only changes when the prompt changes."""
+    program = dspy.Predict(_Signature)
+    fingerprint = response_cache.program_fingerprint(program)
+    assert fingerprint == response_cache.program_fingerprint(
+        dspy.Predict(_Signature)
+    )
+    program.demos = [dspy.Example(question="foo", answer="bar")]
+    assert fingerprint != response_cache.program_fingerprint(program)
+
+
+def test_save_and_load(cache_dir):
+    """Test an output is retrieved with the same key and counted as a hit."""
+    program_input = {"question": "What is the answer?"}
+    key = response_cache.response_key("fingerprint", "model", 0.0, program_input)
+    assert key != response_cache.response_key(
+        "fingerprint", "model", 0.5, program_input
+    )
+
+    response_cache.reset_stats()
+    assert response_cache.load_response(key) is None
+    response_cache.save_response(key, {"answer": "42"})
+    assert response_cache.load_response(key) == {"answer": "42"}
+    assert response_cache.get_stats() == response_cache.ResponseCacheStats(
+        hits=1, misses=1, bypassed=0
+    )
+    assert (cache_dir / "interim" / "llm_responses").exists()
+
+
+def test_outdated_outputs_not_read(monkeypatch):
+    """Test the outputs saved by a previous version of the cache are missed."""
+    program_input = {"question": "What is the answer?"}
+    key = response_cache.response_key("fingerprint", "model", 0.0, program_input)
+    response_cache.save_response(key, {"answer": "41"})
+    monkeypatch.setattr(
+        response_cache, "CACHE_VERSION", response_cache.CACHE_VERSION + 1
+    )
+    key = response_cache.response_key("fingerprint", "model", 0.0, program_input)
+    assert response_cache.load_response(key) is None
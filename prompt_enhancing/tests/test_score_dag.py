@@ -0,0 +1,48 @@
+"""Test the concurrent evaluation of the extractors."""
+
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+
+from archaeo_super_prompt.modeling.predict import score_dag
+
+
+class _FakeExtractor:
+    """Extractor waiting for the others to be evaluated at the same time."""
+
+    def __init__(self, name: str, barrier: threading.Barrier):
+        """Initialize the extractor with the barrier of all the extractors."""
+        self.name = name
+        self._barrier = barrier
+
+    def score_and_transform(self, X, eval_ds, num_threads=None):
+        """Return a score once all the extractors are being evaluated."""
+        eval_ds, num_threads = eval_ds, num_threads  # unused
+        # raises BrokenBarrierError if the extractors run one after another
+        self._barrier.wait(timeout=5)
+        return len(X), pd.DataFrame({"field": [self.name]})
+
+
+def test_extractors_scored_concurrently():
+    """Test score_dag evaluates all its extractors at the same time."""
+    barrier = threading.Barrier(3)
+    extractors = [_FakeExtractor(name, barrier) for name in "abc"]
+    parts = SimpleNamespace(
+        preprocessing_root=SimpleNamespace(
+            make_dag=lambda: SimpleNamespace(
+                transform=lambda inputs: {"chunks": inputs}
+            )
+        ),
+        extraction_parts=[
+            ((fe.name, fe), SimpleNamespace(component_id="chunks"))
+            for fe in extractors
+        ],
+    )
+    scores, results = score_dag(
+        parts,  # type: ignore
+        [1, 2],  # type: ignore
+        None,  # type: ignore
+    )
+    assert scores == {"a": 2, "b": 2, "c": 2}
+    assert results["field"].tolist() == ["a", "b", "c"]
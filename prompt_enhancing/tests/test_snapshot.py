@@ -0,0 +1,72 @@
+"""Test the export of the database records into Parquet snapshots."""
+
+import datetime
+
+import pandas as pd
+import pytest
+
+from archaeo_super_prompt.dataset.snapshot import Snapshot, export_snapshot
+
+
+def _chunks():
+    # the types of the columns differ between the chunks of a result
+    yield pd.DataFrame(
+        {
+            "id": [1, 2],
+            "university.Comune": [None, None],
+            "building.Data": [datetime.date(1985, 3, 18), None],
+            "university.Profondità falda": [1, 2],
+        }
+    )
+    yield pd.DataFrame(
+        {
+            "id": [3],
+            "university.Comune": ["Lucca"],
+            "building.Data": [None],
+            "university.Profondità falda": [1.5],
+        }
+    )
+
+
+def test_chunks_exported_and_read(tmp_path):
+    """Test the chunks of a table are read back as a single DataFrame."""
+    snapshot = export_snapshot(
+        tmp_path / "sample",
+        {"interventions": _chunks(), "findings": iter([pd.DataFrame()])},
+        {"size": 3},
+    )
+    assert snapshot.metadata["row_numbers"] == {
+        "interventions": 3,
+        "findings": 0,
+    }
+    interventions = Snapshot(tmp_path / "sample").read("interventions")
+    assert interventions["id"].tolist() == [1, 2, 3]
+    assert interventions["university.Comune"].tolist() == [None, None, "Lucca"]
+    assert interventions["building.Data"].tolist() == [
+        datetime.date(1985, 3, 18),
+        None,
+        None,
+    ]
+    assert interventions["university.Profondità falda"].tolist() == [
+        1,
+        2,
+        1.5,
+    ]
+    assert snapshot.read("interventions", ["id"]).columns.tolist() == ["id"]
+
+
+def test_interrupted_export_not_read(tmp_path):
+    """Test a failed export leaves no snapshot behind."""
+
+    def failing_chunks():
+        yield from _chunks()
+        raise ConnectionError("lost connection")
+
+    with pytest.raises(ConnectionError):
+        export_snapshot(
+            tmp_path / "sample", {"interventions": failing_chunks()}
+        )
+    assert not (tmp_path / "sample").exists()
+    # the next export starts again
+    export_snapshot(tmp_path / "sample", {"interventions": _chunks()})
+    assert len(Snapshot(tmp_path / "sample").read("interventions")) == 3
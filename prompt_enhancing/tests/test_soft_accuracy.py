@@ -0,0 +1,96 @@
+"""Test the batch scoring of the textual fields of the legacy evaluation."""
+
+import numpy as np
+from dspy import Example, Prediction
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.evaluation import (
+    compare,
+)
+from archaeo_super_prompt.modeling.struct_extract.legacy_extractor.evaluation.similarity_match import (
+    pair_similarities,
+    preprocess,
+)
+
+PREDICTIONS = [
+    "mura di Lucca",
+    "chiesa di Sant Ambrogio, in corrispondenza delle mura di Lucca",
+    "Roma",
+    "via del Corso 12, via del Corso",
+]
+REFERENCES = ["Lucca", "mura di Lucca", "ROMA!", "Via del Corso"]
+
+
+def _similarity_of_pair(prediction: str, reference: str) -> float:
+    """Compute the similarity with a vectorizer fitted on the pair only."""
+    texts = [preprocess(prediction), preprocess(reference)]
+    vectors = TfidfVectorizer().fit(texts).transform(texts)
+    return cosine_similarity(vectors[0], vectors[1])[0, 0]
+
+
+def test_pair_similarities_as_one_vectorizer_per_pair():
+    """Test the batch similarities equal those of a vectorizer per pair."""
+    expected = [
+        _similarity_of_pair(p, r) for p, r in zip(PREDICTIONS, REFERENCES)
+    ]
+    assert np.allclose(pair_similarities(PREDICTIONS, REFERENCES), expected)
+    # no word in a text
+    assert pair_similarities(["", "?"], ["a word", "?"]).tolist() == [0, 0]
+
+
+def test_devset_validation_as_per_record():
+    """Test the devset validation equals the validation of each record."""
+    fields = compare._worst_metric_values()
+    examples = [
+        Example(
+            **{field: None for field in fields}
+            | {
+                "university__Comune": reference,
+                "building__Istituzione": reference,
+            }
+        )
+        for reference in REFERENCES
+    ]
+    preds = [
+        Prediction(
+            **{field: None for field in fields}
+            | {"university__Comune": prediction}
+        )
+        for prediction in PREDICTIONS
+    ]
+    # an invalid prediction
+    preds[1] = Prediction(university__Comune=PREDICTIONS[1])
+    assert compare.validate_magoh_devset(examples, preds) == [
+        compare.validate_magoh_data(example, pred)
+        for example, pred in zip(examples, preds)
+    ]
+
+
+def test_date_validation_with_expected_as_gold():
+    """Test a prediction less precise than the expected date is rejected."""
+    fields = compare._worst_metric_values()
+    dates = [("1985-03-18", "1985"), ("1985", "1985-03-18")]
+    examples = [
+        Example(
+            **{field: None for field in fields}
+            | {"university__Data_intervento": expected}
+        )
+        for expected, _ in dates
+    ]
+    preds = [
+        Prediction(
+            **{field: None for field in fields}
+            | {"university__Data_intervento": predicted}
+        )
+        for _, predicted in dates
+    ]
+    results = compare.validate_magoh_devset(examples, preds)
+    assert [result["university__Data_intervento"] for result in results] == [
+        False,
+        True,
+    ]
+    assert results == [
+        compare.validate_magoh_data(example, pred)
+        for example, pred in zip(examples, preds)
+    ]
@@ -0,0 +1,41 @@
+"""Test the deterministic resolution of the intervention start date."""
+
+import datetime
+
+from archaeo_super_prompt.modeling.struct_extract.extractors.intervention_date.resolver import (
+    find_explicit_start_date,
+)
+
+_ARCHIVING = datetime.date(1990, 1, 1)
+
+
+def test_explicit_start_date():
+    """Test a unique stated start date is resolved."""
+    fragments = (
+        "Lo scavo è iniziato il 18 Marzo 1985 ed è terminato il 20 marzo."
+    )
+    assert find_explicit_start_date(fragments, _ARCHIVING) == datetime.date(
+        1985, 3, 18
+    )
+
+
+def test_ambiguous_start_date():
+    """Test nothing is resolved if the start is ambiguous or implausible."""
+    assert (
+        find_explicit_start_date("Relazione del 3 maggio 1985.", _ARCHIVING)
+        is None
+    )
+    assert (
+        find_explicit_start_date(
+            "I lavori sono iniziati il 2 maggio 1985. "
+            "Lo scavo è stato avviato il 10 giugno 1985.",
+            _ARCHIVING,
+        )
+        is None
+    )
+    assert (
+        find_explicit_start_date(
+            "Lo scavo è iniziato il 18 marzo 1995.", _ARCHIVING
+        )
+        is None
+    )
@@ -0,0 +1,60 @@
+"""Test the schema-constrained fast mode of the dspy programs."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+from dspy.utils import DummyLM
+
+from archaeo_super_prompt.modeling.struct_extract import structured_output
+from archaeo_super_prompt.modeling.struct_extract.dspy_threads import (
+    in_dspy_context,
+)
+from archaeo_super_prompt.modeling.struct_extract.extractors.comune import (
+    Comune,
+    FindComune,
+)
+
+
+def test_fast_mode_counts_retries():
+    """Test an unparsable answer is retried and counted."""
+    # the dummy lm wraps each answer with the headers of the chat adapter
+    lm = DummyLM(
+        [
+            {"risposta": "Lucca"},
+            {"risposta": '{"comune": "Lucca", "provincia": "Lucca"}'},
+        ]
+    )
+    program = FindComune(fast_mode=True)
+    assert isinstance(program._estrattore_di_comune, dspy.Predict)
+    before = structured_output.get_stats()
+    recorder = structured_output.StructuredOutputRecorder()
+    other_recorder = structured_output.StructuredOutputRecorder()
+    with (
+        dspy.settings.context(
+            lm=lm, adapter=structured_output.ConstrainedJSONAdapter()
+        ),
+        structured_output.recording(other_recorder),
+        structured_output.recording(recorder),
+    ):
+        # sent from another thread, as in an evaluation
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prediction = executor.submit(
+                in_dspy_context(program),
+                fragmenti_relazione="Lo scavo si è svolto a Lucca.",
+                possibili_comuni=[
+                    Comune(
+                        citta_nome="Lucca",
+                        provicia_nome="Lucca",
+                        provincia_sigla="LU",
+                    )
+                ],
+            ).result()
+    assert prediction.comune == "Lucca"
+    assert structured_output.get_stats_since(before) == (
+        structured_output.StructuredOutputStats(
+            requests=1, parse_failures=1, retries=1
+        )
+    )
+    # only the innermost recorder counts the requests
+    assert recorder.stats() == structured_output.get_stats_since(before)
+    assert other_recorder.stats() == (0, 0, 0)
@@ -0,0 +1,105 @@
+"""Test the spreading of the OCR over several vision-llm servers."""
+
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+from docling.datamodel.base_models import ConversionStatus
+
+from archaeo_super_prompt.modeling.pdf_to_text.vlm_pool import (
+    VlmConverterPool,
+)
+from archaeo_super_prompt.modeling.struct_extract.endpoint_router import (
+    EndpointRouter,
+)
+
+
+class _FakeConverter:
+    """A converter whose conversions succeed or fail as required."""
+
+    def __init__(
+        self, name: str, succeeds: bool, error: Exception | None = None
+    ):
+        self.name = name
+        self.succeeds = succeeds
+        self.error = error
+        self.page_ranges = []
+
+    def convert(self, source, *, page_range, raises_on_error):
+        source, raises_on_error = source, raises_on_error  # unused
+        self.page_ranges.append(page_range)
+        # the conversions of the pool overlap
+        time.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(
+            status=ConversionStatus.SUCCESS
+            if self.succeeds
+            else ConversionStatus.FAILURE,
+            document=(self.name, page_range),
+        )
+
+
+def _pool(*converters: _FakeConverter):
+    return VlmConverterPool(
+        {c.name: c for c in converters},
+        EndpointRouter([c.name for c in converters], probe=lambda _: True),
+    )
+
+
+def test_page_ranges_spread_in_order():
+    """Test the page ranges are converted over the servers, in order."""
+    a, b = _FakeConverter("a", True), _FakeConverter("b", True)
+    results = list(
+        _pool(a, b).convert_all(Path("x.pdf"), iter([(1, 2), (3, 4), (5, 6)]))
+    )
+    assert [r[1] for r in results] == [(1, 2), (3, 4), (5, 6)]
+    assert a.page_ranges and b.page_ranges
+
+
+def test_failed_page_range_retried_on_another_server():
+    """Test a failed conversion is retried once on another server."""
+    a, b = _FakeConverter("a", False), _FakeConverter("b", True)
+    pool = _pool(a, b)
+    assert pool.convert(Path("x.pdf"), (1, 2)) == ("b", (1, 2))
+    assert pool.convert(Path("x.pdf"), (3, 4)) is not None
+
+    b.succeeds = False
+    assert pool.convert(Path("x.pdf"), (5, 6)) is None
+    assert len(a.page_ranges) + len(b.page_ranges) <= 6
+
+
+def test_single_server_not_retried():
+    """Test a failed conversion is given up if there is no other server."""
+    a = _FakeConverter("a", False)
+    assert _pool(a).convert(Path("x.pdf"), (1, 2)) is None
+    assert a.page_ranges == [(1, 2)]
+
+
+def test_closed_pool_stops_its_threads():
+    """Test the pool does not convert anymore after its with block."""
+    a = _FakeConverter("a", True)
+    with _pool(a) as pool:
+        assert list(pool.convert_all(Path("x.pdf"), iter([(1, 2)])))
+    with pytest.raises(RuntimeError):
+        pool.convert_all(Path("x.pdf"), iter([(3, 4)]))
+
+
+def test_badly_scanned_pages_do_not_eject_the_servers():
+    """Test only the failures of a server count towards its ejection."""
+    a, b = _FakeConverter("a", False), _FakeConverter("b", False)
+    pool = _pool(a, b)
+    for i in range(4):
+        assert pool.convert(Path("corrupt.pdf"), (i, i)) is None
+    states = pool._router.states()
+    assert all(state.ejected_until is None for state in states.values())
+    assert len(a.page_ranges) == len(b.page_ranges) == 4
+
+    a.error = requests.ConnectionError("server down")
+    b.succeeds = True
+    for i in range(3):
+        assert pool.convert(Path("x.pdf"), (i, i)) == ("b", (i, i))
+    # the first server, tried first while it is not ejected, fails each time
+    assert pool._router.states()["a"].ejected_until is not None